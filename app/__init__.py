@@ -48,6 +48,17 @@ def create_app(config_name='development'):
         from app.modules.auth.models import User
         return User.query.get(int(user_id))
 
+    # View and download records are written in batches by the tracking buffer
+    from core.tracking.buffer import tracking_buffer
+    tracking_buffer.init_app(app)
+
+    # Keep the counters of the homepage and the dashboard, the unique visitor sketches and the
+    # popularity scores of the datasets up to date
+    from app.modules.stats.services import CounterService, ScoreService, SketchService
+    CounterService.listen()
+    SketchService.listen()
+    ScoreService.listen()
+
     # Set up logging
     logging_manager = LoggingManager(app)
     logging_manager.setup_logging()
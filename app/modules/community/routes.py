@@ -6,6 +6,7 @@ from app.modules.community.models import Community
 from app.modules.community.services import CommunityService
 from app.modules.dataset.models import DataSet
 from app.modules.dataset.services import DataSetService
+from app.modules.explore.cache import explore_cache
 from app import db
 
 community_service = CommunityService()
@@ -173,6 +174,7 @@ def add_dataset_to_community(community_id, dataset_id):
     # Assuming community has a method to add datasets
     community.datasets.append(dataset)  # This assumes dataset is an object that can be appended
     db.session.commit()
+    explore_cache.clear()
 
     return redirect(url_for('community.index'))
 
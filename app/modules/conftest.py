@@ -1,4 +1,7 @@
+from contextlib import contextmanager
+
 import pytest
+from sqlalchemy import event
 
 from app import create_app, db
 from app.modules.auth.models import User
@@ -82,3 +85,23 @@ def logout(test_client):
         response: Response to GET request to log out.
     """
     return test_client.get('/logout', follow_redirects=True)
+
+
+@contextmanager
+def count_queries():
+    """
+    Records the SQL statements executed while the block runs.
+
+    Returns:
+        list: The executed statements, filled in as they are sent to the database.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
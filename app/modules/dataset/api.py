@@ -1,4 +1,5 @@
 from app.modules.dataset.models import DataSet
+from app.modules.dataset.repositories import serialization_load_options
 from core.resources.generic_resource import create_resource
 from core.serialisers.serializer import Serializer
 
@@ -19,7 +20,7 @@ dataset_fields = {
 
 dataset_serializer = Serializer(dataset_fields, related_serializers={'files': file_serializer})
 
-DataSetResource = create_resource(DataSet, dataset_serializer)
+DataSetResource = create_resource(DataSet, dataset_serializer, query_options=serialization_load_options)
 
 
 def init_blueprint_api(api):
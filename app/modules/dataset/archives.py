@@ -0,0 +1,339 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Bump it when the layout of the archives changes, so that the cached ones are not served anymore
+ARCHIVE_FORMAT_VERSION = 1
+
+
+class ZipStreamBuffer:
+    """
+    Write-only, non seekable file object for ZipFile. Whatever the archive writes is kept until
+    the next `drain()`, so the ZIP can be sent while it is being built. As the buffer cannot seek,
+    ZipFile writes the sizes and CRC of each member in a data descriptor after its data.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def dataset_folder(dataset) -> str:
+    working_dir = os.getenv('WORKING_DIR', '')
+    return os.path.join(working_dir, 'uploads', f'user_{dataset.user_id}', f'dataset_{dataset.id}')
+
+
+def dataset_archive_entries(dataset) -> list:
+    """(path, name in the archive) of every file in the folder of the dataset, in a stable order."""
+    folder = dataset_folder(dataset)
+    entries = []
+    for subdir, dirs, files in os.walk(folder):
+        dirs.sort()
+        for file in sorted(files):
+            full_path = os.path.join(subdir, file)
+            entries.append((full_path, os.path.join(f'dataset_{dataset.id}', os.path.relpath(full_path, folder))))
+    return entries
+
+
+def stream_zip(entries, chunk_size: int = CHUNK_SIZE):
+    """
+    Generator with the bytes of a ZIP archive of the given (path, arcname) entries.
+    Files are read and compressed chunk by chunk and nothing is written to disk, so the first
+    bytes are sent straight away and memory does not depend on the size of the files.
+    """
+    buffer = ZipStreamBuffer()
+    with ZipFile(buffer, 'w', compression=ZIP_DEFLATED) as zipf:
+        for path, arcname in entries:
+            info = ZipInfo.from_file(path, arcname)
+            info.compress_type = ZIP_DEFLATED
+            with open(path, 'rb') as source, zipf.open(info, 'w') as target:
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    target.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            yield buffer.drain()
+    # Central directory, written when the archive is closed
+    yield buffer.drain()
+
+
+class ArchiveCache:
+    """
+    Prebuilt dataset archives stored on disk, named after a digest of the checksums of the files of the dataset.
+    When a file changes its checksum changes too, so the outdated archive is never looked up again and ends up
+    evicted. The cache is bounded by `max_bytes`, evicting the least recently used archives. The modification
+    time of each archive is its last use, which keeps the LRU order shared by every worker.
+    """
+
+    PARTIAL_MAX_AGE = 3600
+
+    def __init__(self, directory, max_bytes: int):
+        self._directory = directory
+        self.max_bytes = max_bytes
+
+    @property
+    def directory(self) -> str:
+        # Resolved on use, as WORKING_DIR may be loaded from .env after this module is imported
+        return self._directory or os.path.join(os.getenv('WORKING_DIR', ''), 'uploads', '.archive_cache')
+
+    @staticmethod
+    def key(dataset) -> str:
+        digest = hashlib.sha256(f"{ARCHIVE_FORMAT_VERSION}:{dataset.id}".encode())
+        for name, checksum in sorted((hubfile.name, hubfile.checksum) for hubfile in dataset.files()):
+            digest.update(f"\n{name}:{checksum}".encode())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.zip")
+
+    def get(self, key: str):
+        """Path of the cached archive, or None. A hit makes it the most recently used one."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def tee(self, key: str, stream):
+        """
+        Passes the chunks of an archive that is being sent through, storing a copy of them.
+        The copy only becomes visible once the archive is complete. If the client goes away or
+        the disk fails, the download goes on (or stops) as usual and the copy is discarded.
+        """
+        partial = f"{self.path(key)}.{uuid.uuid4().hex}.partial"
+        cache_file = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            cache_file = open(partial, "wb")
+        except OSError as exc:
+            logger.warning(f"Archive {key} will not be cached: {exc}")
+
+        try:
+            for chunk in stream:
+                if cache_file is not None:
+                    try:
+                        cache_file.write(chunk)
+                    except OSError as exc:
+                        logger.warning(f"Archive {key} will not be cached: {exc}")
+                        cache_file.close()
+                        cache_file = None
+                yield chunk
+
+            if cache_file is not None:
+                cache_file.close()
+                os.replace(partial, self.path(key))
+                cache_file = None
+                self.evict()
+        finally:
+            if cache_file is not None:
+                cache_file.close()
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def evict(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+
+        archives = []
+        now = time.time()
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith(".zip"):
+                archives.append((stat.st_mtime, stat.st_size, path))
+            elif name.endswith(".partial") and now - stat.st_mtime > self.PARTIAL_MAX_AGE:
+                # Left behind by a worker that died while building the archive
+                self._remove(path)
+
+        total = sum(size for _, size, _ in archives)
+        for _, size, path in sorted(archives):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+archive_cache = ArchiveCache(
+    directory=os.getenv('ARCHIVE_CACHE_DIR'),
+    max_bytes=int(os.getenv('ARCHIVE_CACHE_MAX_BYTES', 1024 * 1024 * 1024)),
+)
+
+
+class DatasetSnapshot:
+    """
+    ZIP with the files of every published dataset, kept up to date in the background.
+    A manifest next to it records which datasets it contains (with their archive key), its size and when it
+    was built. Writing the manifest is the commit point of every update: readers only trust an archive of
+    the size it records.
+
+    New datasets are appended in place, after the end of the current archive: its bytes are left untouched,
+    so downloads in progress keep reading a complete ZIP, and its central directory becomes unused space.
+    It is rebuilt from scratch (in a new file that then replaces it) when a dataset already in it changes
+    its files or is no longer published, as ZIP members cannot be removed, or when that unused space
+    grows beyond MAX_UNUSED_RATIO of the archive.
+    """
+
+    ARCHIVE_NAME = "allDatasets.zip"
+    MANIFEST_NAME = "allDatasets.json"
+    MAX_UNUSED_RATIO = 0.1
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    @property
+    def directory(self) -> str:
+        return self._directory or os.path.join(os.getenv('WORKING_DIR', ''), 'uploads', '.snapshot')
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self.ARCHIVE_NAME)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, self.MANIFEST_NAME)
+
+    def read_manifest(self):
+        """The manifest of the current snapshot, or None if there is none (or it does not match the archive)."""
+        try:
+            with open(self.manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get("size") != os.path.getsize(self.path):
+                return None
+        except (OSError, ValueError):
+            return None
+        return manifest
+
+    def built_at(self):
+        manifest = self.read_manifest()
+        return manifest["built_at"] if manifest else None
+
+    @staticmethod
+    def etag(manifest) -> str:
+        # Every update writes a new manifest, so its build time and size identify the archive
+        return hashlib.sha256(f"{manifest['built_at']}:{manifest['size']}".encode()).hexdigest()
+
+    def update(self, datasets) -> bool:
+        """Brings the snapshot up to date with the given published datasets. Returns whether it changed."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "snapshot.lock"), "w") as lock:
+            # A single builder at a time across workers, the next one finds the work already done
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._update(datasets)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _update(self, datasets) -> bool:
+        keys = {str(dataset.id): ArchiveCache.key(dataset) for dataset in datasets}
+        manifest = self._recover()
+
+        contained = manifest["datasets"] if manifest else {}
+        if manifest and all(keys.get(dataset_id) == key for dataset_id, key in contained.items()):
+            members = [dataset for dataset in datasets if str(dataset.id) not in contained]
+            if not members:
+                return False
+            append = manifest.get("unused", 0) <= self.MAX_UNUSED_RATIO * manifest["size"]
+        else:
+            members = datasets
+            append = False
+
+        unused = self._append(members, manifest) if append else self._rebuild(members)
+        self._write_manifest(keys, unused)
+        logger.info(f"Dataset snapshot updated with {len(members)} datasets ({'append' if append else 'rebuild'})")
+        return True
+
+    def _recover(self):
+        """
+        The manifest of the last committed update. An append interrupted before writing its manifest leaves
+        bytes after the archive that manifest describes, they are cut off.
+        """
+        try:
+            with open(self.manifest_path) as manifest_file:
+                size = json.load(manifest_file)["size"]
+            if os.path.getsize(self.path) > size:
+                os.truncate(self.path, size)
+        except (OSError, ValueError, KeyError):
+            return None
+        return self.read_manifest()
+
+    def _append(self, members, manifest) -> int:
+        """Appends the files of the members to the current archive. Returns its unused space afterwards."""
+        with ZipFile(self.path, "a", compression=ZIP_DEFLATED) as zipf:
+            central_directory = manifest["size"] - zipf.start_dir
+            # ZipFile writes over the current central directory, start after it instead
+            zipf.start_dir = manifest["size"]
+            for dataset in members:
+                for path, arcname in dataset_archive_entries(dataset):
+                    zipf.write(path, arcname=arcname)
+
+        unused = manifest.get("unused", 0)
+        if os.path.getsize(self.path) > manifest["size"]:
+            unused += central_directory
+        return unused
+
+    def _rebuild(self, members) -> int:
+        """Builds the archive with the files of the members in a new file, which replaces the current one."""
+        partial = f"{self.path}.{uuid.uuid4().hex}.partial"
+        try:
+            with ZipFile(partial, "w", compression=ZIP_DEFLATED) as zipf:
+                for dataset in members:
+                    for path, arcname in dataset_archive_entries(dataset):
+                        zipf.write(path, arcname=arcname)
+            # The current manifest does not describe the new archive, not even its first bytes
+            try:
+                os.remove(self.manifest_path)
+            except FileNotFoundError:
+                pass
+            os.replace(partial, self.path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return 0
+
+    def _write_manifest(self, keys, unused: int):
+        manifest = {
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "size": os.path.getsize(self.path),
+            "unused": unused,
+            "datasets": keys,
+        }
+        with open(f"{self.manifest_path}.partial", "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(f"{self.manifest_path}.partial", self.manifest_path)
+
+
+dataset_snapshot = DatasetSnapshot(directory=os.getenv('DATASET_SNAPSHOT_DIR'))
@@ -5,6 +5,8 @@ from flask import request
 from sqlalchemy import Enum as SQLAlchemyEnum
 
 from app import db
+from app.modules.explore.cache import explore_cache
+from app.modules.explore.search import split_tags, tag_key
 
 
 class PublicationType(Enum):
@@ -54,6 +56,41 @@ class DSMetrics(db.Model):
         return f'DSMetrics<models={self.number_of_models}, features={self.number_of_features}>'
 
 
+# The primary key starts with tag_id, so listing the datasets of a tag is an index range scan
+ds_meta_data_tag = db.Table(
+    'ds_meta_data_tag',
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('ds_meta_data_id', db.Integer, db.ForeignKey('ds_meta_data.id', ondelete='CASCADE'),
+              primary_key=True, index=True),
+)
+
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Display name as it was first entered, and the normalized key the tag is matched by
+    name = db.Column(db.String(64), nullable=False)
+    key = db.Column(db.String(64), nullable=False, unique=True)
+
+    @staticmethod
+    def from_string(tags) -> list:
+        """Returns the Tag of each comma separated name, reusing the existing ones with the same key."""
+        names = {}
+        for name in split_tags(tags):
+            if tag_key(name):
+                names.setdefault(tag_key(name), name)
+        if not names:
+            return []
+        with db.session.no_autoflush:
+            existing = {tag.key: tag for tag in Tag.query.filter(Tag.key.in_(names)).all()}
+            for tag in db.session.new:
+                if isinstance(tag, Tag) and tag.key in names:
+                    existing.setdefault(tag.key, tag)
+        return [existing.get(key) or Tag(name=name, key=key) for key, name in names.items()]
+
+    def __repr__(self):
+        return f'Tag<{self.name}>'
+
+
 class DSMetaData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     deposition_id = db.Column(db.Integer)
@@ -61,11 +98,21 @@ class DSMetaData(db.Model):
     description = db.Column(db.Text, nullable=False)
     publication_type = db.Column(SQLAlchemyEnum(PublicationType), nullable=False)
     publication_doi = db.Column(db.String(120))
-    dataset_doi = db.Column(db.String(120))
-    tags = db.Column(db.String(120))
+    # The previous value is kept in the history even if it was not loaded, to count the synchronized datasets
+    dataset_doi = db.column_property(db.Column(db.String(120)), active_history=True)
     ds_metrics_id = db.Column(db.Integer, db.ForeignKey('ds_metrics.id'))
     ds_metrics = db.relationship('DSMetrics', uselist=False, backref='ds_meta_data', cascade="all, delete")
     authors = db.relationship('Author', backref='ds_meta_data', lazy=True, cascade="all, delete")
+    tag_list = db.relationship('Tag', secondary=ds_meta_data_tag, order_by='Tag.key', lazy=True)
+
+    # Forms, seeders and the Zenodo API keep working with the comma separated string
+    @property
+    def tags(self) -> str:
+        return ', '.join(tag.name for tag in self.tag_list)
+
+    @tags.setter
+    def tags(self, value):
+        self.tag_list = Tag.from_string(value)
 
 
 class DataSet(db.Model):
@@ -81,10 +128,29 @@ class DataSet(db.Model):
     # Un dataset puede o no formar parte de una comunidad
     community_id = db.Column(db.Integer, db.ForeignKey('community.id'), nullable=True)
 
+    # Suma y número de valoraciones, mantenidos por RatingService al valorar
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Puntuaciones por las que se puede ordenar explore, mantenidas al registrar descargas, vistas
+    # y valoraciones (ver ScoreService). Cada una tiene su índice con el id para paginar por cursor
+    download_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    view_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_score = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    trending_score = db.Column(db.Float, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_data_set_download_count', 'download_count', 'id'),
+        db.Index('ix_data_set_view_count', 'view_count', 'id'),
+        db.Index('ix_data_set_rating_score', 'rating_score', 'id'),
+        db.Index('ix_data_set_trending_score', 'trending_score', 'id'),
+    )
+
     # Asigna el dataset a una comunidad
     def assign_to_community(self, community):
         self.community_id = community.id
         db.session.commit()
+        explore_cache.clear()
 
     def name(self):
         return self.ds_meta_data.title
@@ -120,7 +186,7 @@ class DataSet(db.Model):
 
     def get_uvlhub_doi(self):
         from app.modules.dataset.services import DataSetService
-        return DataSetService().get_uvlhub_doi(self)
+        return DataSetService.get_uvlhub_doi(self)
 
     def to_dict(self):
         return {
@@ -133,7 +199,7 @@ class DataSet(db.Model):
             'publication_type': self.get_cleaned_publication_type(),
             'publication_doi': self.ds_meta_data.publication_doi,
             'dataset_doi': self.ds_meta_data.dataset_doi,
-            'tags': self.ds_meta_data.tags.split(",") if self.ds_meta_data.tags else [],
+            'tags': [tag.name for tag in self.ds_meta_data.tag_list],
             'url': self.get_uvlhub_doi(),
             'download': f'{request.host_url.rstrip("/")}/dataset/download/{self.id}',
             'zenodo': self.get_fakenodo_url(),
@@ -148,10 +214,16 @@ class DataSet(db.Model):
 
 
 class DSDownloadRecord(db.Model):
+    # Una descarga por usuario (o anónimo), dataset y cookie, garantizado por la base de datos
+    __table_args__ = (
+        db.UniqueConstraint('dataset_id', 'user_key', 'download_cookie', name='uq_ds_download_record_key'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    user_key = db.Column(db.Integer, db.Computed('coalesce(user_id, 0)', persisted=True))
     dataset_id = db.Column(db.Integer, db.ForeignKey('data_set.id'))
-    download_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    download_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     download_cookie = db.Column(db.String(36), nullable=False)  # Assuming UUID4 strings
 
     def __repr__(self):
@@ -164,10 +236,15 @@ class DSDownloadRecord(db.Model):
 
 
 class DSViewRecord(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('dataset_id', 'user_key', 'view_cookie', name='uq_ds_view_record_key'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    user_key = db.Column(db.Integer, db.Computed('coalesce(user_id, 0)', persisted=True))
     dataset_id = db.Column(db.Integer, db.ForeignKey('data_set.id'))
-    view_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    view_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     view_cookie = db.Column(db.String(36), nullable=False)  # Assuming UUID4 strings
 
     def __repr__(self):
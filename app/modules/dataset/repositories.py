@@ -1,9 +1,8 @@
-from datetime import datetime, timezone
 import logging
-from flask_login import current_user
 from typing import Optional
 
-from sqlalchemy import desc, func
+from sqlalchemy import desc
+from sqlalchemy.orm import selectinload
 
 from app.modules.dataset.models import (
     Author,
@@ -11,25 +10,49 @@ from app.modules.dataset.models import (
     DSDownloadRecord,
     DSMetaData,
     DSViewRecord,
-    DataSet
+    DataSet,
+    Tag,
+    ds_meta_data_tag
 )
+from app.modules.featuremodel.models import FeatureModel
 from core.repositories.BaseRepository import BaseRepository
 
 logger = logging.getLogger(__name__)
 
 
+def serialization_load_options():
+    """Loader options that fetch everything DataSet.to_dict() touches in a constant number of queries."""
+    return [
+        selectinload(DataSet.ds_meta_data).selectinload(DSMetaData.authors),
+        selectinload(DataSet.ds_meta_data).selectinload(DSMetaData.tag_list),
+        selectinload(DataSet.feature_models).selectinload(FeatureModel.files),
+    ]
+
+
 class AuthorRepository(BaseRepository):
     def __init__(self):
         super().__init__(Author)
 
 
+class TagRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(Tag)
+
+    def ds_meta_data_ids(self, key: str):
+        """Subquery with the ids of the dataset metadata tagged exactly with the given normalized key."""
+        return (
+            self.session.query(ds_meta_data_tag.c.ds_meta_data_id)
+            .join(Tag, Tag.id == ds_meta_data_tag.c.tag_id)
+            .filter(Tag.key == key)
+        )
+
+
 class DSDownloadRecordRepository(BaseRepository):
     def __init__(self):
         super().__init__(DSDownloadRecord)
 
     def total_dataset_downloads(self) -> int:
-        max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
-        return max_id if max_id is not None else 0
+        return self.model.query.count()
 
 
 class DSMetaDataRepository(BaseRepository):
@@ -45,29 +68,18 @@ class DSViewRecordRepository(BaseRepository):
         super().__init__(DSViewRecord)
 
     def total_dataset_views(self) -> int:
-        max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
-        return max_id if max_id is not None else 0
-
-    def the_record_exists(self, dataset: DataSet, user_cookie: str):
-        return self.model.query.filter_by(
-            user_id=current_user.id if current_user.is_authenticated else None,
-            dataset_id=dataset.id,
-            view_cookie=user_cookie
-        ).first()
-
-    def create_new_record(self, dataset: DataSet, user_cookie: str) -> DSViewRecord:
-        return self.create(
-                user_id=current_user.id if current_user.is_authenticated else None,
-                dataset_id=dataset.id,
-                view_date=datetime.now(timezone.utc),
-                view_cookie=user_cookie,
-            )
+        return self.model.query.count()
 
 
 class DataSetRepository(BaseRepository):
     def __init__(self):
         super().__init__(DataSet)
 
+    def load_related(self, dataset_ids) -> list:
+        if not dataset_ids:
+            return []
+        return self.model.query.options(*serialization_load_options()).filter(DataSet.id.in_(dataset_ids)).all()
+
     def get_synchronized(self, current_user_id: int) -> DataSet:
         return (
             self.model.query.join(DSMetaData)
@@ -2,27 +2,23 @@ import logging
 import os
 import re
 import shutil
-import tempfile
 import uuid
-from datetime import datetime, timezone
-from zipfile import ZipFile
 
 from flask import (
+    Response,
     redirect,
     render_template,
     request,
     jsonify,
-    send_from_directory,
     make_response,
     abort,
     url_for,
 )
 from flask_login import login_required, current_user
 
+from app.modules.dataset.archives import archive_cache, dataset_archive_entries, dataset_snapshot, stream_zip
 from app.modules.dataset.forms import DataSetForm
-from app.modules.dataset.models import (
-    DSDownloadRecord
-)
+from app.modules.dataset.uploads import remove_upload, save_upload
 from app.modules.dataset import dataset_bp
 from app.modules.dataset.services import (
     AuthorService,
@@ -31,11 +27,13 @@ from app.modules.dataset.services import (
     DSViewRecordService,
     DataSetService,
     DOIMappingService,
-    RatingService
+    RatingService,
+    SnapshotService
 )
 
 from app.modules.fakenodo.services import DepositionService
 from core.configuration.configuration import USE_FAKENODO
+from core.delivery.accel import send_upload
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +44,7 @@ dsmetadata_service = DSMetaDataService()
 fakenodo_service = DepositionService()
 doi_mapping_service = DOIMappingService()
 ds_view_record_service = DSViewRecordService()
+snapshot_service = SnapshotService()
 
 
 @dataset_bp.route("/dataset/upload", methods=["GET", "POST"])
@@ -154,7 +153,8 @@ def upload():
         new_filename = file.filename
 
     try:
-        file.save(file_path)
+        # Checksum and size are computed while the file is written, in chunks
+        save_upload(file.stream, file_path)
     except Exception as e:
         return jsonify({"message": str(e)}), 500
 
@@ -176,8 +176,7 @@ def delete():
     temp_folder = current_user.temp_folder()
     filepath = os.path.join(temp_folder, filename)
 
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    if remove_upload(filepath):
         return jsonify({"message": "File deleted successfully"})
 
     return jsonify({"error": "Error: File not found"})
@@ -187,24 +186,25 @@ def delete():
 def download_dataset(dataset_id):
     dataset = dataset_service.get_or_404(dataset_id)
 
-    file_path = f"uploads/user_{dataset.user_id}/dataset_{dataset.id}/"
-
-    temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, f"dataset_{dataset_id}.zip")
-
-    with ZipFile(zip_path, "w") as zipf:
-        for subdir, dirs, files in os.walk(file_path):
-            for file in files:
-                full_path = os.path.join(subdir, file)
-
-                relative_path = os.path.relpath(full_path, file_path)
-
-                zipf.write(
-                    full_path,
-                    arcname=os.path.join(
-                        os.path.basename(zip_path[:-4]), relative_path
-                    ),
-                )
+    # Repeated downloads are served from the archive cache. Otherwise the archive is built
+    # while it is being sent, without temporary files, and stored in the cache on the way.
+    # The archive key (a digest of the file checksums) is the strong ETag of the archive,
+    # except for a cached archive sent by nginx, which carries the ETag of nginx
+    archive_key = archive_cache.key(dataset)
+    cached_archive = archive_cache.get(archive_key)
+    if request.if_none_match.contains(archive_key):
+        resp = Response(status=304)
+        resp.set_etag(archive_key)
+    elif cached_archive:
+        resp = send_upload(cached_archive, f"dataset_{dataset_id}.zip", mimetype="application/zip", etag=archive_key)
+    else:
+        # Ranges are only served from the cached archive, a resumed download gets it once this one completes
+        resp = Response(
+            archive_cache.tee(archive_key, stream_zip(dataset_archive_entries(dataset))),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f"attachment; filename=dataset_{dataset_id}.zip", "Accept-Ranges": "none"},
+        )
+        resp.set_etag(archive_key)
 
     user_cookie = request.cookies.get("download_cookie")
     if not user_cookie:
@@ -212,38 +212,11 @@ def download_dataset(dataset_id):
             uuid.uuid4()
         )  # Generate a new unique identifier if it does not exist
         # Save the cookie to the user's browser
-        resp = make_response(
-            send_from_directory(
-                temp_dir,
-                f"dataset_{dataset_id}.zip",
-                as_attachment=True,
-                mimetype="application/zip",
-            )
-        )
         resp.set_cookie("download_cookie", user_cookie)
-    else:
-        resp = send_from_directory(
-            temp_dir,
-            f"dataset_{dataset_id}.zip",
-            as_attachment=True,
-            mimetype="application/zip",
-        )
 
-    # Check if the download record already exists for this cookie
-    existing_record = DSDownloadRecord.query.filter_by(
-        user_id=current_user.id if current_user.is_authenticated else None,
-        dataset_id=dataset_id,
-        download_cookie=user_cookie
-    ).first()
-
-    if not existing_record:
-        # Record the download in your database
-        DSDownloadRecordService().create(
-            user_id=current_user.id if current_user.is_authenticated else None,
-            dataset_id=dataset_id,
-            download_date=datetime.now(timezone.utc),
-            download_cookie=user_cookie,
-        )
+    # A revalidation of a copy the client already has is not a new download
+    if resp.status_code != 304:
+        DSDownloadRecordService().track(dataset_id, user_cookie)
 
     return resp
 
@@ -270,9 +243,10 @@ def subdomain_index(doi):
     # Calcula el promedio de valoraciones del dataset
     average_rating = RatingService.get_average_rating(dataset.id)
     # Asegúrate de que `get_average_rating` esté bien implementado
-    # Calcula y asigna la media de valoración para cada modelo
+    # Calcula y asigna la media de valoración para cada modelo, todas en una consulta
+    model_ratings = RatingService.get_average_model_ratings(model.id for model in dataset.feature_models)
     for model in dataset.feature_models:
-        model.average_rating = RatingService.get_average_model_rating(model.id)
+        model.average_rating = model_ratings[model.id]
     # Renderiza la plantilla pasando los valores calculados
     user_cookie = ds_view_record_service.create_cookie(dataset=dataset)
     resp = make_response(render_template("dataset/view_dataset.html", dataset=dataset, average_rating=average_rating))
@@ -285,52 +259,26 @@ def subdomain_index(doi):
 def download_all_datasets():
     try:
 
-        datasets = dataset_service.download_all_datasets()
-
-        if not datasets:
+        if not dataset_service.count_synchronized_datasets():
             return jsonify({"error": "No datasets found."}), 404
 
-        temp_dir = create_temp_dir()
-        zip_path = os.path.join(temp_dir, "allDatasets.zip")
-
-        # Crear el archivo ZIP
-        create_zip_of_datasets(datasets, zip_path)
-
-        # Enviar el archivo ZIP
-        return send_from_directory(
-            temp_dir,
-            "allDatasets.zip",
-            as_attachment=True,
-            mimetype="application/zip"
+        # El snapshot se mantiene en segundo plano, aquí solo se sirve el último construido
+        manifest = dataset_snapshot.read_manifest()
+        if manifest is None:
+            snapshot_service.schedule_update()
+            manifest = dataset_snapshot.read_manifest()
+            if manifest is None:
+                resp = jsonify({"error": "The archive with all the datasets is being built, try again later."})
+                resp.headers["Retry-After"] = "60"
+                return resp, 503
+
+        resp = send_upload(
+            dataset_snapshot.path, "allDatasets.zip", mimetype="application/zip", etag=dataset_snapshot.etag(manifest)
         )
+        resp.headers["X-Snapshot-Built-At"] = manifest["built_at"]
+        return resp
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-
-        if 'temp_dir' in locals():
-            shutil.rmtree(temp_dir)
-
-
-def create_temp_dir():
-    # Crea un directorio temporal
-    return tempfile.mkdtemp()
-
-
-def create_zip_of_datasets(datasets, zip_path):
-    # Creamos el Zip
-    with ZipFile(zip_path, "w") as zipf:
-        for dataset in datasets:
-            file_path = f"uploads/user_{dataset.user_id}/dataset_{dataset.id}/"
-
-            if not os.path.exists(file_path):
-                continue
-
-            for subdir, dirs, files in os.walk(file_path):
-                for file in files:
-                    full_path = os.path.join(subdir, file)
-                    relative_path = os.path.relpath(full_path, file_path)
-                    arcname = os.path.join(f"dataset_{dataset.id}", relative_path)
-                    zipf.write(full_path, arcname=arcname)
 
 
 @dataset_bp.route("/dataset/unsynchronized/<int:dataset_id>/", methods=["GET"])
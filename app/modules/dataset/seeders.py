@@ -1,7 +1,8 @@
 import os
-import shutil
 from app.modules.auth.models import User
+from app.modules.explore.services import SearchIndexService, UVLFeatureIndexService
 from app.modules.featuremodel.models import FMMetaData, FeatureModel
+from app.modules.hubfile.blobs import blob_store
 from app.modules.hubfile.models import Hubfile
 from core.seeders.BaseSeeder import BaseSeeder
 from app.modules.dataset.models import (
@@ -66,6 +67,11 @@ class DataSetSeeder(BaseSeeder):
         ]
         seeded_datasets = self.seed(datasets)
 
+        # Index the seeded datasets so that they can be found from explore
+        search_index_service = SearchIndexService()
+        for dataset in seeded_datasets:
+            search_index_service.index_dataset(dataset)
+
         # Assume there are 12 UVL files, create corresponding FMMetaData and FeatureModel
         fm_meta_data_list = [
             FMMetaData(
@@ -110,15 +116,19 @@ class DataSetSeeder(BaseSeeder):
             user_id = dataset.user_id
 
             dest_folder = os.path.join(working_dir, 'uploads', f'user_{user_id}', f'dataset_{dataset.id}')
-            os.makedirs(dest_folder, exist_ok=True)
-            shutil.copy(os.path.join(src_folder, file_name), dest_folder)
-
             file_path = os.path.join(dest_folder, file_name)
+            blob = blob_store.store(os.path.join(src_folder, file_name), file_path)
 
             uvl_file = Hubfile(
                 name=file_name,
                 checksum=f'checksum{i+1}',
                 size=os.path.getsize(file_path),
+                blob=blob,
                 feature_model_id=feature_model.id
             )
             self.seed([uvl_file])
+
+        # Index the features of the copied UVL files
+        uvl_feature_index_service = UVLFeatureIndexService()
+        for dataset in seeded_datasets:
+            uvl_feature_index_service.index_dataset_files(dataset)
@@ -1,16 +1,20 @@
 import logging
 import os
-import hashlib
-import shutil
+import threading
+from datetime import datetime, timezone
 from typing import Optional
 import uuid
 
+from sqlalchemy import select, update
+
 from app import db
-from flask import request
+from flask import current_app, request
+from flask_login import current_user
 
-from app.modules.featuremodel.models import ModelRating
+from app.modules.featuremodel.models import FeatureModel, ModelRating
 from app.modules.auth.services import AuthenticationService
-from app.modules.dataset.models import DSViewRecord, DataSet, DSMetaData, Rating
+from app.modules.dataset.archives import dataset_snapshot
+from app.modules.dataset.models import DSDownloadRecord, DSViewRecord, DataSet, DSMetaData, Rating
 from app.modules.dataset.repositories import (
     AuthorRepository,
     DOIMappingRepository,
@@ -19,23 +23,26 @@ from app.modules.dataset.repositories import (
     DSViewRecordRepository,
     DataSetRepository
 )
+from app.modules.dataset.uploads import upload_metadata
+from app.modules.explore.cache import explore_cache
+from app.modules.explore.services import SearchIndexService, UVLFeatureIndexService
 from app.modules.featuremodel.repositories import FMMetaDataRepository, FeatureModelRepository
+from app.modules.hubfile.blobs import blob_store
 from app.modules.hubfile.repositories import (
     HubfileDownloadRecordRepository,
     HubfileRepository,
     HubfileViewRecordRepository
 )
 from core.services.BaseService import BaseService
+from core.tracking.buffer import tracking_buffer
 
 logger = logging.getLogger(__name__)
 
 
 def calculate_checksum_and_size(file_path):
-    file_size = os.path.getsize(file_path)
-    with open(file_path, "rb") as file:
-        content = file.read()
-        hash_md5 = hashlib.md5(content).hexdigest()
-        return hash_md5, file_size
+    # Computed while the file was uploaded, or in chunks if the upload has no metadata
+    metadata = upload_metadata(file_path)
+    return metadata["checksum"], metadata["size"]
 
 
 class DataSetService(BaseService):
@@ -50,6 +57,8 @@ class DataSetService(BaseService):
         self.hubfilerepository = HubfileRepository()
         self.dsviewrecord_repostory = DSViewRecordRepository()
         self.hubfileviewrecord_repository = HubfileViewRecordRepository()
+        self.search_index_service = SearchIndexService()
+        self.uvl_feature_index_service = UVLFeatureIndexService()
 
     def move_feature_models(self, dataset: DataSet):
         current_user = AuthenticationService().get_authenticated_user()
@@ -60,9 +69,19 @@ class DataSetService(BaseService):
 
         os.makedirs(dest_dir, exist_ok=True)
 
+        # Each file is moved into the blob store and linked from the folder of the dataset
         for feature_model in dataset.feature_models:
             uvl_filename = feature_model.fm_meta_data.uvl_filename
-            shutil.move(os.path.join(source_dir, uvl_filename), dest_dir)
+            source = os.path.join(source_dir, uvl_filename)
+            blob = blob_store.store(
+                source, os.path.join(dest_dir, uvl_filename), move=True, digest=upload_metadata(source)["sha256"]
+            )
+            for hubfile in feature_model.files:
+                hubfile.blob = blob
+        self.repository.session.commit()
+
+        # The files are parsed once, now that they are at their final location
+        self.uvl_feature_index_service.index_dataset_files(dataset)
 
     def get_synchronized(self, current_user_id: int) -> DataSet:
         return self.repository.get_synchronized(current_user_id)
@@ -128,7 +147,9 @@ class DataSetService(BaseService):
                     commit=False, name=uvl_filename, checksum=checksum, size=size, feature_model_id=fm.id
                 )
                 fm.files.append(file)
+            self.search_index_service.index_dataset(dataset, commit=False)
             self.repository.session.commit()
+            explore_cache.clear()
         except Exception as exc:
             logger.info(f"Exception creating dataset from form...: {exc}")
             self.repository.session.rollback()
@@ -136,12 +157,26 @@ class DataSetService(BaseService):
         return dataset
 
     def update_dsmetadata(self, id, **kwargs):
-        return self.dsmetadata_repository.update(id, **kwargs)
+        dsmetadata = self.dsmetadata_repository.update(id, **kwargs)
+        if dsmetadata and dsmetadata.data_set:
+            self.search_index_service.index_dataset(dsmetadata.data_set)
+            if kwargs.get("dataset_doi"):
+                SnapshotService().schedule_update()
+        return dsmetadata
 
-    def get_uvlhub_doi(self, dataset: DataSet) -> str:
+    @staticmethod
+    def get_uvlhub_doi(dataset: DataSet) -> str:
         domain = os.getenv('DOMAIN', 'localhost')
         return f'http://{domain}/doi/{dataset.ds_meta_data.dataset_doi}'
 
+    def serialize(self, datasets) -> list:
+        """
+        Same output as calling to_dict() on each dataset, but the related rows of all of them
+        (metadata, authors, feature models and files) are batch loaded first.
+        """
+        self.repository.load_related([dataset.id for dataset in datasets])
+        return [dataset.to_dict() for dataset in datasets]
+
     def download_all_datasets(self):
         return self.repository.download_all_datasets()
 
@@ -155,6 +190,8 @@ class DataSetService(BaseService):
         if dataset:
             dataset.ds_meta_data.dataset_doi = self.generate_doi_for_dataset(dataset)
             self.repository.session.commit()
+            explore_cache.clear()
+            SnapshotService().schedule_update()
         else:
             raise ValueError("Dataset no encontrado.")
 
@@ -162,6 +199,51 @@ class DataSetService(BaseService):
         return f"10.1234/dataset/{dataset.id}"
 
 
+class SnapshotService:
+    """
+    Keeps the snapshot with every published dataset up to date. Updates run in a background thread
+    of the worker, and the ones requested while it is running are merged into a single extra pass.
+    """
+
+    _lock = threading.Lock()
+    _thread = None
+    _pending = False
+
+    def __init__(self):
+        self.repository = DataSetRepository()
+        self.snapshot = dataset_snapshot
+
+    def update(self) -> bool:
+        return self.snapshot.update(self.repository.download_all_datasets())
+
+    def schedule_update(self):
+        app = current_app._get_current_object()
+        if app.config.get("TESTING"):
+            self.update()
+            return
+
+        cls = SnapshotService
+        with cls._lock:
+            cls._pending = True
+            if cls._thread is None:
+                cls._thread = threading.Thread(target=cls._run, args=(app,), daemon=True)
+                cls._thread.start()
+
+    @classmethod
+    def _run(cls, app):
+        while True:
+            with cls._lock:
+                if not cls._pending:
+                    cls._thread = None
+                    return
+                cls._pending = False
+            with app.app_context():
+                try:
+                    cls().update()
+                except Exception as exc:
+                    logger.exception(f"Exception updating the dataset snapshot: {exc}")
+
+
 class AuthorService(BaseService):
     def __init__(self):
         super().__init__(AuthorRepository())
@@ -171,6 +253,16 @@ class DSDownloadRecordService(BaseService):
     def __init__(self):
         super().__init__(DSDownloadRecordRepository())
 
+    def track(self, dataset_id: int, user_cookie: str):
+        tracking_buffer.track(
+            DSDownloadRecord,
+            unique=("user_id", "dataset_id", "download_cookie"),
+            user_id=current_user.id if current_user.is_authenticated else None,
+            dataset_id=dataset_id,
+            download_date=datetime.now(timezone.utc),
+            download_cookie=user_cookie,
+        )
+
 
 class DSMetaDataService(BaseService):
     def __init__(self):
@@ -187,22 +279,21 @@ class DSViewRecordService(BaseService):
     def __init__(self):
         super().__init__(DSViewRecordRepository())
 
-    def the_record_exists(self, dataset: DataSet, user_cookie: str):
-        return self.repository.the_record_exists(dataset, user_cookie)
-
-    def create_new_record(self, dataset: DataSet,  user_cookie: str) -> DSViewRecord:
-        return self.repository.create_new_record(dataset, user_cookie)
-
     def create_cookie(self, dataset: DataSet) -> str:
 
         user_cookie = request.cookies.get("view_cookie")
         if not user_cookie:
             user_cookie = str(uuid.uuid4())
 
-        existing_record = self.the_record_exists(dataset=dataset, user_cookie=user_cookie)
-
-        if not existing_record:
-            self.create_new_record(dataset=dataset, user_cookie=user_cookie)
+        # The view is stored by the tracking buffer, the unique index of the table discards the repeated ones
+        tracking_buffer.track(
+            DSViewRecord,
+            unique=("user_id", "dataset_id", "view_cookie"),
+            user_id=current_user.id if current_user.is_authenticated else None,
+            dataset_id=dataset.id,
+            view_date=datetime.now(timezone.utc),
+            view_cookie=user_cookie,
+        )
 
         return user_cookie
 
@@ -236,56 +327,89 @@ class SizeService():
 
 
 class RatingService:
+    """
+    Valoraciones de datasets y modelos. Cada dataset y modelo guarda la suma y el número de sus
+    valoraciones, actualizados en la misma transacción que la valoración, así que la media se lee
+    de una sola fila.
+    """
+
     @staticmethod
     def add_rating(user_id, dataset_id, rating):
-        # Verifica si el usuario ya ha valorado el dataset
-        existing_rating = Rating.query.filter_by(user_id=user_id, dataset_id=dataset_id).first()
-
-        if existing_rating:
-            # Si ya existe una valoración, actualízala
-            existing_rating.rating = rating
-        else:
-            # Si no existe, crea una nueva valoración
-            new_rating = Rating(user_id=user_id, dataset_id=dataset_id, rating=rating)
-            db.session.add(new_rating)
-
-        db.session.commit()  # Guarda los cambios en la base de datos
+        RatingService._rate(Rating, DataSet, user_id, rating, dataset_id=dataset_id)
 
     @staticmethod
     def get_average_rating(dataset_id):
-        # Obtén todas las valoraciones para el dataset específico
-        ratings = Rating.query.filter_by(dataset_id=dataset_id).all()
-
-        # Si no hay valoraciones, devuelve None
-        if not ratings:
-            return None
-
-        # Calcula el promedio de las valoraciones y redondea a dos decimales
-        average_rating = sum(r.rating for r in ratings) / len(ratings)
-        return round(average_rating, 2)
+        return RatingService._average(DataSet, dataset_id)
 
     @staticmethod
     def add_model_rating(user_id, model_id, rating):
-        # Verifica si el usuario ya ha valorado este modelo específico
-        existing_rating = ModelRating.query.filter_by(user_id=user_id, model_id=model_id).first()
+        RatingService._rate(ModelRating, FeatureModel, user_id, rating, model_id=model_id)
 
-        if existing_rating:
-            # Si ya existe una valoración, actualízala
-            existing_rating.rating = rating
-        else:
-            # Si no existe, crea una nueva valoración
-            new_rating = ModelRating(user_id=user_id, model_id=model_id, rating=rating)
-            db.session.add(new_rating)
+    @staticmethod
+    def get_average_model_rating(model_id):
+        return RatingService._average(FeatureModel, model_id)
 
-        db.session.commit()  # Guarda los cambios en la base de datos
+    @staticmethod
+    def get_average_model_ratings(model_ids) -> dict:
+        """Media de valoraciones de cada modelo de `model_ids` (None si no tiene), con una sola consulta."""
+        model_ids = list(model_ids)
+        averages = dict.fromkeys(model_ids)
+        if not model_ids:
+            return averages
+        rows = db.session.execute(
+            select(FeatureModel.id, FeatureModel.rating_sum, FeatureModel.rating_count)
+            .where(FeatureModel.id.in_(model_ids))
+        )
+        for model_id, rating_sum, rating_count in rows:
+            if rating_count:
+                averages[model_id] = round(rating_sum / rating_count, 2)
+        return averages
 
     @staticmethod
-    def get_average_model_rating(model_id):
-        # Obtiene todas las valoraciones para el modelo específico
-        ratings = ModelRating.query.filter_by(model_id=model_id).all()
-        if not ratings:
-            return None  # Devuelve None si no hay valoraciones
-
-        # Calcula la media de las valoraciones
-        average_rating = sum(r.rating for r in ratings) / len(ratings)
-        return round(average_rating, 2)
+    def _rate(rating_model, rated_model, user_id, rating, **rated):
+        (column, rated_id), = rated.items()
+        try:
+            # Bloquea la valoración previa del usuario, si la hay, hasta guardar el nuevo valor
+            existing_rating = rating_model.query.filter_by(user_id=user_id, **rated).with_for_update().first()
+
+            if existing_rating:
+                # Si ya existe una valoración, actualízala: la suma cambia por la diferencia
+                sum_delta, count_delta = rating - existing_rating.rating, 0
+                existing_rating.rating = rating
+            else:
+                # Si no existe, crea una nueva valoración
+                sum_delta, count_delta = rating, 1
+                db.session.add(rating_model(user_id=user_id, rating=rating, **rated))
+
+            # El UPDATE suma sobre el valor de la fila, así que las valoraciones simultáneas no se pisan.
+            # La media de los datasets se asigna antes que la suma, MySQL evalúa el SET en orden
+            values = [
+                (rated_model.rating_sum, rated_model.rating_sum + sum_delta),
+                (rated_model.rating_count, rated_model.rating_count + count_delta),
+            ]
+            if rated_model is DataSet:
+                rating_score = (DataSet.rating_sum + sum_delta) * 1.0 / (DataSet.rating_count + count_delta)
+                values.insert(0, (DataSet.rating_score, rating_score))
+            db.session.execute(
+                update(rated_model)
+                .where(rated_model.id == rated_id)
+                .ordered_values(*values)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()  # Guarda los cambios en la base de datos
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @staticmethod
+    def _average(rated_model, rated_id):
+        aggregates = db.session.execute(
+            select(rated_model.rating_sum, rated_model.rating_count).where(rated_model.id == rated_id)
+        ).first()
+
+        # Si no hay valoraciones, devuelve None
+        if not aggregates or not aggregates.rating_count:
+            return None
+
+        # Calcula el promedio de las valoraciones y redondea a dos decimales
+        return round(aggregates.rating_sum / aggregates.rating_count, 2)
@@ -1,17 +1,28 @@
+from datetime import datetime, timezone
+import hashlib
 from io import BytesIO
 import os
 import pytest
 from unittest.mock import patch
 from app import create_app, db
-from app.modules.dataset.models import DataSet
+from app.modules.dataset.archives import ArchiveCache, DatasetSnapshot, archive_cache, dataset_snapshot
+from app.modules.dataset.models import DSDownloadRecord, DSViewRecord, DataSet, Rating, Tag
 from app.modules.dataset.repositories import DataSetRepository
 import tempfile
 import shutil
-from app.modules.conftest import login, logout
+import time
+from zipfile import ZipFile
+from app.modules.conftest import count_queries, login, logout
+from app.modules.dataset.services import DataSetService, RatingService, SnapshotService, calculate_checksum_and_size
+from app.modules.explore.services import ExploreService
+from app.modules.dataset.uploads import metadata_path, upload_metadata
+from app.modules.featuremodel.models import FeatureModel
+from app.modules.utils.utilsdb import create_dataset_db
+from core.repositories.BaseRepository import BaseRepository
+from core.tracking.buffer import TrackingBuffer
 
 from app.modules.auth.models import User
 
-from app.modules.dataset.routes import create_zip_of_datasets
 from app.modules.profile.models import UserProfile
 
 
@@ -32,10 +43,18 @@ def app():
 @pytest.fixture
 def mock_datasets():
     datasets = [DataSet(id=1, user_id=1), DataSet(id=2, user_id=1)]
-    with patch.object(DataSetRepository, 'download_all_datasets', return_value=datasets):
+    with patch.object(DataSetRepository, 'download_all_datasets', return_value=datasets), \
+            patch.object(DataSetRepository, 'count_synchronized_datasets', return_value=len(datasets)):
         yield datasets
 
 
+# Cada test construye su propio snapshot de todos los datasets
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path):
+    with patch.object(dataset_snapshot, '_directory', str(tmp_path / "snapshot")):
+        yield tmp_path / "snapshot"
+
+
 # Fixture para crear un usuario para login
 @pytest.fixture(scope="module")
 def test_client(test_client):
@@ -74,7 +93,7 @@ def test_no_datasets_to_download_route(app):
 
     with app.test_client() as client:
         # Simulamos que no hay datasets
-        with patch.object(DataSetRepository, 'download_all_datasets', return_value=[]):
+        with patch.object(DataSetRepository, 'count_synchronized_datasets', return_value=0):
             response = client.get("/dataset/download_all_datasets")
 
             # Verifica que la respuesta sea un 404
@@ -88,7 +107,7 @@ def test_create_zip_of_datasets_error(app, mock_datasets):
 
     with app.test_client() as client:
         # Simulamos una excepción al crear el ZIP
-        with patch("app.modules.dataset.routes.create_zip_of_datasets", side_effect=Exception("Zip creation failed")):
+        with patch.object(DatasetSnapshot, "update", side_effect=Exception("Zip creation failed")):
             response = client.get("/dataset/download_all_datasets")
 
             # Verificamos que la respuesta sea un error 500
@@ -104,12 +123,13 @@ def test_create_zip_of_datasets(mock_datasets):
 
     # Creamos un directorio temporal
     temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, "allDatasets.zip")
+    snapshot = DatasetSnapshot(temp_dir)
 
-    create_zip_of_datasets(mock_datasets, zip_path)
+    assert snapshot.update(mock_datasets)
 
     # Verificamos que el archivo ZIP fue creado
-    assert os.path.exists(zip_path)
+    assert os.path.exists(snapshot.path)
+    assert snapshot.built_at() is not None
 
     shutil.rmtree(temp_dir)
 
@@ -158,7 +178,7 @@ def test_no_datasets_to_download_route_with_login(test_client):
     assert login_response.status_code == 200, "Login was unsuccessful."
 
     # Simular que no hay datasets
-    with patch.object(DataSetRepository, 'download_all_datasets', return_value=[]):
+    with patch.object(DataSetRepository, 'count_synchronized_datasets', return_value=0):
         response = test_client.get("/dataset/download_all_datasets")
 
         # Verificar que la respuesta sea un 404
@@ -176,7 +196,7 @@ def test_create_zip_of_datasets_error_with_login(test_client, mock_datasets):
     assert login_response.status_code == 200, "Login was unsuccessful."
 
     # Simular una excepción al crear el ZIP
-    with patch("app.modules.dataset.routes.create_zip_of_datasets", side_effect=Exception("Zip creation failed")):
+    with patch.object(DatasetSnapshot, "update", side_effect=Exception("Zip creation failed")):
         response = test_client.get("/dataset/download_all_datasets")
 
         # Verificar que la respuesta sea un error 500
@@ -207,6 +227,361 @@ def test_send_zip_file_with_login(test_client, mock_datasets):
     logout(test_client)
 
 
+def test_serialize_datasets_query_count_is_flat(test_client):
+    with test_client.application.test_request_context():
+        for dataset_id in range(101, 107):
+            create_dataset_db(dataset_id, num_files=3)
+
+        query_counts = {}
+        for number_of_datasets in (2, 6):
+            db.session.expunge_all()
+            datasets = DataSet.query.order_by(DataSet.id).limit(number_of_datasets).all()
+            with count_queries() as statements:
+                serialized = DataSetService().serialize(datasets)
+            assert serialized == [dataset.to_dict() for dataset in datasets]
+            query_counts[number_of_datasets] = len(statements)
+
+        assert query_counts[2] == query_counts[6], f"Serialization issues queries per dataset: {query_counts}"
+
+
+def test_tags_are_normalized_and_shared(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(201, tags="ML, Machine Learning,ml")
+        create_dataset_db(202, tags="html,ml")
+
+        first = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 201").one()
+        second = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 202").one()
+        # Tags keep the name they were entered with and are matched by their normalized key
+        assert first.ds_meta_data.tags == "Machine Learning, ML"
+        assert first.to_dict()["tags"] == ["Machine Learning", "ML"]
+        assert second.ds_meta_data.tags == "html, ML"
+        assert Tag.query.filter_by(key="ml").one().name == "ML"
+        assert {tag.id for tag in first.ds_meta_data.tag_list} & {tag.id for tag in second.ds_meta_data.tag_list}
+
+        datasets, _ = ExploreService().filter("tags:mL")
+        assert {ds.id for ds in datasets} == {first.id, second.id}
+
+
+def test_download_dataset_streams_the_zip(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(301, num_files=3)
+        dataset = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 301").one()
+        dataset_id = dataset.id
+        expected_names = sorted(f"dataset_{dataset_id}/{file.name}" for file in dataset.files())
+
+    with patch("tempfile.mkdtemp", side_effect=AssertionError("No temporary directory must be created")):
+        response = test_client.get(f"/dataset/download/{dataset_id}")
+        assert response.status_code == 200
+        assert response.is_streamed
+        data = response.get_data()
+
+    assert response.headers["Content-Disposition"] == f"attachment; filename=dataset_{dataset_id}.zip"
+    with ZipFile(BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == expected_names
+    assert "download_cookie" in response.headers.get("Set-Cookie", "")
+
+    with test_client.application.app_context():
+        assert DSDownloadRecord.query.filter_by(dataset_id=dataset_id).count() == 1
+
+
+def test_download_dataset_is_served_from_the_archive_cache(test_client, tmp_path):
+    with test_client.application.test_request_context():
+        create_dataset_db(302, num_files=2)
+        dataset = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 302").one()
+        dataset_id = dataset.id
+        key = archive_cache.key(dataset)
+
+    with patch.object(archive_cache, "_directory", str(tmp_path)):
+        first = test_client.get(f"/dataset/download/{dataset_id}").get_data()
+        assert os.path.exists(archive_cache.path(key)), "The archive was not stored in the cache."
+
+        with patch("app.modules.dataset.routes.stream_zip", side_effect=AssertionError("The archive was rebuilt")):
+            response = test_client.get(f"/dataset/download/{dataset_id}")
+            assert response.status_code == 200
+            assert response.get_data() == first
+            response.close()
+
+        with test_client.application.app_context():
+            hubfile = DataSet.query.get(dataset_id).files()[0]
+            hubfile.checksum = "changed"
+            db.session.commit()
+            assert archive_cache.key(DataSet.query.get(dataset_id)) != key, "A changed file must change the key."
+
+
+def test_download_dataset_is_conditional(test_client, tmp_path):
+    with test_client.application.test_request_context():
+        create_dataset_db(303, num_files=2)
+        dataset = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 303").one()
+        dataset_id = dataset.id
+        key = archive_cache.key(dataset)
+
+    with patch.object(archive_cache, "_directory", str(tmp_path)):
+        first = test_client.get(f"/dataset/download/{dataset_id}")
+        data = first.get_data()
+        assert first.headers["ETag"] == f'"{key}"'
+
+        not_modified = test_client.get(f"/dataset/download/{dataset_id}", headers={"If-None-Match": f'"{key}"'})
+        assert not_modified.status_code == 304
+        assert not not_modified.get_data()
+
+        # Una descarga interrumpida se reanuda sobre el archivo ya cacheado
+        partial = test_client.get(
+            f"/dataset/download/{dataset_id}", headers={"Range": "bytes=10-", "If-Range": f'"{key}"'}
+        )
+        assert partial.status_code == 206
+        assert partial.get_data() == data[10:]
+        partial.close()
+
+    with test_client.application.app_context():
+        assert DSDownloadRecord.query.filter_by(dataset_id=dataset_id).count() == 1
+
+
+def test_archive_cache_evicts_least_recently_used(tmp_path):
+    cache = ArchiveCache(str(tmp_path), max_bytes=25)
+    for key, age in (("old", 300), ("recent", 200), ("newest", 100)):
+        path = cache.path(key)
+        with open(path, "wb") as archive:
+            archive.write(b"x" * 10)
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    assert cache.get("old") is not None
+    cache.evict()
+    assert cache.get("recent") is None
+    assert cache.get("old") is not None and cache.get("newest") is not None
+
+
+def test_snapshot_is_updated_incrementally(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(401, num_files=2)
+        snapshot_service = SnapshotService()
+        snapshot_service.update()
+        first_built_at = dataset_snapshot.built_at()
+        assert not snapshot_service.update(), "An up to date snapshot must not be rebuilt."
+
+        with open(dataset_snapshot.path, "rb") as archive_file:
+            first_archive = archive_file.read()
+
+        create_dataset_db(402, num_files=2)
+        published = DataSetRepository().download_all_datasets()
+        with patch("app.modules.dataset.archives.ZipFile", wraps=ZipFile) as zip_file:
+            assert snapshot_service.update()
+        assert zip_file.call_args.args[1] == "a", "New datasets must be appended to the snapshot."
+        assert dataset_snapshot.built_at() > first_built_at
+        with open(dataset_snapshot.path, "rb") as archive_file:
+            assert archive_file.read(len(first_archive)) == first_archive, "Downloads in progress must not change."
+        assert dataset_snapshot.read_manifest()["unused"] > 0
+
+        with ZipFile(dataset_snapshot.path) as archive:
+            assert archive.testzip() is None
+            folders = {name.split("/")[0] for name in archive.namelist()}
+        assert folders == {f"dataset_{dataset.id}" for dataset in published if dataset.files()}
+
+    response = test_client.get("/dataset/download_all_datasets")
+    assert response.status_code == 200
+    assert response.headers["X-Snapshot-Built-At"] == dataset_snapshot.built_at()
+    response.close()
+
+    etag = response.headers["ETag"]
+    response = test_client.get("/dataset/download_all_datasets", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_interrupted_snapshot_append_is_cut_off(mock_datasets):
+    snapshot = DatasetSnapshot(tempfile.mkdtemp())
+    assert snapshot.update(mock_datasets)
+    manifest = snapshot.read_manifest()
+
+    with open(snapshot.path, "ab") as archive_file:
+        archive_file.write(b"half of a member")
+    assert snapshot.read_manifest() is None, "An archive without its manifest must not be served."
+
+    assert not snapshot.update(mock_datasets)
+    assert snapshot.read_manifest() == manifest
+    with ZipFile(snapshot.path) as archive:
+        assert archive.testzip() is None
+
+    shutil.rmtree(snapshot.directory)
+
+
+def test_snapshot_is_built_in_background(test_client):
+    with patch.dict(test_client.application.config, {"TESTING": False}):
+        with test_client.application.test_request_context():
+            SnapshotService().schedule_update()
+            thread = SnapshotService._thread
+            if thread is not None:
+                thread.join(timeout=30)
+    assert dataset_snapshot.built_at() is not None
+
+
+def test_views_are_tracked_in_batches(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(601)
+        dataset_id = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 601").one().id
+
+    buffer = TrackingBuffer(max_events=100, flush_interval=60)
+    with patch.dict(test_client.application.config, {"TESTING": False}), \
+            test_client.application.test_request_context(), count_queries() as queries:
+        for cookie in ("a", "a", "b", "a"):
+            buffer.track(
+                DSViewRecord, unique=("user_id", "dataset_id", "view_cookie"),
+                user_id=None, dataset_id=dataset_id, view_date=datetime.now(timezone.utc), view_cookie=cookie,
+            )
+        assert not queries, "Tracking must not touch the database on the request path."
+        assert DSViewRecord.query.filter_by(dataset_id=dataset_id).count() == 0
+
+    # Al parar se vacía la cola con un solo INSERT
+    buffer.stop()
+    with test_client.application.app_context():
+        assert {record.view_cookie for record in DSViewRecord.query.filter_by(dataset_id=dataset_id)} == {"a", "b"}
+
+        # Un evento ya guardado no se duplica aunque el proceso no lo recuerde
+        buffer.clear()
+        buffer.track(
+            DSViewRecord, unique=("user_id", "dataset_id", "view_cookie"),
+            user_id=None, dataset_id=dataset_id, view_date=datetime.now(timezone.utc), view_cookie="a",
+        )
+        assert DSViewRecord.query.filter_by(dataset_id=dataset_id).count() == 2
+
+
+def test_failed_tracking_batches_are_retried(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(611)
+        dataset_id = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 611").one().id
+
+    buffer = TrackingBuffer(max_events=100, flush_interval=60, max_retries=1)
+
+    def track(cookie):
+        with patch.dict(test_client.application.config, {"TESTING": False}), \
+                test_client.application.test_request_context():
+            buffer.track(
+                DSViewRecord, unique=("user_id", "dataset_id", "view_cookie"),
+                user_id=None, dataset_id=dataset_id, view_date=datetime.now(timezone.utc), view_cookie=cookie,
+            )
+
+    failure = patch.object(BaseRepository, "upsert", side_effect=RuntimeError("database unavailable"))
+    with test_client.application.app_context():
+        # El lote que falla vuelve a la cola y se escribe en el siguiente intento
+        track("a")
+        with failure:
+            assert buffer.flush() == 0
+        assert buffer.flush() == 1
+
+        # Agotados los reintentos, el evento se descarta
+        track("b")
+        with failure:
+            assert buffer.flush() == 0
+            assert buffer.flush() == 0
+        assert buffer.flush() == 0
+        assert {record.view_cookie for record in DSViewRecord.query.filter_by(dataset_id=dataset_id)} == {"a"}
+    buffer.stop()
+
+
+def test_upsert_keeps_one_record_per_key(test_client):
+    with test_client.application.app_context():
+        create_dataset_db(602)
+        dataset_id = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 602").one().id
+        repository = BaseRepository(DSDownloadRecord)
+
+        def rows(*cookies):
+            return [
+                {"user_id": None, "dataset_id": dataset_id, "download_date": datetime.now(timezone.utc),
+                 "download_cookie": cookie}
+                for cookie in cookies
+            ]
+
+        # Dos procesos que escriben la misma descarga: el índice único deja solo una
+        assert repository.upsert(rows("x", "y")) == 2
+        assert repository.upsert(rows("x", "z")) == 1
+        assert DSDownloadRecord.query.filter_by(dataset_id=dataset_id).count() == 3
+
+        # El usuario anónimo y uno identificado con la misma cookie son registros distintos
+        user_id = User.query.first().id
+        assert repository.upsert([{**rows("x")[0], "user_id": user_id}]) == 1
+        assert DSDownloadRecord.query.filter_by(dataset_id=dataset_id, download_cookie="x").count() == 2
+
+
+def test_rating_aggregates_follow_the_ratings(test_client):
+    with test_client.application.app_context():
+        create_dataset_db(603)
+        dataset = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 603").one()
+        dataset_id, model_id = dataset.id, dataset.feature_models[0].id
+        first_user = User.query.first().id
+        second_user = User(email="rater@example.com", password="test1234")
+        db.session.add(second_user)
+        db.session.commit()
+
+        assert RatingService.get_average_rating(dataset_id) is None
+        RatingService.add_rating(first_user, dataset_id, 4)
+        RatingService.add_rating(second_user.id, dataset_id, 2)
+        assert RatingService.get_average_rating(dataset_id) == 3.0
+
+        # Cambiar una valoración ajusta la suma sin contar una valoración más
+        RatingService.add_rating(first_user, dataset_id, 5)
+        with count_queries() as queries:
+            assert RatingService.get_average_rating(dataset_id) == 3.5
+        assert len(queries) == 1
+        assert Rating.query.filter_by(dataset_id=dataset_id).count() == 2
+
+        RatingService.add_model_rating(first_user, model_id, 1)
+        RatingService.add_model_rating(first_user, model_id, 3)
+        assert RatingService.get_average_model_rating(model_id) == 3.0
+        assert db.session.get(FeatureModel, model_id).rating_count == 1
+
+
+def test_model_ratings_of_the_dataset_page_in_one_query(test_client):
+    with test_client.application.app_context():
+        models = []
+        for n in (604, 605, 606):
+            create_dataset_db(n)
+            dataset = DataSet.query.join(DataSet.ds_meta_data).filter_by(title=f"Sample dataset {n}").one()
+            models.append(dataset.feature_models[0].id)
+        user_id = User.query.first().id
+        RatingService.add_model_rating(user_id, models[0], 4)
+        RatingService.add_model_rating(user_id, models[1], 2)
+
+        with count_queries() as queries:
+            averages = RatingService.get_average_model_ratings(models)
+        assert len(queries) == 1
+        assert averages == {models[0]: 4.0, models[1]: 2.0, models[2]: None}
+        assert RatingService.get_average_model_ratings([]) == {}
+        doi = db.session.get(FeatureModel, models[0]).data_set.ds_meta_data.dataset_doi
+
+    response = test_client.get(f"/doi/{doi}")
+    assert response.status_code == 200
+    assert b"4.0 stars" in response.data
+
+
+def test_upload_computes_checksum_and_size_while_streaming(test_client):
+    content = b"features\n    Root\n" * 10000
+    login_response = login(test_client, "user@example.com", "test1234")
+    assert login_response.status_code == 200, "Login was unsuccessful."
+
+    response = test_client.post(
+        "/dataset/file/upload",
+        data={"file": (BytesIO(content), "streamed.uvl")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200
+    filename = response.get_json()["filename"]
+
+    with test_client.application.test_request_context():
+        path = os.path.join(User.query.filter_by(email="user@example.com").one().temp_folder(), filename)
+    assert os.path.exists(metadata_path(path))
+    assert calculate_checksum_and_size(path) == (hashlib.md5(content).hexdigest(), len(content))
+    assert upload_metadata(path)["sha256"] == hashlib.sha256(content).hexdigest()
+
+    # Si el fichero cambia después de subirlo, los metadatos se calculan de nuevo
+    with open(path, "ab") as file:
+        file.write(b"    Extra\n")
+    assert upload_metadata(path)["size"] == len(content) + len(b"    Extra\n")
+
+    response = test_client.post("/dataset/file/delete", json={"file": filename})
+    assert response.get_json() == {"message": "File deleted successfully"}
+    assert not os.path.exists(path) and not os.path.exists(metadata_path(path))
+    logout(test_client)
+
+
 # Limpiar archivos temporales después de los tests
 @pytest.fixture(scope="function", autouse=True)
 def cleanup():
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def metadata_path(path: str) -> str:
+    """Hidden sidecar next to an upload with the metadata computed while it was written."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.meta.json")
+
+
+def save_upload(stream, path: str) -> dict:
+    """
+    Writes `stream` to `path` in chunks of CHUNK_SIZE, computing the MD5 checksum of the hubfile,
+    the SHA-256 of the blob store and the size on the way, so the file is never read back nor held
+    in memory. The metadata is kept in the sidecar of the upload until the dataset is created.
+    """
+    md5, sha256, size = hashlib.md5(), hashlib.sha256(), 0
+    partial = f"{path}.{uuid.uuid4().hex}.partial"
+    try:
+        with open(partial, "wb") as file:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                md5.update(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+                file.write(chunk)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    metadata = {
+        "checksum": md5.hexdigest(),
+        "sha256": sha256.hexdigest(),
+        "size": size,
+        "mtime_ns": os.stat(path).st_mtime_ns,
+    }
+    with open(metadata_path(path), "w") as sidecar:
+        json.dump(metadata, sidecar)
+    return metadata
+
+
+def upload_metadata(path: str) -> dict:
+    """
+    Checksum, digest and size of an upload. They come from its sidecar while the file is the one that
+    was written, otherwise they are computed reading the file in chunks.
+    """
+    stat = os.stat(path)
+    try:
+        with open(metadata_path(path)) as sidecar:
+            metadata = json.load(sidecar)
+        if metadata.get("size") == stat.st_size and metadata.get("mtime_ns") == stat.st_mtime_ns:
+            return metadata
+    except (OSError, ValueError) as exc:
+        logger.debug(f"No valid upload metadata for {path}: {exc}")
+
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            md5.update(chunk)
+            sha256.update(chunk)
+    return {"checksum": md5.hexdigest(), "sha256": sha256.hexdigest(), "size": stat.st_size}
+
+
+def remove_upload(path: str) -> bool:
+    """Removes an upload and its sidecar. Returns whether the upload existed."""
+    sidecar = metadata_path(path)
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
+    if os.path.exists(path):
+        os.remove(path)
+        return True
+    return False
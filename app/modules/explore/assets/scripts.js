@@ -2,6 +2,8 @@ document.addEventListener('DOMContentLoaded', () => {
     send_query();
 });
 
+let next_cursor = null;
+
 function send_query() {
 
     console.log("send query...")
@@ -14,126 +16,224 @@ function send_query() {
 
     filters.forEach(filter => {
         filter.addEventListener('input', () => {
-            const csrfToken = document.getElementById('csrf_token').value;
-
-            const searchCriteria = {
-                csrf_token: csrfToken,
-                query: document.querySelector('#query').value,
-                publication_type: document.querySelector('#publication_type').value,
-                sorting: document.querySelector('[name="sorting"]:checked').value,
-            };
-
-            console.log(document.querySelector('#publication_type').value);
-
-            fetch('/explore', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(searchCriteria),
-            })
-                .then(response => response.json())
-                .then(data => {
-
-                    console.log(data);
-                    document.getElementById('results').innerHTML = '';
-
-                    // results counter
-                    const resultCount = data.length;
-                    const resultText = resultCount === 1 ? 'dataset' : 'datasets';
-                    document.getElementById('results_number').textContent = `${resultCount} ${resultText} found`;
-
-                    if (resultCount === 0) {
-                        console.log("show not found icon");
-                        document.getElementById("results_not_found").style.display = "block";
-                    } else {
-                        document.getElementById("results_not_found").style.display = "none";
-                    }
-
-
-                    data.forEach(dataset => {
-                        let card = document.createElement('div');
-                        card.className = 'col-12';
-                        card.innerHTML = `
-                            <div class="card">
-                                <div class="card-body">
-                                    <div class="d-flex align-items-center justify-content-between">
-                                        <h3><a href="${dataset.url}">${dataset.title}</a></h3>
-                                        <div>
-                                            <span class="badge bg-primary" style="cursor: pointer;" onclick="set_publication_type_as_query('${dataset.publication_type}')">${dataset.publication_type}</span>
-                                        </div>
-                                    </div>
-                                    <p class="text-secondary">${formatDate(dataset.created_at)}</p>
-
-                                    <div class="row mb-2">
-
-                                        <div class="col-md-4 col-12">
-                                            <span class=" text-secondary">
-                                                Description
-                                            </span>
-                                        </div>
-                                        <div class="col-md-8 col-12">
-                                            <p class="card-text">${dataset.description}</p>
-                                        </div>
-
-                                    </div>
-
-                                    <div class="row mb-2">
-
-                                        <div class="col-md-4 col-12">
-                                            <span class=" text-secondary">
-                                                Authors
-                                            </span>
-                                        </div>
-                                        <div class="col-md-8 col-12">
-                                            ${dataset.authors.map(author => `
-                                                <p class="p-0 m-0">${author.name}${author.affiliation ? ` (${author.affiliation})` : ''}${author.orcid ? ` (${author.orcid})` : ''}</p>
-                                            `).join('')}
-                                        </div>
-
-                                    </div>
-
-                                    <div class="row mb-2">
-
-                                        <div class="col-md-4 col-12">
-                                            <span class=" text-secondary">
-                                                Tags
-                                            </span>
-                                        </div>
-                                        <div class="col-md-8 col-12">
-                                            ${dataset.tags.map(tag => `<span class="badge bg-primary me-1" style="cursor: pointer;" onclick="set_tag_as_query('${tag}')">${tag}</span>`).join('')}
-                                        </div>
-
-                                    </div>
-
-                                    <div class="row">
-
-                                        <div class="col-md-4 col-12">
-
-                                        </div>
-                                        <div class="col-md-8 col-12">
-                                            <a href="${dataset.url}" class="btn btn-outline-primary btn-sm" id="search" style="border-radius: 5px;">
-                                                View dataset
-                                            </a>
-                                            <a href="/dataset/download/${dataset.id}" class="btn btn-outline-primary btn-sm" id="search" style="border-radius: 5px;">
-                                                Download (${dataset.total_size_in_human_format})
-                                            </a>
-                                        </div>
-
-
-                                    </div>
-
-                                </div>
-                            </div>
-                        `;
-
-                        document.getElementById('results').appendChild(card);
-                    });
-                });
+            fetch_page(null);
+        });
+    });
+
+    document.getElementById('load_more').addEventListener('click', () => {
+        if (next_cursor) {
+            fetch_page(next_cursor);
+        }
+    });
+}
+
+function get_search_criteria(cursor) {
+    const csrfToken = document.getElementById('csrf_token').value;
+
+    return {
+        csrf_token: csrfToken,
+        query: document.querySelector('#query').value,
+        publication_type: document.querySelector('#publication_type').value,
+        sorting: document.querySelector('[name="sorting"]:checked').value,
+        cursor: cursor,
+        facets: !cursor,
+    };
+}
+
+function fetch_page(cursor) {
+
+    const searchCriteria = get_search_criteria(cursor);
+
+    console.log(document.querySelector('#publication_type').value);
+
+    fetch('/explore', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(searchCriteria),
+    })
+        .then(response => response.json())
+        .then(data => {
+
+            console.log(data);
+
+            if (!cursor) {
+                document.getElementById('results').innerHTML = '';
+
+                // results counter
+                const resultCount = data.total;
+                const resultText = resultCount === 1 ? 'dataset' : 'datasets';
+                document.getElementById('results_number').textContent = `${resultCount} ${resultText} found`;
+
+                if (resultCount === 0) {
+                    console.log("show not found icon");
+                    document.getElementById("results_not_found").style.display = "block";
+                } else {
+                    document.getElementById("results_not_found").style.display = "none";
+                }
+
+                render_facets(data.facets);
+            }
+
+            next_cursor = data.next_cursor;
+            document.getElementById('load_more').style.display = next_cursor ? "inline-block" : "none";
+
+            data.datasets.forEach(dataset => {
+                document.getElementById('results').appendChild(render_dataset(dataset));
+            });
+        });
+}
+
+function render_dataset(dataset) {
+    let card = document.createElement('div');
+    card.className = 'col-12';
+    card.innerHTML = `
+        <div class="card">
+            <div class="card-body">
+                <div class="d-flex align-items-center justify-content-between">
+                    <h3><a href="${dataset.url}">${dataset.title}</a></h3>
+                    <div>
+                        <span class="badge bg-primary" style="cursor: pointer;" onclick="set_publication_type_as_query('${dataset.publication_type}')">${dataset.publication_type}</span>
+                    </div>
+                </div>
+                <p class="text-secondary">${formatDate(dataset.created_at)}</p>
+
+                <div class="row mb-2">
+
+                    <div class="col-md-4 col-12">
+                        <span class=" text-secondary">
+                            Description
+                        </span>
+                    </div>
+                    <div class="col-md-8 col-12">
+                        <p class="card-text">${dataset.description}</p>
+                    </div>
+
+                </div>
+
+                <div class="row mb-2">
+
+                    <div class="col-md-4 col-12">
+                        <span class=" text-secondary">
+                            Authors
+                        </span>
+                    </div>
+                    <div class="col-md-8 col-12">
+                        ${dataset.authors.map(author => `
+                            <p class="p-0 m-0">${author.name}${author.affiliation ? ` (${author.affiliation})` : ''}${author.orcid ? ` (${author.orcid})` : ''}</p>
+                        `).join('')}
+                    </div>
+
+                </div>
+
+                <div class="row mb-2">
+
+                    <div class="col-md-4 col-12">
+                        <span class=" text-secondary">
+                            Tags
+                        </span>
+                    </div>
+                    <div class="col-md-8 col-12">
+                        ${dataset.tags.map(tag => `<span class="badge bg-primary me-1" style="cursor: pointer;" onclick="set_tag_as_query('${tag}')">${tag}</span>`).join('')}
+                    </div>
+
+                </div>
+
+                ${dataset.matching_files ? `
+                <div class="row mb-2">
+
+                    <div class="col-md-4 col-12">
+                        <span class=" text-secondary">
+                            Matching files
+                        </span>
+                    </div>
+                    <div class="col-md-8 col-12">
+                        ${dataset.matching_files.map(file => `<span class="badge bg-secondary me-1">${file.name}</span>`).join('')}
+                    </div>
+
+                </div>` : ''}
+
+                <div class="row">
+
+                    <div class="col-md-4 col-12">
+
+                    </div>
+                    <div class="col-md-8 col-12">
+                        <a href="${dataset.url}" class="btn btn-outline-primary btn-sm" id="search" style="border-radius: 5px;">
+                            View dataset
+                        </a>
+                        <a href="/dataset/download/${dataset.id}" class="btn btn-outline-primary btn-sm" id="search" style="border-radius: 5px;">
+                            Download (${dataset.total_size_in_human_format})
+                        </a>
+                    </div>
+
+
+                </div>
+
+            </div>
+        </div>
+    `;
+    return card;
+}
+
+function render_facets(facets) {
+    const container = document.getElementById('facets');
+    container.innerHTML = '';
+    if (!facets) {
+        return;
+    }
+
+    const sections = [
+        ['Publication type', facets.publication_type, item => set_publication_type_as_query(item.label)],
+        ['Tags', facets.tags, item => add_filter_to_query(`tags:${item.value}`)],
+        ['Authors', facets.authors, item => add_filter_to_query(`author:${item.value}`)],
+        ['Size', facets.size, item => add_range_to_query('min_size', 'max_size', item)],
+        ['Models', facets.models, item => add_range_to_query('models_min', 'models_max', item)],
+    ];
+
+    sections.forEach(([title, items, refine]) => {
+        items = items.filter(item => item.count > 0);
+        if (items.length === 0) {
+            return;
+        }
+        let section = document.createElement('div');
+        section.className = 'mb-2';
+        section.innerHTML = `<p class="mb-1"><strong>${title}</strong></p>`;
+        items.forEach(item => {
+            let badge = document.createElement('span');
+            badge.className = 'badge bg-secondary me-1 mb-1';
+            badge.style.cursor = 'pointer';
+            badge.textContent = `${item.label || item.value} (${item.count})`;
+            badge.addEventListener('click', () => refine(item));
+            section.appendChild(badge);
         });
+        container.appendChild(section);
     });
 }
 
+function add_filter_to_query(filter) {
+    const queryInput = document.getElementById('query');
+    const filters = queryInput.value.split(';').map(item => item.trim()).filter(item => item !== '');
+    filters.push(filter);
+    queryInput.value = filters.join(';');
+    queryInput.dispatchEvent(new Event('input', {bubbles: true}));
+}
+
+function add_range_to_query(min_filter, max_filter, bucket) {
+    const queryInput = document.getElementById('query');
+    const filters = queryInput.value.split(';').map(item => item.trim())
+        .filter(item => item !== '' && !item.startsWith(`${min_filter}:`) && !item.startsWith(`${max_filter}:`));
+    if (bucket.min !== null) {
+        filters.push(`${min_filter}:${bucket.min}`);
+    }
+    if (bucket.max !== null) {
+        filters.push(`${max_filter}:${bucket.max}`);
+    }
+    queryInput.value = filters.join(';');
+    queryInput.dispatchEvent(new Event('input', {bubbles: true}));
+}
+
 function formatDate(dateString) {
     const options = {day: 'numeric', month: 'long', year: 'numeric', hour: 'numeric', minute: 'numeric'};
     const date = new Date(dateString);
@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Kept instead of the keys of a query with too many results to cache, so that it is not run again on every page
+OVERSIZED = object()
+
+
+class ExploreResultCache:
+    """
+    In-process LRU cache of explore results. Each entry is the ordered list of sort keys
+    (created_at or score, dataset id) of one query, so any page and the total can be served from it,
+    or OVERSIZED when the list would not fit.
+    The cache is bounded by an estimation of the memory used by its entries, and every entry also
+    expires after `ttl` seconds so that workers that did not see a write do not serve stale results forever.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query_string: str, sorting: str, publication_type: str):
+        filters = sorted(
+            ' '.join(item.split()).lower() for item in (query_string or '').split(';') if item.strip()
+        )
+        return ';'.join(filters), sorting, publication_type
+
+    @staticmethod
+    def estimate_size(keys) -> int:
+        entry_size = sys.getsizeof(keys[0]) + sum(sys.getsizeof(value) for value in keys[0]) if keys else 0
+        return sys.getsizeof(keys) + entry_size * len(keys)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, keys) -> bool:
+        """Caches the keys of a query. Returns False when they do not fit, and OVERSIZED is kept instead."""
+        size = self.estimate_size(keys)
+        stored = size <= self.max_bytes
+        if not stored:
+            keys, size = OVERSIZED, sys.getsizeof(OVERSIZED)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (keys, size, time.monotonic() + self.ttl)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+        return stored
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+
+explore_cache = ExploreResultCache(
+    max_bytes=int(os.getenv('EXPLORE_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+    ttl=int(os.getenv('EXPLORE_CACHE_TTL', 300)),
+)
@@ -0,0 +1,49 @@
+from app import db
+
+
+class SearchDocument(db.Model):
+    __tablename__ = 'search_document'
+
+    dataset_id = db.Column(db.Integer, db.ForeignKey('data_set.id', ondelete='CASCADE'), primary_key=True)
+    length = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'SearchDocument<dataset_id={self.dataset_id}, length={self.length}>'
+
+
+class SearchPosting(db.Model):
+    __tablename__ = 'search_posting'
+
+    # The primary key starts with `term`, so every lookup of a term is an index range scan
+    term = db.Column(db.String(64), primary_key=True)
+    field = db.Column(db.String(16), primary_key=True)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('data_set.id', ondelete='CASCADE'), primary_key=True, index=True)
+    frequency = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'SearchPosting<{self.field}:{self.term} dataset_id={self.dataset_id} tf={self.frequency}>'
+
+
+class UVLDocument(db.Model):
+    __tablename__ = 'uvl_document'
+
+    # One row per parsed file, so that every file is parsed once (again only if its checksum changes)
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id', ondelete='CASCADE'), primary_key=True)
+    checksum = db.Column(db.String(120), nullable=False)
+    valid = db.Column(db.Boolean, nullable=False, default=True)
+
+    def __repr__(self):
+        return f'UVLDocument<file_id={self.file_id}, valid={self.valid}>'
+
+
+class UVLFeature(db.Model):
+    __tablename__ = 'uvl_feature'
+
+    # `kind` is 'feature' or 'attribute'. The primary key starts with the name, as in search_posting
+    name = db.Column(db.String(255), primary_key=True)
+    kind = db.Column(db.String(16), primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id', ondelete='CASCADE'), primary_key=True, index=True)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('data_set.id', ondelete='CASCADE'), nullable=False, index=True)
+
+    def __repr__(self):
+        return f'UVLFeature<{self.kind}:{self.name} file_id={self.file_id}>'
@@ -1,20 +1,206 @@
-from sqlalchemy import or_
+from collections import defaultdict
+
+from sqlalchemy import String, and_, case, cast, false, func, literal, or_, select, union_all
 from sqlalchemy.orm import aliased
 from app import db
-from app.modules.dataset.models import DSMetaData, DataSet, Author, PublicationType
+from app.modules.dataset.models import Author, DSMetaData, DataSet, PublicationType, Tag, ds_meta_data_tag
+from app.modules.dataset.repositories import TagRepository
+from app.modules.explore.models import SearchDocument, SearchPosting, UVLDocument, UVLFeature
+from app.modules.explore.search import FIELD_WEIGHTS, bm25, normalize_feature_name, split_tags, tag_key, tokenize
+from app.modules.featuremodel.models import FeatureModel
+from app.modules.hubfile.models import Hubfile
 from core.repositories.BaseRepository import BaseRepository
 
 
+FACET_SIZE = 10
+
+# Buckets of the size (bytes) and model count facets as (label, min, max), both bounds inclusive
+SIZE_BUCKETS = (
+    ('Up to 10 KB', None, 10 * 1024),
+    ('10 KB - 100 KB', 10 * 1024 + 1, 100 * 1024),
+    ('100 KB - 1 MB', 100 * 1024 + 1, 1024 * 1024),
+    ('Over 1 MB', 1024 * 1024 + 1, None),
+)
+MODEL_BUCKETS = (
+    ('Up to 1', None, 1),
+    ('2 - 4', 2, 4),
+    ('5 - 9', 5, 9),
+    ('10 or more', 10, None),
+)
+
+# Precomputed and indexed score of each sort order other than the dates and the relevance
+SCORE_SORTINGS = {
+    'downloads': DataSet.download_count,
+    'views': DataSet.view_count,
+    'rating': DataSet.rating_score,
+    'trending': DataSet.trending_score,
+}
+
+
 class ExploreRepository(BaseRepository):
     def __init__(self):
         super().__init__(DataSet)
+        self.search_posting_repository = SearchPostingRepository()
+        self.tag_repository = TagRepository()
+        self.uvl_feature_repository = UVLFeatureRepository()
 
     def filter_datasets(self, query_string, sorting="newest", publication_type="any", uvl_min="", uvl_max=""):
+        datasets, _ = self.filter_page(query_string, sorting, publication_type, uvl_min=uvl_min, uvl_max=uvl_max)
+        return datasets
+
+    def filter_page(self, query_string, sorting="newest", publication_type="any", after=None, limit=None,
+                    uvl_min="", uvl_max=""):
+        """
+        Returns the datasets that come after the `after` sort key, at most `limit` of them, together
+        with the sort key of the last one when there are more results to fetch (None otherwise).
+        Every order but the relevance is paged by the database with a keyset predicate on (sort key, id).
+        """
+        query, ranking_terms = self._build_query(query_string, publication_type, uvl_min, uvl_max)
+
+        if sorting == "relevance" and ranking_terms:
+            return self._relevance_page(query, ranking_terms, after, limit)
+
+        column = self._sort_column(sorting)
+        if after is not None:
+            # The value is read again from the row of the cursor when it still exists: FLOAT scores
+            # do not survive the round trip through Python exactly on MySQL, and the equality would fail
+            value = func.coalesce(
+                select(column).where(DataSet.id == after[1]).scalar_subquery(), literal(after[0], column.type)
+            )
+            if sorting == "oldest":
+                query = query.filter(or_(column > value, and_(column == value, DataSet.id > after[1])))
+            else:
+                query = query.filter(or_(column < value, and_(column == value, DataSet.id < after[1])))
+        query = self._order(query, sorting)
+
+        if limit is None:
+            return query.all(), None
+
+        datasets = query.limit(limit + 1).all()
+        if len(datasets) <= limit:
+            return datasets, None
+        datasets = datasets[:limit]
+        return datasets, (getattr(datasets[-1], column.key), datasets[-1].id)
+
+    def count_datasets(self, query_string, publication_type="any") -> int:
+        query, _ = self._build_query(query_string, publication_type)
+        return query.with_entities(func.count(DataSet.id)).scalar()
+
+    def filter_keys(self, query_string, sorting="newest", publication_type="any"):
+        """
+        Sort keys (created_at, relevance or popularity score, id) of every matching dataset in result order,
+        which is what the explore cache keeps. Only the keys are fetched from the database.
+        """
+        query, ranking_terms = self._build_query(query_string, publication_type)
+
+        if sorting == "relevance" and ranking_terms:
+            return self._relevance_keys(query, ranking_terms)
+
+        query = self._order(query, sorting).with_entities(self._sort_column(sorting), DataSet.id)
+        return [(value, dataset_id) for value, dataset_id in query]
+
+    def _relevance_keys(self, query, ranking_terms):
+        ids = [dataset_id for dataset_id, in query.with_entities(DataSet.id)]
+        scores = self.search_posting_repository.rank(ids, ranking_terms)
+        return sorted(((scores.get(dataset_id, 0.0), dataset_id) for dataset_id in ids), reverse=True)
+
+    def _relevance_page(self, query, ranking_terms, after, limit):
+        # The ranking needs the score of every match, but only the datasets of the page are loaded
+        keys = self._relevance_keys(query, ranking_terms)
+        if after is not None:
+            keys = [key for key in keys if key < tuple(after)]
+        next_key = None
+        if limit is not None and len(keys) > limit:
+            keys = keys[:limit]
+            next_key = keys[-1]
+        return self.get_ordered([dataset_id for _, dataset_id in keys]), next_key
+
+    def iter_ordered(self, query_string, sorting="newest", publication_type="any", batch_size=100):
+        """
+        Yields the matching datasets in batches of `batch_size`, each one read by its own keyset query.
+        No cursor stays open between batches, so the caller can run other queries on the same connection
+        (an unbuffered MySQL cursor would be discarded by them).
+        """
+        after = None
+        while True:
+            datasets, after = self.filter_page(query_string, sorting, publication_type, after, batch_size)
+            if datasets:
+                yield datasets
+            if after is None:
+                return
+
+    @staticmethod
+    def _sort_column(sorting):
+        return SCORE_SORTINGS.get(sorting, DataSet.created_at)
+
+    @staticmethod
+    def _order(query, sorting):
+        if sorting == "oldest":
+            return query.order_by(DataSet.created_at.asc(), DataSet.id.asc())
+        # The scores are read from their (score, id) index, in reverse
+        return query.order_by(ExploreRepository._sort_column(sorting).desc(), DataSet.id.desc())
+
+    def get_ordered(self, ids):
+        """Loads the datasets with the given ids, in the same order as the ids."""
+        if not ids:
+            return []
+        datasets = {ds.id: ds for ds in self.session.query(DataSet).filter(DataSet.id.in_(ids)).all()}
+        return [datasets[dataset_id] for dataset_id in ids if dataset_id in datasets]
+
+    def facet_counts(self, query_string, publication_type="any", top=FACET_SIZE):
+        """
+        Counts the matching datasets per publication type, tag, author, size bucket and model count bucket.
+        All the facets are computed by the database in a single statement (one UNION ALL branch per facet),
+        each branch keeping the `top` most frequent values of its facet with its own ORDER BY and LIMIT.
+        No CTE nor window function is used, so it also runs on MySQL 5.7.
+        Returns a list of (facet, value, count) rows.
+        """
+        query, _ = self._build_query(query_string, publication_type)
+        matching = query.with_entities(
+            DataSet.id.label('dataset_id'),
+            DataSet.ds_meta_data_id.label('ds_meta_data_id'),
+            total_size_column().label('size'),
+            files_count_column().label('models'),
+        ).subquery('matching')
+
+        size_bucket = bucket_column(matching.c.size, SIZE_BUCKETS)
+        models_bucket = bucket_column(matching.c.models, MODEL_BUCKETS)
+
+        branches = [
+            select(literal('publication_type').label('facet'),
+                   cast(DSMetaData.publication_type, String).label('value'),
+                   func.count().label('total'))
+            .join(matching, DSMetaData.id == matching.c.ds_meta_data_id)
+            .group_by(DSMetaData.publication_type),
+            select(literal('tag').label('facet'), Tag.name.label('value'), func.count().label('total'))
+            .join(ds_meta_data_tag, ds_meta_data_tag.c.tag_id == Tag.id)
+            .join(matching, ds_meta_data_tag.c.ds_meta_data_id == matching.c.ds_meta_data_id)
+            .group_by(Tag.id, Tag.name),
+            select(literal('author').label('facet'), Author.name.label('value'),
+                   func.count(func.distinct(matching.c.dataset_id)).label('total'))
+            .join(matching, Author.ds_meta_data_id == matching.c.ds_meta_data_id)
+            .group_by(Author.name),
+            select(literal('size').label('facet'), size_bucket.label('value'), func.count().label('total'))
+            .select_from(matching).group_by(size_bucket),
+            select(literal('models').label('facet'), models_bucket.label('value'), func.count().label('total'))
+            .select_from(matching).group_by(models_bucket),
+        ]
+
+        # MySQL only accepts ORDER BY and LIMIT in a UNION branch wrapped as a derived table
+        ranked = []
+        for branch in branches:
+            columns = branch.selected_columns
+            branch = branch.order_by(columns.total.desc(), columns.value).limit(top).subquery()
+            ranked.append(select(branch.c.facet, branch.c.value, branch.c.total))
+
+        return self.session.execute(union_all(*ranked)).all()
+
+    def _build_query(self, query_string, publication_type="any", uvl_min="", uvl_max=""):
 
         ds_meta_data_alias = aliased(DSMetaData)
-        author_meta_data_alias = aliased(DSMetaData)
         min_size_filter = None
         max_size_filter = None
+        ranking_terms = []
 
         query = db.session.query(DataSet).join(ds_meta_data_alias, DataSet.ds_meta_data)
 
@@ -29,10 +215,12 @@ class ExploreRepository(BaseRepository):
         query_filter = query_string.strip()
 
         for filter_item in query_filter.split(';'):
+            filter_item = filter_item.strip()
 
             if filter_item.startswith('tags:'):
-                tag_value = filter_item[5:].strip()
-                query = query.filter(ds_meta_data_alias.tags.ilike(f'%{tag_value}%'))
+                for tag in split_tags(filter_item[5:]):
+                    tagged = self.tag_repository.ds_meta_data_ids(tag_key(tag))
+                    query = query.filter(DataSet.ds_meta_data_id.in_(tagged))
 
             elif filter_item.startswith('models_max:'):
                 models_max_value = filter_item[11:].strip()
@@ -54,13 +242,19 @@ class ExploreRepository(BaseRepository):
                 except ValueError:
                     max_size_filter = None
 
+            elif filter_item.startswith('feature:') or filter_item.startswith('attribute:'):
+                kind, _, name = filter_item.partition(':')
+                query = query.filter(DataSet.id.in_(
+                    self.uvl_feature_repository.dataset_ids(normalize_feature_name(name), kind)
+                ))
+
             elif filter_item.startswith('author:'):
-                author_name = filter_item[7:].strip()
-                query = query.join(author_meta_data_alias).join(Author).filter(Author.name.ilike(f'%{author_name}%'))
+                query = self._filter_by_terms(query, tokenize(filter_item[7:]), ['author'])
 
             elif filter_item.startswith('title:'):
-                title_value = filter_item[6:].strip()
-                query = query.filter(ds_meta_data_alias.title.ilike(f'%{title_value}%'))
+                terms = tokenize(filter_item[6:])
+                query = self._filter_by_terms(query, terms, ['title'])
+                ranking_terms.extend(terms)
 
             elif filter_item.startswith('publication_type:'):
                 pub_type_value = filter_item[len('publication_type:'):].strip().lower()
@@ -72,43 +266,204 @@ class ExploreRepository(BaseRepository):
                 if matching_type is not None:
                     query = query.filter(ds_meta_data_alias.publication_type == matching_type.name)
 
-            else:
-                query = query.filter(
-                    or_(
-                        ds_meta_data_alias.title.ilike(f"%{filter_item}%"),
-                        ds_meta_data_alias.tags.ilike(f"%{filter_item}%")
-                    )
-                )
+            elif filter_item:
+                terms = tokenize(filter_item)
+                query = self._filter_by_terms(query, terms)
+                ranking_terms.extend(terms)
 
-        if sorting == "oldest":
-            query = query.order_by(DataSet.created_at.asc())
+        if min_size_filter is not None:
+            query = query.filter(total_size_column() >= min_size_filter)
+
+        if max_size_filter is not None:
+            query = query.filter(total_size_column() <= max_size_filter)
+
+        if uvl_min.isdigit():
+            query = query.filter(files_count_column() >= int(uvl_min))
+
+        if uvl_max.isdigit():
+            query = query.filter(files_count_column() <= int(uvl_max))
+
+        return query, ranking_terms
+
+    def _filter_by_terms(self, query, terms, fields=None):
+        # Every term has to appear in the dataset. The last one is matched as a prefix
+        # so that results are already meaningful while the user is still typing it.
+        # Text without any term (only punctuation, say) matches nothing rather than everything.
+        if not terms:
+            return query.filter(false())
+        for position, term in enumerate(terms):
+            prefix = position == len(terms) - 1
+            query = query.filter(DataSet.id.in_(self.search_posting_repository.dataset_ids(term, fields, prefix)))
+        return query
+
+
+class SearchDocumentRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(SearchDocument)
+
+    def save(self, dataset_id: int, length: int, commit: bool = True) -> SearchDocument:
+        document = self.get_by_id(dataset_id)
+        if document:
+            document.length = length
         else:
-            query = query.order_by(DataSet.created_at.desc())
+            document = SearchDocument(dataset_id=dataset_id, length=length)
+            self.session.add(document)
+        if commit:
+            self.session.commit()
+        return document
 
-        results = query.all()
+    def corpus_stats(self):
+        total_documents, total_length = self.session.query(
+            func.count(SearchDocument.dataset_id), func.coalesce(func.sum(SearchDocument.length), 0)
+        ).one()
+        average_length = total_length / total_documents if total_documents else 0.0
+        return total_documents, average_length
 
-        if min_size_filter is not None:
-            results = [ds for ds in results if ds.get_file_total_size() >= min_size_filter]
 
-        if max_size_filter is not None:
-            results = [ds for ds in results if ds.get_file_total_size() <= max_size_filter]
+class SearchPostingRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(SearchPosting)
+        self.search_document_repository = SearchDocumentRepository()
+
+    def dataset_ids(self, term: str, fields=None, prefix: bool = False):
+        """Subquery with the ids of the datasets whose posting list contains the term."""
+        query = self.session.query(SearchPosting.dataset_id)
+        if prefix:
+            query = query.filter(SearchPosting.term.startswith(term, autoescape=True))
+        else:
+            query = query.filter(SearchPosting.term == term)
+        if fields:
+            query = query.filter(SearchPosting.field.in_(fields))
+        return query
+
+    def replace_for_dataset(self, dataset_id: int, postings, commit: bool = True):
+        self.session.query(SearchPosting).filter(SearchPosting.dataset_id == dataset_id).delete(
+            synchronize_session=False
+        )
+        self.session.add_all([
+            SearchPosting(term=term, field=field, dataset_id=dataset_id, frequency=frequency)
+            for (field, term), frequency in postings.items()
+        ])
+        self.search_document_repository.save(dataset_id, sum(postings.values()), commit=False)
+        if commit:
+            self.session.commit()
+
+    def rank(self, dataset_ids, terms) -> dict:
+        """Scores the given datasets against the query terms with BM25 over the weighted fields."""
+        if not dataset_ids or not terms:
+            return {}
+
+        total_documents, average_length = self.search_document_repository.corpus_stats()
+        lengths = dict(
+            self.session.query(SearchDocument.dataset_id, SearchDocument.length)
+            .filter(SearchDocument.dataset_id.in_(dataset_ids))
+            .all()
+        )
+        document_frequencies = dict(
+            self.session.query(SearchPosting.term, func.count(func.distinct(SearchPosting.dataset_id)))
+            .filter(SearchPosting.term.in_(set(terms)))
+            .group_by(SearchPosting.term)
+            .all()
+        )
+
+        term_frequencies = defaultdict(float)
+        postings = (
+            self.session.query(SearchPosting)
+            .filter(SearchPosting.term.in_(set(terms)), SearchPosting.dataset_id.in_(dataset_ids))
+            .all()
+        )
+        for posting in postings:
+            weight = FIELD_WEIGHTS.get(posting.field, 1.0)
+            term_frequencies[(posting.dataset_id, posting.term)] += weight * posting.frequency
+
+        scores = defaultdict(float)
+        for (dataset_id, term), term_frequency in term_frequencies.items():
+            scores[dataset_id] += bm25(
+                term_frequency,
+                lengths.get(dataset_id, 0),
+                average_length,
+                document_frequencies.get(term, 0),
+                total_documents,
+            )
+        return scores
+
+
+class UVLFeatureRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(UVLFeature)
+
+    def dataset_ids(self, name: str, kind: str = 'feature'):
+        """Subquery with the ids of the datasets that have a file containing the feature (or attribute)."""
+        return self.session.query(UVLFeature.dataset_id).filter(UVLFeature.name == name, UVLFeature.kind == kind)
+
+    def file_ids(self, name: str, kind: str = 'feature'):
+        return self.session.query(UVLFeature.file_id).filter(UVLFeature.name == name, UVLFeature.kind == kind)
+
+    def replace_for_file(self, hubfile: Hubfile, dataset_id: int, entries, valid: bool = True, commit: bool = True):
+        self.session.query(UVLFeature).filter(UVLFeature.file_id == hubfile.id).delete(synchronize_session=False)
+        self.session.add_all([
+            UVLFeature(name=name, kind=kind, file_id=hubfile.id, dataset_id=dataset_id) for kind, name in entries
+        ])
+        document = self.session.get(UVLDocument, hubfile.id)
+        if document:
+            document.checksum = hubfile.checksum
+            document.valid = valid
+        else:
+            self.session.add(UVLDocument(file_id=hubfile.id, checksum=hubfile.checksum, valid=valid))
+        if commit:
+            self.session.commit()
+
+    def unindexed_files(self) -> list:
+        """Files that were never parsed, or whose content changed since they were."""
+        return (
+            self.session.query(Hubfile)
+            .outerjoin(UVLDocument, UVLDocument.file_id == Hubfile.id)
+            .filter(or_(UVLDocument.file_id.is_(None), UVLDocument.checksum != Hubfile.checksum))
+            .all()
+        )
+
+    def matching_files(self, dataset_ids, filters) -> dict:
+        """Files of the given datasets that contain every (kind, name) filter, grouped by dataset id."""
+        if not dataset_ids or not filters:
+            return {}
+        query = (
+            self.session.query(FeatureModel.data_set_id, Hubfile.id, Hubfile.name)
+            .join(FeatureModel, Hubfile.feature_model_id == FeatureModel.id)
+            .filter(FeatureModel.data_set_id.in_(dataset_ids))
+        )
+        for kind, name in filters:
+            query = query.filter(Hubfile.id.in_(self.file_ids(name, kind)))
+        files = defaultdict(list)
+        for dataset_id, file_id, file_name in query.order_by(Hubfile.id).all():
+            files[dataset_id].append({"id": file_id, "name": file_name})
+        return files
+
 
-        if uvl_min.isdigit() or uvl_max.isdigit():
-            results = [
-                ds for ds in results
-                if num_uvls(ds, uvl_min, uvl_max)
-            ]
+def files_count_column():
+    """Correlated subquery with the number of files of each dataset, evaluated by the database."""
+    return (
+        select(func.count(Hubfile.id))
+        .join(FeatureModel, Hubfile.feature_model_id == FeatureModel.id)
+        .where(FeatureModel.data_set_id == DataSet.id)
+        .correlate(DataSet)
+        .scalar_subquery()
+    )
 
-        return results
 
+def total_size_column():
+    """Correlated subquery with the total size in bytes of the files of each dataset."""
+    return (
+        select(func.coalesce(func.sum(Hubfile.size), 0))
+        .join(FeatureModel, Hubfile.feature_model_id == FeatureModel.id)
+        .where(FeatureModel.data_set_id == DataSet.id)
+        .correlate(DataSet)
+        .scalar_subquery()
+    )
 
-def num_uvls(dataset, num_min, num_max):
-    max_valid = num_max.isdigit()
-    min_valid = num_min.isdigit()
-    number = dataset.get_files_count()
 
-    if min_valid and max_valid:
-        return number >= int(num_min) and number <= int(num_max)
-    else:
-        return (min_valid and number >= int(num_min)
-                or max_valid and number <= int(num_max))
+def bucket_column(column, buckets):
+    """CASE expression with the label of the bucket each value of the column falls into."""
+    return case(
+        *[(column <= maximum, label) for label, _, maximum in buckets if maximum is not None],
+        else_=buckets[-1][0],
+    )
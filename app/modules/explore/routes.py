@@ -1,7 +1,9 @@
-from flask import render_template, request, jsonify
+from flask import Response, current_app, render_template, request, jsonify, stream_with_context
+from app.modules.dataset.services import DataSetService
 from app.modules.explore import explore_bp
+from app.modules.explore.cache import explore_cache
 from app.modules.explore.forms import ExploreForm
-from app.modules.explore.services import ExploreService
+from app.modules.explore.services import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ExploreService
 
 
 @explore_bp.route('/explore', methods=['GET', 'POST'])
@@ -18,7 +20,55 @@ def index():
         query_string = criteria.get("query", "")
         sorting = criteria.get("sorting", "newest")
         publication_type = criteria.get("publication_type", "any")
+        cursor = criteria.get("cursor")
+
+        # Modo streaming: todos los resultados, un dataset serializado por línea (NDJSON)
+        if criteria.get("stream"):
+            return Response(
+                stream_with_context(stream_datasets(query_string, sorting, publication_type)),
+                mimetype="application/x-ndjson",
+            )
+
+        try:
+            page_size = min(max(int(criteria.get("page_size", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return jsonify({"error": "page_size must be an integer"}), 400
 
         # Llama al servicio de exploración con los parámetros
-        datasets = ExploreService().filter(query_string, sorting, publication_type)
-        return jsonify([dataset.to_dict() for dataset in datasets])
+        explore_service = ExploreService()
+        try:
+            datasets, next_cursor = explore_service.filter(
+                query_string, sorting, publication_type, cursor=cursor, limit=page_size
+            )
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+
+        serialized = DataSetService().serialize(datasets)
+
+        # Con filtros feature: o attribute: se indican también los ficheros UVL que los contienen
+        matching_files = explore_service.matching_files(query_string, datasets)
+        if matching_files:
+            for dataset in serialized:
+                dataset["matching_files"] = matching_files.get(dataset["id"], [])
+
+        response = {
+            "datasets": serialized,
+            "next_cursor": next_cursor,
+        }
+        # El total solo se calcula en la primera página: sale de las claves en caché, o de un COUNT si no caben
+        if not cursor:
+            response["total"] = explore_service.count(query_string, publication_type, sorting)
+            if criteria.get("facets"):
+                response["facets"] = explore_service.facets(query_string, publication_type)
+        return jsonify(response)
+
+
+def stream_datasets(query_string, sorting, publication_type):
+    dataset_service = DataSetService()
+    for datasets in ExploreService().stream(query_string, sorting, publication_type):
+        yield "".join(current_app.json.dumps(dataset) + "\n" for dataset in dataset_service.serialize(datasets))
+
+
+@explore_bp.route('/explore/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(explore_cache.stats())
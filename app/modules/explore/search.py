@@ -0,0 +1,101 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+
+# Runs of letters and digits of any script, after normalize(): 'Café' is 'cafe', 'Модель' is 'модель'
+TOKEN_PATTERN = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+MAX_FEATURE_NAME_LENGTH = 255
+
+# Fields of a dataset that are indexed, with the weight each one has in the ranking
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'tag': 2.0,
+    'tag_word': 2.0,
+    'author': 2.0,
+    'description': 1.0,
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def normalize(text):
+    """Lowercases the text and strips accents so that 'Café' and 'cafe' index the same term."""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall(normalize(text))]
+
+
+def split_tags(tags):
+    """Splits a comma separated tag string into whole tags, as they were entered."""
+    return [tag.strip()[:MAX_TERM_LENGTH] for tag in (tags or '').split(',') if tag.strip()]
+
+
+def tag_key(name):
+    """Normalized form a tag is matched by, so that 'Café' and 'cafe' are the same tag."""
+    return normalize(name).strip()[:MAX_TERM_LENGTH]
+
+
+def normalize_feature_name(name):
+    """UVL names may be quoted ('"Data Storage"'), they are indexed and searched without quotes."""
+    return ' '.join(normalize(name).strip().strip('"').split())[:MAX_FEATURE_NAME_LENGTH]
+
+
+def feature_filters(query_string):
+    """Returns the (kind, name) of every 'feature:' and 'attribute:' item of an explore query."""
+    filters = []
+    for filter_item in (query_string or '').split(';'):
+        kind, _, name = filter_item.strip().partition(':')
+        if kind in ('feature', 'attribute') and normalize_feature_name(name):
+            filters.append((kind, normalize_feature_name(name)))
+    return filters
+
+
+def uvl_features(feature_model):
+    """Returns the set of (kind, name) of the features and attributes of a flamapy feature model."""
+    entries = set()
+    for feature in feature_model.get_features():
+        entries.add(('feature', normalize_feature_name(feature.name)))
+        for attribute in feature.get_attributes():
+            entries.add(('attribute', normalize_feature_name(attribute.name)))
+    entries.discard(('feature', ''))
+    entries.discard(('attribute', ''))
+    return entries
+
+
+def dataset_postings(dataset):
+    """
+    Returns a Counter keyed by (field, term) with the frequency of each term in the dataset metadata.
+    Tags are indexed both as whole tags and, in a separate field, as the words they contain,
+    so that free text search also finds the words of multi-word tags.
+    """
+    ds_meta_data = dataset.ds_meta_data
+    postings = Counter()
+
+    for term in tokenize(ds_meta_data.title):
+        postings[('title', term)] += 1
+
+    for term in tokenize(ds_meta_data.description):
+        postings[('description', term)] += 1
+
+    for tag in ds_meta_data.tag_list:
+        postings[('tag', tag.key)] += 1
+        for term in set(tokenize(tag.name)) - {tag.key}:
+            postings[('tag_word', term)] += 1
+
+    for author in ds_meta_data.authors:
+        for term in tokenize(author.name):
+            postings[('author', term)] += 1
+
+    return postings
+
+
+def bm25(term_frequency, document_length, average_length, document_frequency, total_documents):
+    idf = math.log(1 + (total_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+    length_norm = 1 - BM25_B + BM25_B * document_length / (average_length or 1)
+    return idf * term_frequency * (BM25_K1 + 1) / (term_frequency + BM25_K1 * length_norm)
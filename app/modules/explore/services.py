@@ -1,11 +1,218 @@
-from app.modules.explore.repositories import ExploreRepository
+import base64
+import binascii
+import json
+import logging
+from datetime import datetime
+
+from flamapy.metamodels.fm_metamodel.transformations import UVLReader
+
+from app.modules.dataset.models import DataSet, PublicationType
+from app.modules.explore.cache import OVERSIZED, explore_cache
+from app.modules.explore.repositories import (
+    MODEL_BUCKETS,
+    SIZE_BUCKETS,
+    ExploreRepository,
+    SearchPostingRepository,
+    UVLFeatureRepository
+)
+from app.modules.explore.search import dataset_postings, feature_filters, uvl_features
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+STREAM_BATCH_SIZE = 100
+
+
+def encode_cursor(key) -> str:
+    """Encodes the sort key (created_at or a score, id) of the last dataset of a page as an opaque token."""
+    value, dataset_id = key
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([value, dataset_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        value, dataset_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value, int(dataset_id)
+    except (binascii.Error, TypeError, ValueError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor}") from exc
 
 
 class ExploreService:
     def __init__(self):
         self.repository = ExploreRepository()
+        self.uvl_feature_repository = UVLFeatureRepository()
+
+    def filter(self, query_string: str, sorting="newest", publication_type="any", cursor=None, limit=None):
+        """
+        Filtra los datasets a partir de una cadena de consulta.
+        Devuelve como mucho `limit` datasets posteriores al cursor y el cursor de la página siguiente.
+        Las claves ordenadas de cada consulta se guardan en la caché, así que solo el primer acceso la ejecuta.
+        Si no caben, las páginas se leen directamente de la base de datos con un predicado keyset.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        keys = self._keys(query_string, sorting, publication_type)
+        try:
+            if keys is None:
+                # Demasiados resultados para la caché: cada página se lee con una consulta keyset
+                datasets, next_key = self.repository.filter_page(
+                    query_string, sorting, publication_type, after, limit
+                )
+                return datasets, encode_cursor(next_key) if next_key else None
+            start = _position_after(keys, after, ascending=sorting == "oldest") if after else 0
+        except TypeError as exc:
+            raise ValueError(f"Invalid cursor for sorting {sorting}: {cursor}") from exc
+        end = len(keys) if limit is None else start + limit
+        page_keys = keys[start:end]
+        datasets = self.repository.get_ordered([dataset_id for _, dataset_id in page_keys])
+
+        next_cursor = encode_cursor(page_keys[-1]) if page_keys and end < len(keys) else None
+        return datasets, next_cursor
+
+    def count(self, query_string: str, publication_type="any", sorting="newest") -> int:
+        keys = self._keys(query_string, sorting, publication_type)
+        if keys is None:
+            return self.repository.count_datasets(query_string, publication_type)
+        return len(keys)
+
+    def stream(self, query_string: str, sorting="newest", publication_type="any", batch_size=STREAM_BATCH_SIZE):
+        """
+        Genera todos los resultados de la consulta en lotes de `batch_size` datasets, cada uno con su
+        propia consulta keyset. La sesión solo guarda referencias débiles a los objetos sin cambios,
+        así que cada lote se libera al pasar al siguiente y la memoria no crece con el total.
+        """
+        if sorting == "relevance":
+            # The ranking needs every score first, the cached keys already have them in order
+            keys = self._keys(query_string, sorting, publication_type)
+            if keys is None:
+                keys = self.repository.filter_keys(query_string, sorting, publication_type)
+            batches = (
+                self.repository.get_ordered([dataset_id for _, dataset_id in keys[start:start + batch_size]])
+                for start in range(0, len(keys), batch_size)
+            )
+        else:
+            batches = self.repository.iter_ordered(query_string, sorting, publication_type, batch_size)
+
+        yield from batches
+
+    def _keys(self, query_string: str, sorting: str, publication_type: str):
+        """
+        Sort keys of the results of a query, from the cache or fetched on a miss. None when the query
+        is known to have too many results to cache.
+        """
+        cache_key = explore_cache.make_key(query_string, sorting, publication_type)
+        keys = explore_cache.get(cache_key)
+        if keys is None:
+            keys = self.repository.filter_keys(query_string, sorting, publication_type)
+            explore_cache.put(cache_key, keys)
+        return None if keys is OVERSIZED else keys
+
+    def matching_files(self, query_string: str, datasets) -> dict:
+        """Files of each dataset that contain the features and attributes the query filters by."""
+        return self.uvl_feature_repository.matching_files([ds.id for ds in datasets], feature_filters(query_string))
+
+    def facets(self, query_string: str, publication_type="any") -> dict:
+        """
+        Facet counts over the current result set, so that the UI can offer refinements
+        that are known to return results.
+        """
+        counts = {}
+        for facet, value, total in self.repository.facet_counts(query_string, publication_type):
+            counts.setdefault(facet, {})[value] = total
+
+        publication_types = []
+        for name, total in sorted(counts.get('publication_type', {}).items(), key=lambda item: -item[1]):
+            member = PublicationType[name]
+            publication_types.append({
+                "value": member.value,
+                "label": name.replace('_', ' ').title(),
+                "count": total,
+            })
+
+        return {
+            "publication_type": publication_types,
+            "tags": _ranked_values(counts.get('tag', {})),
+            "authors": _ranked_values(counts.get('author', {})),
+            "size": _bucket_values(counts.get('size', {}), SIZE_BUCKETS),
+            "models": _bucket_values(counts.get('models', {}), MODEL_BUCKETS),
+        }
+
+
+def _ranked_values(counts: dict) -> list:
+    return [
+        {"value": value, "count": total}
+        for value, total in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    ]
+
+
+def _bucket_values(counts: dict, buckets) -> list:
+    return [
+        {"value": label, "count": counts.get(label, 0), "min": minimum, "max": maximum}
+        for label, minimum, maximum in buckets
+    ]
+
+
+def _position_after(keys, after, ascending: bool) -> int:
+    """Binary search of the first key that comes after the cursor in the order of the results."""
+    after = tuple(after)
+    low, high = 0, len(keys)
+    while low < high:
+        middle = (low + high) // 2
+        if (keys[middle] <= after) if ascending else (keys[middle] >= after):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class SearchIndexService:
+    def __init__(self):
+        self.repository = SearchPostingRepository()
+
+    def index_dataset(self, dataset: DataSet, commit: bool = True):
+        """(Re)builds the posting lists of a dataset from its current metadata."""
+        self.repository.replace_for_dataset(dataset.id, dataset_postings(dataset), commit=commit)
+        explore_cache.clear()
+
+    def reindex_all(self) -> int:
+        datasets = DataSet.query.all()
+        for dataset in datasets:
+            self.index_dataset(dataset, commit=False)
+        self.repository.session.commit()
+        explore_cache.clear()
+        return len(datasets)
+
+
+class UVLFeatureIndexService:
+    def __init__(self):
+        self.repository = UVLFeatureRepository()
+
+    def index_file(self, hubfile, commit: bool = True):
+        """Parses the UVL file once and stores its features and attributes. Invalid files are indexed empty."""
+        try:
+            entries, valid = uvl_features(UVLReader(hubfile.get_path()).transform()), True
+        except Exception as exc:
+            logger.info(f"Could not index the features of file {hubfile.id}: {exc}")
+            entries, valid = set(), False
+        self.repository.replace_for_file(hubfile, hubfile.feature_model.data_set_id, entries, valid, commit=commit)
+
+    def index_dataset_files(self, dataset: DataSet):
+        for feature_model in dataset.feature_models:
+            for hubfile in feature_model.files:
+                self.index_file(hubfile, commit=False)
+        self.repository.session.commit()
+        explore_cache.clear()
 
-    def filter(self, query_string: str, sorting="newest", publication_type="any"):
-        """Filtra los datasets a partir de una cadena de consulta."""
-        # Pasa los parámetros adicionales al repositorio
-        return self.repository.filter_datasets(query_string, sorting, publication_type)
+    def index_pending(self) -> int:
+        """Indexes the files that were never parsed or changed since, so it can run repeatedly."""
+        hubfiles = self.repository.unindexed_files()
+        for hubfile in hubfiles:
+            self.index_file(hubfile, commit=False)
+        self.repository.session.commit()
+        explore_cache.clear()
+        return len(hubfiles)
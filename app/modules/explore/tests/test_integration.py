@@ -39,7 +39,7 @@ def test_user_login_and_query(test_client):
     }
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    data = response.get_json()
+    data = response.get_json()["datasets"]
     assert len(data) > 0, "No datasets found for the query."
 
     logout(test_client)
@@ -61,7 +61,7 @@ def test_user_login_and_filter_by_author(test_client):
     }
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    data = response.get_json()
+    data = response.get_json()["datasets"]
     assert len(data) == 2, "Wrong number of datasets returned for the author filter."
 
     logout(test_client)
@@ -83,7 +83,7 @@ def test_user_combined_query_filters(test_client):
     }
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    data = response.get_json()
+    data = response.get_json()["datasets"]
     assert len(data) == 1, "Wrong number of datasets for combined query filters."
 
     logout(test_client)
@@ -105,7 +105,7 @@ def test_user_login_and_filter_by_publication(test_client):
     }
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    data = response.get_json()
+    data = response.get_json()["datasets"]
     assert len(data) == 2, "Wrong number of datasets returned for the publication filter."
 
     logout(test_client)
@@ -127,7 +127,7 @@ def test_user_invalid_query(test_client):
     }
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    data = response.get_json()
+    data = response.get_json()["datasets"]
     assert len(data) == 0, "Invalid query returned results."
 
     logout(test_client)
@@ -1,7 +1,21 @@
+import json
+import re
+
 import pytest
 
-from app.modules.dataset.models import PublicationType
+from app import db
+from app.modules.auth.models import User
+from app.modules.conftest import count_queries
+from app.modules.dataset.models import DataSet, PublicationType
+from app.modules.dataset.services import DataSetService, DSDownloadRecordService, DSViewRecordService, RatingService
+from app.modules.explore.cache import ExploreResultCache, explore_cache
+from app.modules.explore.search import split_tags, tag_key, tokenize
+from app.modules.explore.models import UVLDocument
+from app.modules.explore.repositories import ExploreRepository
+from app.modules.explore.services import ExploreService, UVLFeatureIndexService
+from app.modules.stats.services import ScoreService
 from app.modules.utils.utilsdb import create_dataset_db
+from core.tracking.buffer import tracking_buffer
 
 
 @pytest.fixture(scope='module')
@@ -10,19 +24,51 @@ def test_client(test_client):
     Extends the test_client fixture to add additional specific data for module testing.
     """
     with test_client.application.app_context():
-        # Crear datasets con combinaciones válidas y consistentes con create_dataset_db
-        authors = [{"name": "Thor Odinson", "affiliation": "AI in Science", "orcid": "1111-2222"}]
-        create_dataset_db(1, authors=authors, total_file_size=100000, num_files=1, tags="tag1")
-        create_dataset_db(2, PublicationType.ANNOTATION_COLLECTION, tags="tag2", total_file_size=4000, num_files=2)
-        create_dataset_db(3, PublicationType.BOOK, tags="tag1,tag2", date="2021-03-05", total_file_size=3000,
-                          num_files=4)
-        create_dataset_db(4, authors=authors, total_file_size=50000, num_files=5, tags="tag1,tag3")
-        create_dataset_db(5, PublicationType.BOOK, tags="tag1,tag2", total_file_size=8000, num_files=3)
-        create_dataset_db(6, PublicationType.REPORT, valid=False, tags="tag3", total_file_size=2000, num_files=1)
+        create_catalog()
 
     yield test_client
 
 
+@pytest.fixture
+def own_catalog(test_client):
+    """
+    Empties the database for a test that creates or changes its own datasets, and brings back
+    the shared catalog afterwards, so that no other test depends on what it did.
+    """
+    with test_client.application.app_context():
+        reset_database()
+    yield
+    with test_client.application.app_context():
+        reset_database()
+        create_catalog()
+
+
+def create_catalog():
+    # Crear datasets con combinaciones válidas y consistentes con create_dataset_db
+    authors = [{"name": "Thor Odinson", "affiliation": "AI in Science", "orcid": "1111-2222"}]
+    create_dataset_db(1, authors=authors, total_file_size=100000, num_files=1, tags="tag1")
+    create_dataset_db(2, PublicationType.ANNOTATION_COLLECTION, tags="tag2", total_file_size=4000, num_files=2)
+    create_dataset_db(3, PublicationType.BOOK, tags="tag1,tag2", date="2021-03-05", total_file_size=3000,
+                      num_files=4)
+    create_dataset_db(4, authors=authors, total_file_size=50000, num_files=5, tags="tag1,tag3")
+    create_dataset_db(5, PublicationType.BOOK, tags="tag1,tag2", total_file_size=8000, num_files=3)
+    create_dataset_db(6, PublicationType.REPORT, valid=False, tags="tag3", total_file_size=2000, num_files=1)
+
+
+def reset_database():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    db.session.add(User(email='test@example.com', password='test1234'))
+    db.session.commit()
+    explore_cache.clear()
+    tracking_buffer.clear()
+
+
+def get_dataset(n):
+    return DataSet.query.join(DataSet.ds_meta_data).filter_by(title=f"Sample dataset {n}").one()
+
+
 def test_explore_get(test_client):
     response = test_client.get("/explore")
     assert response.status_code == 200, "The explore page could not be accessed."
@@ -32,38 +78,38 @@ def test_explore_post(test_client):
     search_criteria = get_search_criteria()
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    assert len(response.get_json()) == 6, "Wrong number of datasets"
+    assert len(response.get_json()["datasets"]) == 6, "Wrong number of datasets"
 
 
 def test_filter_by_publication_type(test_client):
     search_criteria = get_search_criteria(publication_type="book")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 2, f"Wrong number of datasets: {num}"
 
     search_criteria = get_search_criteria(publication_type="any")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets: {num}"
 
     search_criteria = get_search_criteria(publication_type="report")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets: {num}"
 
     search_criteria = get_search_criteria(publication_type="error")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets: {num}"
 
     search_criteria = get_search_criteria(publication_type="annotationcollection")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets: {num}"
 
 
@@ -71,20 +117,20 @@ def test_filter_by_query_string(test_client):
     search_criteria = get_search_criteria(query="Sample dataset 1")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets: {num}"
 
     search_criteria = get_search_criteria(query="Sample dataset 3")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets: {num}"
 
     dataset_not_exists = "Sample dataset wrong"
     search_criteria = get_search_criteria(query=dataset_not_exists)
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 0, f"Wrong number of datasets: {num}"
 
 
@@ -92,7 +138,7 @@ def test_sorting_mechanism(test_client):
     search_criteria = get_search_criteria(sorting="oldest")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets: {num}"
 
 
@@ -100,13 +146,13 @@ def test_filter_by_min_size(test_client):
     search_criteria = get_search_criteria(query="min_size:100")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets for min_size filter: {num}"
 
     search_criteria = get_search_criteria(query="min_size:50000")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 2, f"Wrong number of datasets for min_size filter: {num}"
 
 
@@ -114,13 +160,13 @@ def test_invalid_min_size_filter(test_client):
     search_criteria = get_search_criteria(query="min_size:sdw")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets for min_size filter with invalid value: {num}"
 
     search_criteria = get_search_criteria(query="min_size:")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets for min_size filter with empty value: {num}"
 
 
@@ -128,13 +174,13 @@ def test_invalid_max_size_filter(test_client):
     search_criteria = get_search_criteria(query="max_size:xyz")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets for max_size filter with invalid value: {num}"
 
     search_criteria = get_search_criteria(query="max_size:")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets for max_size filter with empty value: {num}"
 
 
@@ -142,19 +188,19 @@ def test_filter_by_max_size(test_client):
     search_criteria = get_search_criteria(query="max_size:5000")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 3, f"Wrong number of datasets for max_size filter: {num}"
 
     search_criteria = get_search_criteria(query="max_size:10000")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 4, f"Wrong number of datasets for max_size filter: {num}"
 
     search_criteria = get_search_criteria(query="max_size:100000")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets for max_size filter: {num}"
 
 
@@ -162,31 +208,31 @@ def test_filter_by_min_models(test_client):
     search_criteria = get_search_criteria(query="models_min:2")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 4, f"Wrong number of datasets for models_min filter: {num}"
 
     search_criteria = get_search_criteria(query="models_min:5")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets for models_min filter: {num}"
 
     search_criteria = get_search_criteria(query="models_min:3")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 3, f"Wrong number of datasets for models_min filter: {num}"
 
     search_criteria = get_search_criteria(query="models_min:4")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 2, f"Wrong number of datasets for models_min filter: {num}"
 
     search_criteria = get_search_criteria(query="models_min:6")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 0, f"Wrong number of datasets for models_min filter: {num}"
 
 
@@ -194,37 +240,37 @@ def test_filter_by_max_models(test_client):
     search_criteria = get_search_criteria(query="models_max:3")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 4, f"Wrong number of datasets for models_max filter: {num}"
 
     search_criteria = get_search_criteria(query="models_max:4")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 5, f"Wrong number of datasets for models_max filter: {num}"
 
     search_criteria = get_search_criteria(query="models_max:3")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 4, f"Wrong number of datasets for models_max filter: {num}"
 
     search_criteria = get_search_criteria(query="models_max:2")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 3, f"Wrong number of datasets for models_max filter: {num}"
 
     search_criteria = get_search_criteria(query="models_max:1")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 2, f"Wrong number of datasets for models_max filter: {num}"
 
     search_criteria = get_search_criteria(query="models_max:0")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 0, f"Wrong number of datasets for models_max filter: {num}"
 
 
@@ -232,31 +278,31 @@ def test_filter_by_tags(test_client):
     search_criteria = get_search_criteria(query="tags:tag1")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 4, f"Wrong number of datasets for tags filter 'tag1': {num}"
 
     search_criteria = get_search_criteria(query="tags:tag3")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 2, f"Wrong number of datasets for tags filter 'tag3': {num}"
 
     search_criteria = get_search_criteria(query="tags:tag1,tag2")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 2, f"Wrong number of datasets for tags filter 'tag1,tag2': {num}"
 
     search_criteria = get_search_criteria(query="tags:tag1,tag3")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets for tags filter 'tag1,tag3': {num}"
 
     search_criteria = get_search_criteria(query="tags:tag5")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 0, f"Wrong number of datasets for tags filter 'tag5': {num}"
 
 
@@ -264,13 +310,13 @@ def test_filter_by_author(test_client):
     search_criteria = get_search_criteria(query="author:Thor Odinson")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 2, f"Wrong number of datasets for author filter: {num}"
 
     search_criteria = get_search_criteria(query="author:Super Mario")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 0, f"Wrong number of datasets for author filter: {num}"
 
 
@@ -278,43 +324,43 @@ def test_filter_by_query_publication_type(test_client):
     search_criteria = get_search_criteria(query="publication_type:book")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 2, f"Wrong number of datasets for publication type filter: {num}"
 
     search_criteria = get_search_criteria(query="publication_type:any")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets for publication type filter: {num}"
 
     search_criteria = get_search_criteria(query="publication_type:report")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets for publication type filter: {num}"
 
     search_criteria = get_search_criteria(query="publication_type:error")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets for publication type filter: {num}"
 
     search_criteria = get_search_criteria(query="publication_type:annotationcollection")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets for publication type filter: {num}"
 
     search_criteria = get_search_criteria(query="publication_type:none")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 0, f"Wrong number of datasets for publication type filter: {num}"
 
     search_criteria = get_search_criteria(query="publication_type:")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 6, f"Wrong number of datasets for publication type filter: {num}"
 
 
@@ -322,28 +368,357 @@ def test_combined_query_filters(test_client):
     search_criteria = get_search_criteria(query="min_size:100;models_max:2;tags:tag1;author:Thor Odinson")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets for combined query filters: {num}"
 
     search_criteria = get_search_criteria(query="min_size:100;models_max:2;tags:tag1;author:Super Mario")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 0, f"Wrong number of datasets for combined query filters: {num}"
 
     search_criteria = get_search_criteria(query="max_size:5000;models_min:1;tags:tag3")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets for combined query filters: {num}"
 
     search_criteria = get_search_criteria(query="min_size:5000;models_min:4;tags:tag1,tag3;author:Thor Odinson")
     response = test_client.post("/explore", json=search_criteria)
     assert response.status_code == 200, "The explore page could not be accessed."
-    num = len(response.get_json())
+    num = len(response.get_json()["datasets"])
     assert num == 1, f"Wrong number of datasets for combined query filters: {num}"
 
 
+def test_size_and_model_filters_run_in_a_single_query(test_client):
+    with test_client.application.app_context():
+        explore_cache.clear()
+        with count_queries() as statements:
+            datasets, _ = ExploreService().filter("min_size:3000;max_size:60000;models_min:2;models_max:5")
+        assert sorted(dataset.id for dataset in datasets) == [2, 3, 4, 5]
+        # One query filters the sort keys and another one loads the datasets of the page
+        assert len(statements) == 2, f"Size and model filters must not query per dataset: {len(statements)}"
+
+
+def test_pagination_with_cursor(test_client):
+    search_criteria = get_search_criteria(sorting="oldest")
+    search_criteria["page_size"] = 4
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    first_page = response.get_json()
+    assert first_page["total"] == 6, f"Wrong total of datasets: {first_page['total']}"
+    assert len(first_page["datasets"]) == 4, "The page size was not applied."
+    assert first_page["next_cursor"], "A cursor is expected when there are more results."
+
+    search_criteria["cursor"] = first_page["next_cursor"]
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    second_page = response.get_json()
+    assert len(second_page["datasets"]) == 2, "Wrong number of datasets in the last page."
+    assert second_page["next_cursor"] is None, "The last page must not return a cursor."
+    assert "total" not in second_page, "The total is only computed for the first page."
+
+    ids = [dataset["id"] for dataset in first_page["datasets"] + second_page["datasets"]]
+    assert len(set(ids)) == 6, "Pages must not overlap."
+    assert first_page["datasets"][0]["title"] == "Sample dataset 3", "The oldest dataset must come first."
+
+
+def test_pagination_with_invalid_cursor(test_client):
+    search_criteria = get_search_criteria()
+    search_criteria["cursor"] = "not-a-cursor"
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 400, "An invalid cursor must be rejected."
+
+
+def test_tokenize_normalizes_text():
+    assert tokenize("Café-Racer, UVL 2.0!") == ["cafe", "racer", "uvl", "2", "0"]
+    assert split_tags(" ML , Machine Learning,,") == ["ML", "Machine Learning"]
+    assert [tag_key(tag) for tag in split_tags("Café, CAFE")] == ["cafe", "cafe"]
+
+
+def test_filter_by_tags_is_exact(test_client):
+    search_criteria = get_search_criteria(query="tags:tag")
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    num = len(response.get_json()["datasets"])
+    assert num == 0, f"A partial tag must not match whole tags: {num}"
+
+
+def test_filter_by_prefix_of_last_term(test_client):
+    search_criteria = get_search_criteria(query="Odins")
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    num = len(response.get_json()["datasets"])
+    assert num == 2, f"Wrong number of datasets for a prefix query: {num}"
+
+
+def test_sorting_by_relevance(test_client, own_catalog):
+    with test_client.application.app_context():
+        for n, title, description in (
+            (1, "Zephyr feature models", "Models of a product line"),
+            (2, "Feature models of cars", "The zephyr is only in this description"),
+            (3, "Zephyr models", "A zephyr product line"),
+            (4, "Unrelated feature models", "Nothing to see here"),
+        ):
+            create_dataset_db(n)
+            DataSetService().update_dsmetadata(get_dataset(n).ds_meta_data_id, title=title, description=description)
+
+    search_criteria = get_search_criteria(query="zephyr", sorting="relevance")
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    titles = [dataset["title"] for dataset in response.get_json()["datasets"]]
+    # BM25 over the weighted fields: title and description > title > description only
+    assert titles == ["Zephyr models", "Zephyr feature models", "Feature models of cars"]
+
+
+def test_search_finds_non_latin_text(test_client, own_catalog):
+    with test_client.application.app_context():
+        for n, title in ((1, "Модели автомобилей"), (2, "特征模型"), (3, "Μοντέλα χαρακτηριστικών")):
+            create_dataset_db(n)
+            DataSetService().update_dsmetadata(get_dataset(n).ds_meta_data_id, title=title)
+
+    for query, expected in (
+        ("модели", "Модели автомобилей"), ("特征模型", "特征模型"), ("title:μοντελα", "Μοντέλα χαρακτηριστικών")
+    ):
+        response = test_client.post("/explore", json=get_search_criteria(query=query))
+        assert response.status_code == 200, "The explore page could not be accessed."
+        assert [dataset["title"] for dataset in response.get_json()["datasets"]] == [expected], query
+
+
+def test_query_without_terms_matches_nothing(test_client):
+    for query in ("-", "+++", "title:!!", "author:?"):
+        response = test_client.post("/explore", json=get_search_criteria(query=query))
+        assert response.status_code == 200, "The explore page could not be accessed."
+        assert response.get_json()["datasets"] == [], f"A query without terms must not match: {query}"
+        assert response.get_json()["total"] == 0
+
+
+def test_index_is_updated_with_metadata(test_client, own_catalog):
+    with test_client.application.app_context():
+        create_dataset_db(1)
+        create_dataset_db(2)
+        assert ExploreService().filter("quantum")[0] == []
+        DataSetService().update_dsmetadata(get_dataset(2).ds_meta_data_id, title="Sample dataset 2 quantum")
+
+    search_criteria = get_search_criteria(query="quantum")
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    titles = [dataset["title"] for dataset in response.get_json()["datasets"]]
+    assert titles == ["Sample dataset 2 quantum"]
+
+
+def test_facets_over_the_result_set(test_client):
+    search_criteria = get_search_criteria(query="tags:tag1")
+    search_criteria["facets"] = True
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    facets = response.get_json()["facets"]
+
+    assert [(tag["value"], tag["count"]) for tag in facets["tags"]] == [("tag1", 4), ("tag2", 2), ("tag3", 1)]
+    assert facets["authors"][0] == {"value": "Thor Odinson", "count": 2}
+    assert {item["value"]: item["count"] for item in facets["publication_type"]} == {
+        "datamanagementplan": 2, "book": 2
+    }
+    assert [bucket["count"] for bucket in facets["size"]] == [2, 2, 0, 0]
+    assert [bucket["count"] for bucket in facets["models"]] == [1, 2, 1, 0]
+
+
+def test_facets_are_computed_in_a_single_query(test_client):
+    with test_client.application.app_context():
+        with count_queries() as statements:
+            facets = ExploreService().facets("")
+        assert len(statements) == 1, f"Facets must come from one aggregation: {len(statements)}"
+        assert sum(item["count"] for item in facets["publication_type"]) == 6
+
+
+def test_facets_keep_the_top_values_of_each_facet(test_client):
+    with test_client.application.app_context():
+        # Runs on the configured database engine, MySQL 5.7 in CI: no CTE nor window function
+        with count_queries() as statements:
+            rows = ExploreRepository().facet_counts("", top=1)
+        assert len(statements) == 1
+        assert not re.search(r"\bWITH\b|\bOVER\s*\(", statements[0], re.IGNORECASE)
+
+        facets = {}
+        for facet, value, total in rows:
+            facets.setdefault(facet, []).append((value, total))
+        assert all(len(values) == 1 for values in facets.values()), facets
+        assert facets["tag"] == [("tag1", 4)]
+        assert facets["author"] == [("Thor Odinson", 2)]
+        assert facets["size"] == [("Up to 10 KB", 4)]
+
+
+def test_filter_by_uvl_feature(test_client):
+    search_criteria = get_search_criteria(query='feature:"Data Storage"')
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    datasets = response.get_json()["datasets"]
+    # The file of dataset 6 is not a valid UVL model, so it has no features
+    assert sorted(dataset["title"] for dataset in datasets) == [
+        "Sample dataset 1", "Sample dataset 2", "Sample dataset 3", "Sample dataset 4", "Sample dataset 5"
+    ]
+    assert all(dataset["matching_files"] for dataset in datasets)
+
+    search_criteria = get_search_criteria(query="feature:Encryption")
+    response = test_client.post("/explore", json=search_criteria)
+    assert len(response.get_json()["datasets"]) == 0, "Only features inside the UVL files must match."
+
+
+def test_uvl_files_are_parsed_once(test_client):
+    with test_client.application.app_context():
+        assert UVLFeatureIndexService().index_pending() == 0
+        assert UVLDocument.query.filter_by(valid=False).count() == 1
+
+
+def test_stream_mode_returns_every_dataset_as_ndjson(test_client):
+    for sorting in ("oldest", "relevance"):
+        search_criteria = get_search_criteria(query="tag1", sorting=sorting)
+        response = test_client.post("/explore", json=search_criteria)
+        expected = response.get_json()["datasets"]
+
+        search_criteria["stream"] = True
+        response = test_client.post("/explore", json=search_criteria)
+        assert response.status_code == 200, "The explore page could not be accessed."
+        assert response.mimetype == "application/x-ndjson"
+        streamed = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert streamed == expected, f"The streamed datasets differ from the paginated ones ({sorting})"
+
+
+def test_stream_reads_the_results_in_batches(test_client):
+    with test_client.application.app_context():
+        batches = list(ExploreService().stream("", sorting="newest", batch_size=4))
+    assert [len(batch) for batch in batches] == [4, 2]
+
+
+def test_stream_serializes_between_batches(test_client):
+    with test_client.application.app_context():
+        service = ExploreService()
+        for sorting in ("newest", "oldest", "downloads"):
+            expected = [ds.id for ds in service.filter("", sorting=sorting)[0]]
+            streamed = []
+            # Serializing runs queries on the same connection before the next batch is read
+            for batch in service.stream("", sorting=sorting, batch_size=2):
+                assert len(batch) <= 2
+                streamed.extend(dataset["id"] for dataset in DataSetService().serialize(batch))
+            assert len(expected) > 2
+            assert streamed == expected, f"The streamed datasets differ from the paginated ones ({sorting})"
+
+
+def test_repeated_query_is_served_from_cache(test_client):
+    with test_client.application.app_context():
+        explore_cache.clear()
+        ExploreService().filter("tags:tag1", sorting="oldest", limit=2)
+        hits = explore_cache.stats()["hits"]
+        with count_queries() as statements:
+            datasets, next_cursor = ExploreService().filter(" TAGS:tag1 ", sorting="oldest", limit=2)
+            next_page, _ = ExploreService().filter("tags:tag1", sorting="oldest", cursor=next_cursor, limit=2)
+        assert explore_cache.stats()["hits"] == hits + 2
+        assert len(statements) == 2, "Only the datasets of each page should be loaded on a cache hit."
+        assert [ds.ds_meta_data.title for ds in datasets + next_page] == [
+            "Sample dataset 3", "Sample dataset 1", "Sample dataset 4", "Sample dataset 5"
+        ]
+
+
+def test_cache_is_invalidated_when_the_catalog_changes(test_client, own_catalog):
+    with test_client.application.app_context():
+        create_dataset_db(1, tags="tag3")
+        ExploreService().filter("tags:tag3")
+        assert explore_cache.stats()["entries"] > 0
+        create_dataset_db(2, tags="tag3")
+        assert explore_cache.stats()["entries"] == 0
+        datasets, _ = ExploreService().filter("tags:tag3")
+        assert len(datasets) == 2
+
+    response = test_client.get("/explore/cache")
+    assert response.status_code == 200
+    assert set(response.get_json()) >= {"hits", "misses", "entries", "bytes"}
+
+
+def test_cache_evicts_least_recently_used_entries():
+    cache = ExploreResultCache(max_bytes=ExploreResultCache.estimate_size([(1.0, 1)] * 10) * 2, ttl=60)
+    cache.put("a", [(1.0, 1)] * 10)
+    cache.put("b", [(1.0, 2)] * 10)
+    assert cache.get("a") is not None
+    cache.put("c", [(1.0, 3)] * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_queries_too_large_to_cache_are_paged_in_sql(test_client):
+    with test_client.application.app_context():
+        service = ExploreService()
+        max_bytes = explore_cache.max_bytes
+        try:
+            for query, sorting in (("", "newest"), ("", "oldest"), ("", "downloads"), ("tag1", "relevance")):
+                explore_cache.clear()
+                explore_cache.max_bytes = max_bytes
+                expected = [ds.id for ds in service.filter(query, sorting=sorting)[0]]
+
+                explore_cache.clear()
+                explore_cache.max_bytes = 0
+                pages, cursor = [], None
+                while True:
+                    datasets, cursor = service.filter(query, sorting=sorting, cursor=cursor, limit=2)
+                    pages.append([ds.id for ds in datasets])
+                    if cursor is None:
+                        break
+                assert sum(pages, []) == expected, f"Keyset pages differ from the cached ones ({sorting})"
+                assert all(len(page) == 2 for page in pages[:-1])
+                assert service.count(query, sorting=sorting) == len(expected)
+                assert explore_cache.stats()["bytes"] < ExploreResultCache.estimate_size([(1.0, 1)])
+        finally:
+            explore_cache.max_bytes = max_bytes
+            explore_cache.clear()
+
+
+def test_sorting_by_popularity_scores(test_client, own_catalog):
+    with test_client.application.test_request_context():
+        for n in (3, 4, 5):
+            create_dataset_db(n)
+        ids = {n: get_dataset(n).id for n in (4, 5)}
+        user_id = User.query.first().id
+        for cookie in ("p1", "p2", "p3"):
+            DSDownloadRecordService().track(ids[4], cookie)
+        DSDownloadRecordService().track(ids[5], "p1")
+        # Una descarga ya guardada que el proceso no recuerda no suma otra vez
+        tracking_buffer.clear()
+        DSDownloadRecordService().track(ids[4], "p1")
+        # Sin cookie en la petición cada vista es de un visitante nuevo
+        for _ in range(2):
+            DSViewRecordService().create_cookie(db.session.get(DataSet, ids[5]))
+        RatingService.add_rating(user_id, ids[5], 5)
+        RatingService.add_rating(user_id, ids[4], 2)
+        explore_cache.clear()
+
+    def first_titles(sorting):
+        response = test_client.post("/explore", json=get_search_criteria(sorting=sorting))
+        assert response.status_code == 200
+        return [dataset["title"] for dataset in response.get_json()["datasets"]][:2]
+
+    assert first_titles("downloads") == ["Sample dataset 4", "Sample dataset 5"]
+    assert first_titles("views")[0] == "Sample dataset 5"
+    assert first_titles("rating") == ["Sample dataset 5", "Sample dataset 4"]
+    assert first_titles("trending") == ["Sample dataset 4", "Sample dataset 5"]
+
+    with test_client.application.app_context():
+        # Los cursores de las ordenaciones por puntuación también paginan
+        first_page, next_cursor = ExploreService().filter("", sorting="trending", limit=1)
+        second_page, _ = ExploreService().filter("", sorting="trending", cursor=next_cursor, limit=1)
+        assert [first_page[0].id, second_page[0].id] == [ids[4], ids[5]]
+
+        # Recalcular desde los registros da las mismas puntuaciones que las actualizaciones incrementales
+        scores = {n: (ds.download_count, ds.view_count, ds.rating_score) for n, ds in
+                  ((n, db.session.get(DataSet, dataset_id)) for n, dataset_id in ids.items())}
+        ScoreService().rebuild()
+        db.session.expire_all()
+        assert scores == {n: (ds.download_count, ds.view_count, ds.rating_score) for n, ds in
+                          ((n, db.session.get(DataSet, dataset_id)) for n, dataset_id in ids.items())}
+        assert scores[4] == (3, 0, 2.0)
+        explore_cache.clear()
+    assert first_titles("trending") == ["Sample dataset 4", "Sample dataset 5"]
+
+
 def get_search_criteria(query="", sorting="newest", publication_type="any", uvl_min="", uvl_max=""):
     search_criteria = {
         "max_uvl": uvl_max,
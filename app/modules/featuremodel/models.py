@@ -1,7 +1,15 @@
 from app import db
 from sqlalchemy import Enum as SQLAlchemyEnum
 
-from app.modules.dataset.models import Author, PublicationType
+from app.modules.dataset.models import Author, PublicationType, Tag
+
+
+fm_meta_data_tag = db.Table(
+    'fm_meta_data_tag',
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('fm_meta_data_id', db.Integer, db.ForeignKey('fm_meta_data.id', ondelete='CASCADE'),
+              primary_key=True, index=True),
+)
 
 
 class FeatureModel(db.Model):
@@ -11,6 +19,10 @@ class FeatureModel(db.Model):
     files = db.relationship('Hubfile', backref='feature_model', lazy=True, cascade="all, delete")
     fm_meta_data = db.relationship('FMMetaData', uselist=False, backref='feature_model', cascade="all, delete")
 
+    # Suma y número de valoraciones, mantenidos por RatingService al valorar
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     def __repr__(self):
         return f'FeatureModel<{self.id}>'
 
@@ -22,12 +34,20 @@ class FMMetaData(db.Model):
     description = db.Column(db.Text, nullable=False)
     publication_type = db.Column(SQLAlchemyEnum(PublicationType), nullable=False)
     publication_doi = db.Column(db.String(120))
-    tags = db.Column(db.String(120))
     uvl_version = db.Column(db.String(120))
     fm_metrics_id = db.Column(db.Integer, db.ForeignKey('fm_metrics.id'))
     fm_metrics = db.relationship('FMMetrics', uselist=False, backref='fm_meta_data')
     authors = db.relationship('Author', backref='fm_metadata', lazy=True, cascade="all, delete",
                               foreign_keys=[Author.fm_meta_data_id])
+    tag_list = db.relationship('Tag', secondary=fm_meta_data_tag, order_by='Tag.key', lazy=True)
+
+    @property
+    def tags(self) -> str:
+        return ', '.join(tag.name for tag in self.tag_list)
+
+    @tags.setter
+    def tags(self, value):
+        self.tag_list = Tag.from_string(value)
 
     def __repr__(self):
         return f'FMMetaData<{self.title}'
@@ -0,0 +1,117 @@
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobStore:
+    """
+    Content-addressed storage of the uploaded files. Each distinct content is stored once, named after
+    its SHA-256, and the file of every dataset that has it is a hardlink to that blob. The folders of the
+    datasets keep their layout, so archives, nginx and the Zenodo uploads read them as before, while the
+    disk (and the backups) only hold every content once.
+
+    The number of links of a blob tells whether a dataset folder still uses it, so a blob is garbage once
+    it has no other link and no file references it in the database.
+    """
+
+    PARTIAL_MAX_AGE = 3600
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    @property
+    def directory(self) -> str:
+        # Inside the uploads folder by default, as hardlinks cannot cross filesystems
+        return self._directory or os.path.join(os.getenv('WORKING_DIR', ''), 'uploads', '.blobs')
+
+    @staticmethod
+    def digest(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.isfile(self.path(digest))
+
+    def store(self, source: str, destination: str, move: bool = False, digest: str = None) -> str:
+        """
+        Stores the content of `source` (unless it is already stored) and makes `destination` a link to it.
+        With `move` the source is consumed. `source` and `destination` may be the same path, to bring a
+        file that is already in place into the store. `digest` saves reading the source when its SHA-256
+        is already known. Returns the digest of the content.
+        """
+        digest = digest or self.digest(source)
+        blob = self.path(digest)
+
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            partial = f"{blob}.{uuid.uuid4().hex}.partial"
+            if move and os.path.abspath(source) != os.path.abspath(destination):
+                shutil.move(source, partial)
+            else:
+                shutil.copyfile(source, partial)
+            # Blobs are shared by several datasets, they must never be modified in place
+            os.chmod(partial, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(partial, blob)
+        elif move and os.path.abspath(source) != os.path.abspath(destination):
+            os.remove(source)
+
+        self.link(blob, destination)
+        return digest
+
+    @staticmethod
+    def link(blob: str, destination: str):
+        if os.path.exists(destination) and os.path.samefile(blob, destination):
+            return
+        os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+        partial = f"{destination}.{uuid.uuid4().hex}.partial"
+        try:
+            os.link(blob, partial)
+        except OSError as exc:
+            # Filesystems without hardlinks get a plain copy, which works but is not deduplicated
+            logger.warning(f"{destination} could not be linked to {blob}, copying it: {exc}")
+            shutil.copyfile(blob, partial)
+        os.replace(partial, destination)
+
+    def collect_garbage(self, referenced) -> tuple:
+        """
+        Removes the blobs that no dataset folder links to and whose digest is not in `referenced`,
+        along with the partial blobs left behind by interrupted uploads. Blobs changed in the last
+        `PARTIAL_MAX_AGE` seconds are kept. Returns (blobs, bytes) removed.
+        """
+        removed, freed = 0, 0
+        now = time.time()
+        for subdir, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(subdir, name)
+                try:
+                    file_stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                # Recent blobs may still be waiting for their link or for the file that references them
+                if now - file_stat.st_ctime < self.PARTIAL_MAX_AGE:
+                    continue
+                if name.endswith('.partial') or (file_stat.st_nlink <= 1 and name not in referenced):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                    removed += 1
+                    freed += file_stat.st_size
+        return removed, freed
+
+
+blob_store = BlobStore(directory=os.getenv('BLOB_STORE_DIR'))
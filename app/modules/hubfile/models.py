@@ -11,6 +11,8 @@ class Hubfile(db.Model):
     name = db.Column(db.String(120), nullable=False)
     checksum = db.Column(db.String(120), nullable=False)
     size = db.Column(db.Integer, nullable=False)
+    # SHA-256 of the content in the blob store, None for files that are not stored there yet
+    blob = db.Column(db.String(64), nullable=True, index=True)
     feature_model_id = db.Column(db.Integer, db.ForeignKey('feature_model.id'), nullable=False)
 
     def get_formatted_size(self):
@@ -45,10 +47,15 @@ class Hubfile(db.Model):
 
 class HubfileViewRecord(db.Model):
     __tablename__ = 'file_view_record'
+    # Los NULL no chocan en un índice único, así que los anónimos se indexan con user_key = 0
+    __table_args__ = (
+        db.UniqueConstraint('file_id', 'user_key', 'view_cookie', name='uq_file_view_record_key'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    user_key = db.Column(db.Integer, db.Computed('coalesce(user_id, 0)', persisted=True))
     file_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=False)
-    view_date = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    view_date = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
     view_cookie = db.Column(db.String(36))
 
     def __repr__(self):
@@ -57,10 +64,14 @@ class HubfileViewRecord(db.Model):
 
 class HubfileDownloadRecord(db.Model):
     __tablename__ = 'file_download_record'
+    __table_args__ = (
+        db.UniqueConstraint('file_id', 'user_key', 'download_cookie', name='uq_file_download_record_key'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    user_key = db.Column(db.Integer, db.Computed('coalesce(user_id, 0)', persisted=True))
     file_id = db.Column(db.Integer, db.ForeignKey('file.id'))
-    download_date = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    download_date = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
     download_cookie = db.Column(db.String(36), nullable=False)
 
     def __repr__(self):
@@ -1,4 +1,3 @@
-from sqlalchemy import func
 from app.modules.auth.models import User
 from app.modules.dataset.models import DataSet
 from app.modules.featuremodel.models import FeatureModel
@@ -24,14 +23,19 @@ class HubfileRepository(BaseRepository):
     def get_dataset_by_hubfile(self, hubfile: Hubfile) -> DataSet:
         return db.session.query(DataSet).join(FeatureModel).join(Hubfile).filter(Hubfile.id == hubfile.id).first()
 
+    def referenced_blobs(self) -> set:
+        return set(db.session.scalars(db.select(Hubfile.blob).where(Hubfile.blob.isnot(None)).distinct()))
+
+    def without_blob(self) -> list:
+        return Hubfile.query.filter(Hubfile.blob.is_(None)).all()
+
 
 class HubfileViewRecordRepository(BaseRepository):
     def __init__(self):
         super().__init__(HubfileViewRecord)
 
     def total_hubfile_views(self) -> int:
-        max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
-        return max_id if max_id is not None else 0
+        return self.model.query.count()
 
 
 class HubfileDownloadRecordRepository(BaseRepository):
@@ -39,5 +43,4 @@ class HubfileDownloadRecordRepository(BaseRepository):
         super().__init__(HubfileDownloadRecord)
 
     def total_hubfile_downloads(self) -> int:
-        max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
-        return max_id if max_id is not None else 0
+        return self.model.query.count()
@@ -1,13 +1,15 @@
-from datetime import datetime, timezone
 import os
 import uuid
-from flask import current_app, jsonify, make_response, request, send_from_directory
-from flask_login import current_user
+from flask import abort, current_app, jsonify, make_response, request
+from werkzeug.security import safe_join
 from app.modules.hubfile import hubfile_bp
-from app.modules.hubfile.models import HubfileDownloadRecord, HubfileViewRecord
-from app.modules.hubfile.services import HubfileDownloadRecordService, HubfileService
-
-from app import db
+from app.modules.hubfile.services import (
+    VIEW_MAX_LINES,
+    VIEW_PAGE_LINES,
+    HubfileDownloadRecordService,
+    HubfileService
+)
+from core.delivery.accel import send_upload
 
 
 @hubfile_bp.route("/file/download/<int:file_id>", methods=["GET"])
@@ -24,26 +26,18 @@ def download_file(file_id):
     if not user_cookie:
         user_cookie = str(uuid.uuid4())
 
-    # Check if the download record already exists for this cookie
-    existing_record = HubfileDownloadRecord.query.filter_by(
-        user_id=current_user.id if current_user.is_authenticated else None,
-        file_id=file_id,
-        download_cookie=user_cookie
-    ).first()
-
-    if not existing_record:
-        # Record the download in your database
-        HubfileDownloadRecordService().create(
-            user_id=current_user.id if current_user.is_authenticated else None,
-            file_id=file_id,
-            download_date=datetime.now(timezone.utc),
-            download_cookie=user_cookie,
-        )
+    # The stored checksum is a strong ETag: If-None-Match gets a 304 and Range requests a 206
+    # With ACCEL_REDIRECT_LOCATION set, nginx sends the file (and its own ETag) once the download is recorded
+    path = safe_join(file_path, filename)
+    if path is None:
+        abort(404)
+    resp = send_upload(path, filename, etag=file.checksum)
+
+    # A revalidation of a copy the client already has is not a new download
+    if resp.status_code != 304:
+        HubfileDownloadRecordService().track(file_id, user_cookie)
 
     # Save the cookie to the user's browser
-    resp = make_response(
-        send_from_directory(directory=file_path, path=filename, as_attachment=True)
-    )
     resp.set_cookie("file_download_cookie", user_cookie)
 
     return resp
@@ -51,42 +45,31 @@ def download_file(file_id):
 
 @hubfile_bp.route('/file/view/<int:file_id>', methods=['GET'])
 def view_file(file_id):
-    file = HubfileService().get_or_404(file_id)
-    filename = file.name
+    hubfile_service = HubfileService()
+    file = hubfile_service.get_or_404(file_id)
+    file_path = hubfile_service.get_path_by_hubfile(file)
 
-    directory_path = f"uploads/user_{file.feature_model.data_set.user_id}/dataset_{file.feature_model.data_set_id}/"
-    parent_directory_path = os.path.dirname(current_app.root_path)
-    file_path = os.path.join(parent_directory_path, directory_path, filename)
+    # The content is sent by pages of lines: `offset` is the byte where the page starts and `lines` its length
+    offset = request.args.get('offset', 0, type=int)
+    lines = request.args.get('lines', VIEW_PAGE_LINES, type=int)
+    if offset < 0 or not 0 < lines <= VIEW_MAX_LINES:
+        error = f'offset must be >= 0 and lines between 1 and {VIEW_MAX_LINES}'
+        return jsonify({'success': False, 'error': error}), 400
 
     try:
         if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                content = f.read()
+            page = hubfile_service.read_lines(file_path, offset=offset, lines=lines)
 
             user_cookie = request.cookies.get('view_cookie')
             if not user_cookie:
                 user_cookie = str(uuid.uuid4())
 
-            # Check if the view record already exists for this cookie
-            existing_record = HubfileViewRecord.query.filter_by(
-                user_id=current_user.id if current_user.is_authenticated else None,
-                file_id=file_id,
-                view_cookie=user_cookie
-            ).first()
-
-            if not existing_record:
-                # Register file view
-                new_view_record = HubfileViewRecord(
-                    user_id=current_user.id if current_user.is_authenticated else None,
-                    file_id=file_id,
-                    view_date=datetime.now(),
-                    view_cookie=user_cookie
-                )
-                db.session.add(new_view_record)
-                db.session.commit()
+            # Only the first page is a new view
+            if offset == 0:
+                hubfile_service.track_view(file_id, user_cookie)
 
             # Prepare response
-            response = jsonify({'success': True, 'content': content})
+            response = jsonify({'success': True, **page})
             if not request.cookies.get('view_cookie'):
                 response = make_response(response)
                 response.set_cookie('view_cookie', user_cookie, max_age=60*60*24*365*2)
@@ -1,13 +1,26 @@
+from datetime import datetime, timezone
+import logging
 import os
+
+from flask_login import current_user
+
 from app.modules.auth.models import User
 from app.modules.dataset.models import DataSet
-from app.modules.hubfile.models import Hubfile
+from app.modules.hubfile.blobs import blob_store
+from app.modules.hubfile.models import Hubfile, HubfileDownloadRecord, HubfileViewRecord
 from app.modules.hubfile.repositories import (
     HubfileDownloadRecordRepository,
     HubfileRepository,
     HubfileViewRecordRepository
 )
 from core.services.BaseService import BaseService
+from core.tracking.buffer import tracking_buffer
+
+logger = logging.getLogger(__name__)
+
+VIEW_PAGE_LINES = 500
+VIEW_MAX_LINES = 5000
+VIEW_PAGE_BYTES = 256 * 1024
 
 
 class HubfileService(BaseService):
@@ -26,7 +39,7 @@ class HubfileService(BaseService):
 
         hubfile_user = self.get_owner_user_by_hubfile(hubfile)
         hubfile_dataset = self.get_dataset_by_hubfile(hubfile)
-        working_dir = os.getenv('WORKING_DIR')
+        working_dir = os.getenv('WORKING_DIR', '')
 
         path = os.path.join(working_dir,
                             'uploads',
@@ -34,8 +47,76 @@ class HubfileService(BaseService):
                             f'dataset_{hubfile_dataset.id}',
                             hubfile.name)
 
+        # The file of the dataset is a link to its blob, which is still found if the link is missing
+        if not os.path.exists(path) and hubfile.blob and blob_store.exists(hubfile.blob):
+            return blob_store.path(hubfile.blob)
+
         return path
 
+    @staticmethod
+    def read_lines(path: str, offset: int = 0, lines: int = VIEW_PAGE_LINES, max_bytes: int = VIEW_PAGE_BYTES) -> dict:
+        """
+        Reads up to `lines` lines (and at most `max_bytes`) of a text file, starting at the byte `offset`.
+        `next_offset` is where the next page starts, or None at the end of the file. Only that page is held
+        in memory, so large models are loaded by pages instead of in a single response.
+        """
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            chunks, read = [], 0
+            while len(chunks) < lines and read < max_bytes:
+                line = file.readline(max_bytes - read)
+                if not line:
+                    break
+                chunks.append(line)
+                read += len(line)
+            data = b''.join(chunks)
+
+        if read >= max_bytes and not data.endswith(b'\n'):
+            # A line longer than the page is cut, but never in the middle of a UTF-8 character
+            cut = len(data)
+            while cut > len(data) - 4 and cut > 0 and data[cut - 1] & 0xC0 == 0x80:
+                cut -= 1
+            if cut > 0 and data[cut - 1] & 0xC0 == 0xC0:
+                cut -= 1
+            data = data[:cut] or data
+
+        next_offset = offset + len(data)
+        return {
+            'content': data.decode('utf-8', errors='replace'),
+            'offset': offset,
+            'next_offset': next_offset if next_offset < size else None,
+            'lines': len(chunks),
+            'size': size,
+        }
+
+    def store_blobs(self) -> int:
+        """Moves the files that are not in the blob store yet into it. Returns how many were stored."""
+        stored = 0
+        for hubfile in self.repository.without_blob():
+            path = self.get_path_by_hubfile(hubfile)
+            if not os.path.isfile(path):
+                logger.warning(f"{path} not found, file {hubfile.id} is not stored in the blob store")
+                continue
+            hubfile.blob = blob_store.store(path, path)
+            stored += 1
+        self.repository.session.commit()
+        return stored
+
+    def collect_garbage(self) -> tuple:
+        return blob_store.collect_garbage(self.repository.referenced_blobs())
+
+    def track_view(self, file_id: int, user_cookie: str):
+        # Stored by the tracking buffer, which also discards the repeated views of a cookie
+        tracking_buffer.track(
+            HubfileViewRecord,
+            unique=('user_id', 'file_id', 'view_cookie'),
+            user_id=current_user.id if current_user.is_authenticated else None,
+            file_id=file_id,
+            view_date=datetime.now(timezone.utc),
+            view_cookie=user_cookie,
+        )
+
     def total_hubfile_views(self) -> int:
         return self.hubfile_view_record_repository.total_hubfile_views()
 
@@ -47,3 +128,13 @@ class HubfileService(BaseService):
 class HubfileDownloadRecordService(BaseService):
     def __init__(self):
         super().__init__(HubfileDownloadRecordRepository())
+
+    def track(self, file_id: int, user_cookie: str):
+        tracking_buffer.track(
+            HubfileDownloadRecord,
+            unique=('user_id', 'file_id', 'download_cookie'),
+            user_id=current_user.id if current_user.is_authenticated else None,
+            file_id=file_id,
+            download_date=datetime.now(timezone.utc),
+            download_cookie=user_cookie,
+        )
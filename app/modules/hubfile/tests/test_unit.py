@@ -1,5 +1,17 @@
+import os
+import re
+import shutil
+from unittest.mock import patch
+
 import pytest
 
+from app.modules.dataset.models import DataSet
+from app.modules.hubfile.blobs import BlobStore, blob_store
+from app.modules.hubfile.models import HubfileDownloadRecord, HubfileViewRecord
+from app.modules.hubfile.services import HubfileService
+from app.modules.utils.utilsdb import create_dataset_db
+from core.delivery.accel import nginx_etag
+
 
 @pytest.fixture(scope='module')
 def test_client(test_client):
@@ -22,3 +34,147 @@ def test_sample_assertion(test_client):
     """
     greeting = "Hello, World!"
     assert greeting == "Hello, World!", "The greeting does not coincide with 'Hello, World!'"
+
+
+def test_download_file_is_conditional(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(501, num_files=1)
+        hubfile = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 501").one().files()[0]
+        file_id, checksum = hubfile.id, hubfile.checksum
+
+    response = test_client.get(f"/file/download/{file_id}")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{checksum}"'
+    data = response.get_data()
+    response.close()
+
+    response = test_client.get(f"/file/download/{file_id}", headers={"If-None-Match": f'"{checksum}"'})
+    assert response.status_code == 304
+
+    response = test_client.get(f"/file/download/{file_id}", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.get_data() == data[:10]
+    response.close()
+
+    with test_client.application.app_context():
+        assert HubfileDownloadRecord.query.filter_by(file_id=file_id).count() == 1
+
+
+def test_download_file_is_handed_to_nginx(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(502, num_files=1)
+        dataset = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 502").one()
+        hubfile = dataset.files()[0]
+        file_id, name = hubfile.id, hubfile.name
+        expected = f"/_uploads/user_{dataset.user_id}/dataset_{dataset.id}/{name}"
+        etag = nginx_etag(os.path.join("uploads", f"user_{dataset.user_id}", f"dataset_{dataset.id}", name))
+
+    with patch.dict(os.environ, {"ACCEL_REDIRECT_LOCATION": "/_uploads/"}):
+        response = test_client.get(f"/file/download/{file_id}")
+        assert response.status_code == 200
+        assert response.headers["X-Accel-Redirect"] == expected
+        assert "ETag" not in response.headers, "nginx sends its own ETag, the one it matches against If-Range"
+        assert name in response.headers["Content-Disposition"]
+        assert not response.get_data(), "nginx sends the body"
+
+        response = test_client.get(f"/file/download/{file_id}", headers={"If-None-Match": f'"{etag}"'})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == f'"{etag}"'
+        assert "X-Accel-Redirect" not in response.headers
+
+    with test_client.application.app_context():
+        assert HubfileDownloadRecord.query.filter_by(file_id=file_id).count() == 1
+
+
+@pytest.mark.parametrize(
+    "config", ["nginx.prod.conf", "nginx.prod.ssl.conf.template", "nginx.prod.no-ssl.conf.template"]
+)
+def test_nginx_keeps_its_own_validators_for_uploads(config):
+    # With "etag off" nginx cannot evaluate If-Range and answers a resumed download with the whole file
+    with open(os.path.join("docker", "nginx", config)) as f:
+        block = re.search(r"location /_uploads/ \{(.*?)\}", f.read(), re.S).group(1)
+    directives = [line.split("#")[0].strip() for line in block.splitlines()]
+    assert "internal;" in directives
+    assert not [d for d in directives if d.startswith(("etag", "add_header ETag", "if_modified_since"))]
+
+
+def test_identical_files_share_a_blob(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(503, num_files=1)
+        create_dataset_db(515, num_files=1)
+        first, second = (
+            DataSet.query.join(DataSet.ds_meta_data).filter_by(title=f"Sample dataset {n}").one().files()[0]
+            for n in (503, 515)
+        )
+        hubfile_service = HubfileService()
+        first_path = hubfile_service.get_path_by_hubfile(first)
+        second_path = hubfile_service.get_path_by_hubfile(second)
+
+        assert first.blob == second.blob
+        assert os.path.samefile(first_path, second_path)
+        assert os.path.samefile(first_path, blob_store.path(first.blob))
+
+        # Sin el enlace del dataset, la ruta se resuelve a través del blob
+        os.remove(second_path)
+        assert hubfile_service.get_path_by_hubfile(second) == blob_store.path(second.blob)
+        blob_store.link(blob_store.path(second.blob), second_path)
+
+        # Un fichero que aún no está en el almacén se incorpora a él
+        second.blob = None
+        os.remove(second_path)
+        shutil.copyfile(first_path, second_path)
+        assert hubfile_service.store_blobs() >= 1
+        assert second.blob == first.blob and os.path.samefile(first_path, second_path)
+
+
+def test_unreferenced_blobs_are_collected(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    store.PARTIAL_MAX_AGE = -1
+    for content in (b"kept", b"linked", b"garbage"):
+        source = tmp_path / content.decode()
+        source.write_bytes(content)
+        store.store(str(source), str(tmp_path / "dataset" / content.decode()), move=True)
+    kept = BlobStore.digest(str(tmp_path / "dataset" / "kept"))
+    garbage = BlobStore.digest(str(tmp_path / "dataset" / "garbage"))
+    os.remove(tmp_path / "dataset" / "kept")
+    os.remove(tmp_path / "dataset" / "garbage")
+
+    assert store.collect_garbage(referenced={kept}) == (1, len(b"garbage"))
+    assert store.exists(kept) and not store.exists(garbage)
+    assert (tmp_path / "dataset" / "linked").read_bytes() == b"linked"
+
+
+def test_view_file_is_paginated(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(505, num_files=1)
+        hubfile = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 505").one().files()[0]
+        file_id = hubfile.id
+        with open(HubfileService().get_path_by_hubfile(hubfile)) as file:
+            expected = file.read()
+
+    content, offset, pages = "", 0, 0
+    while offset is not None:
+        response = test_client.get(f"/file/view/{file_id}?offset={offset}&lines=5")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["success"] and data["offset"] == offset and data["lines"] <= 5
+        content += data["content"]
+        offset = data["next_offset"]
+        pages += 1
+
+    assert content == expected
+    assert pages > 1
+    assert test_client.get(f"/file/view/{file_id}?offset=-1").status_code == 400
+
+    with test_client.application.app_context():
+        assert HubfileViewRecord.query.filter_by(file_id=file_id).count() == 1
+
+
+def test_read_lines_does_not_split_characters(tmp_path):
+    path = tmp_path / "model.uvl"
+    path.write_text("features\n    \"Añadir\"\n", encoding="utf-8")
+
+    page = HubfileService.read_lines(str(path), offset=9, lines=1, max_bytes=8)
+    assert page["content"] == "    \"A"
+    rest = HubfileService.read_lines(str(path), offset=page["next_offset"])
+    assert rest["content"] == "ñadir\"\n" and rest["next_offset"] is None
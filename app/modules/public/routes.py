@@ -1,63 +1,55 @@
 from flask import render_template
-from app.modules.featuremodel.services import FeatureModelService
 from app.modules.public import public_bp
 from app.modules.dataset.services import DataSetService
+from app.modules.stats.services import (
+    DATASET_DOWNLOADS,
+    DATASET_VIEWS,
+    FEATURE_MODELS,
+    FILE_DOWNLOADS,
+    FILE_VIEWS,
+    SYNCHRONIZED_DATASETS,
+    CounterService
+)
 import logging
 from flask import jsonify
 
 logger = logging.getLogger(__name__)
 
 
+def counters_context(counters: dict) -> dict:
+    return {
+        "datasets_counter": counters[SYNCHRONIZED_DATASETS],
+        "feature_models_counter": counters[FEATURE_MODELS],
+        "total_dataset_downloads": counters[DATASET_DOWNLOADS],
+        "total_feature_model_downloads": counters[FILE_DOWNLOADS],
+        "total_dataset_views": counters[DATASET_VIEWS],
+        "total_feature_model_views": counters[FILE_VIEWS],
+    }
+
+
 @public_bp.route("/")
 def index():
     logger.info("Access index")
     dataset_service = DataSetService()
-    feature_model_service = FeatureModelService()
-
-    datasets_counter = dataset_service.count_synchronized_datasets()
-    feature_models_counter = feature_model_service.count_feature_models()
-
-    total_dataset_downloads = dataset_service.total_dataset_downloads()
-    total_feature_model_downloads = feature_model_service.total_feature_model_downloads()
 
-    total_dataset_views = dataset_service.total_dataset_views()
-    total_feature_model_views = feature_model_service.total_feature_model_views()
+    # Todos los totales se leen de la tabla de contadores con una sola consulta
+    counters = CounterService().get_all()
 
     return render_template(
         "public/index.html",
         datasets=dataset_service.latest_synchronized(),
-        datasets_counter=datasets_counter,
-        feature_models_counter=feature_models_counter,
-        total_dataset_downloads=total_dataset_downloads,
-        total_feature_model_downloads=total_feature_model_downloads,
-        total_dataset_views=total_dataset_views,
-        total_feature_model_views=total_feature_model_views
+        **counters_context(counters)
     )
 
 
 @public_bp.route("/dashboard")
 def dashboard():
     try:
-        dataset_service = DataSetService()
-        feature_model_service = FeatureModelService()
-
-        datasets_counter = dataset_service.count_synchronized_datasets()
-        feature_models_counter = feature_model_service.count_feature_models()
-
-        total_dataset_downloads = dataset_service.total_dataset_downloads()
-        total_feature_model_downloads = feature_model_service.total_feature_model_downloads()
-
-        total_dataset_views = dataset_service.total_dataset_views()
-        total_feature_model_views = feature_model_service.total_feature_model_views()
+        counters = CounterService().get_all()
 
         return render_template(
             "dashboard.html",
-            datasets_counter=datasets_counter,
-            feature_models_counter=feature_models_counter,
-            total_dataset_downloads=total_dataset_downloads,
-            total_feature_model_downloads=total_feature_model_downloads,
-            total_dataset_views=total_dataset_views,
-            total_feature_model_views=total_feature_model_views
+            **counters_context(counters)
         )
 
     except Exception as e:
@@ -10,14 +10,15 @@ class TestIntegrationDashboard(unittest.TestCase):
 
 
 def test_dashboard_render_with_mocked_data(test_client):
-    with patch("app.modules.public.routes.DataSetService") as MockDataSetService, \
-         patch("app.modules.public.routes.FeatureModelService") as MockFeatureModelService:
-        MockDataSetService.return_value.count_synchronized_datasets.return_value = 10
-        MockFeatureModelService.return_value.count_feature_models.return_value = 5
-        MockDataSetService.return_value.total_dataset_downloads.return_value = 100
-        MockFeatureModelService.return_value.total_feature_model_downloads.return_value = 50
-        MockDataSetService.return_value.total_dataset_views.return_value = 200
-        MockFeatureModelService.return_value.total_feature_model_views.return_value = 150
+    with patch("app.modules.public.routes.CounterService") as MockCounterService:
+        MockCounterService.return_value.get_all.return_value = {
+            "synchronized_datasets": 10,
+            "feature_models": 5,
+            "dataset_downloads": 100,
+            "file_downloads": 50,
+            "dataset_views": 200,
+            "file_views": 150,
+        }
 
         login_response = test_client.post("/login", json={"username": "test_user", "password": "password123"})
         assert login_response.status_code == 200, "Login was unsuccessful."
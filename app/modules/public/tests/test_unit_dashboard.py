@@ -14,15 +14,16 @@ def app():
         yield app
 
 
-@patch("app.modules.public.routes.DataSetService")
-@patch("app.modules.public.routes.FeatureModelService")
-def test_dashboard_route(mock_feature_model_service, mock_dataset_service, app):
-    mock_dataset_service.return_value.count_synchronized_datasets.return_value = 10
-    mock_feature_model_service.return_value.count_feature_models.return_value = 5
-    mock_dataset_service.return_value.total_dataset_downloads.return_value = 100
-    mock_feature_model_service.return_value.total_feature_model_downloads.return_value = 50
-    mock_dataset_service.return_value.total_dataset_views.return_value = 200
-    mock_feature_model_service.return_value.total_feature_model_views.return_value = 150
+@patch("app.modules.public.routes.CounterService")
+def test_dashboard_route(mock_counter_service, app):
+    mock_counter_service.return_value.get_all.return_value = {
+        "synchronized_datasets": 10,
+        "feature_models": 5,
+        "dataset_downloads": 100,
+        "file_downloads": 50,
+        "dataset_views": 200,
+        "file_views": 150,
+    }
 
     with app.test_client() as client:
         response = client.get("/dashboard")
@@ -39,15 +40,16 @@ def test_dashboard_route(mock_feature_model_service, mock_dataset_service, app):
         assert b"200" in response.data
 
 
-@patch("app.modules.public.routes.DataSetService")
-@patch("app.modules.public.routes.FeatureModelService")
-def test_dashboard_route_empty_values(mock_feature_model_service, mock_dataset_service, app):
-    mock_dataset_service.return_value.count_synchronized_datasets.return_value = None
-    mock_feature_model_service.return_value.count_feature_models.return_value = None
-    mock_dataset_service.return_value.total_dataset_downloads.return_value = None
-    mock_feature_model_service.return_value.total_feature_model_downloads.return_value = None
-    mock_dataset_service.return_value.total_dataset_views.return_value = None
-    mock_feature_model_service.return_value.total_feature_model_views.return_value = None
+@patch("app.modules.public.routes.CounterService")
+def test_dashboard_route_empty_values(mock_counter_service, app):
+    mock_counter_service.return_value.get_all.return_value = {
+        "synchronized_datasets": 0,
+        "feature_models": 0,
+        "dataset_downloads": 0,
+        "file_downloads": 0,
+        "dataset_views": 0,
+        "file_views": 0,
+    }
 
     with app.test_client() as client:
         response = client.get("/dashboard")
@@ -61,15 +63,9 @@ def test_dashboard_route_empty_values(mock_feature_model_service, mock_dataset_s
         assert b"0" in response.data
 
 
-@patch("app.modules.public.routes.DataSetService")
-@patch("app.modules.public.routes.FeatureModelService")
-def test_dashboard_route_service_error(mock_feature_model_service, mock_dataset_service, app):
-    mock_dataset_service.side_effect = Exception("Error al obtener datasets")
-    mock_feature_model_service.return_value.count_feature_models.return_value = 5
-    mock_dataset_service.return_value.total_dataset_downloads.return_value = 100
-    mock_feature_model_service.return_value.total_feature_model_downloads.return_value = 50
-    mock_dataset_service.return_value.total_dataset_views.return_value = 200
-    mock_feature_model_service.return_value.total_feature_model_views.return_value = 150
+@patch("app.modules.public.routes.CounterService")
+def test_dashboard_route_service_error(mock_counter_service, app):
+    mock_counter_service.side_effect = Exception("Error al obtener datasets")
 
     with app.test_client() as client:
         response = client.get("/dashboard")
@@ -79,15 +75,16 @@ def test_dashboard_route_service_error(mock_feature_model_service, mock_dataset_
         assert b"Error al obtener datasets" in response.data
 
 
-@patch("app.modules.public.routes.DataSetService")
-@patch("app.modules.public.routes.FeatureModelService")
-def test_dashboard_route_large_values(mock_feature_model_service, mock_dataset_service, app):
-    mock_dataset_service.return_value.count_synchronized_datasets.return_value = 1000000
-    mock_feature_model_service.return_value.count_feature_models.return_value = 500000
-    mock_dataset_service.return_value.total_dataset_downloads.return_value = 10000000
-    mock_feature_model_service.return_value.total_feature_model_downloads.return_value = 5000000
-    mock_dataset_service.return_value.total_dataset_views.return_value = 20000000
-    mock_feature_model_service.return_value.total_feature_model_views.return_value = 15000000
+@patch("app.modules.public.routes.CounterService")
+def test_dashboard_route_large_values(mock_counter_service, app):
+    mock_counter_service.return_value.get_all.return_value = {
+        "synchronized_datasets": 1000000,
+        "feature_models": 500000,
+        "dataset_downloads": 10000000,
+        "file_downloads": 5000000,
+        "dataset_views": 20000000,
+        "file_views": 15000000,
+    }
 
     with app.test_client() as client:
         response = client.get("/dashboard")
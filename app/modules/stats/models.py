@@ -0,0 +1,46 @@
+from app import db
+
+
+class Counter(db.Model):
+    """
+    Named totals shown on the homepage and the dashboard, kept up to date in the same transaction
+    as the rows they count (see CounterService.listen), so they can be read in a single query.
+    """
+    __tablename__ = 'counter'
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'Counter<{self.name}={self.value}>'
+
+
+class DailyRollup(db.Model):
+    """
+    Views and downloads of a dataset or file during one day, aggregated from the raw tracking records,
+    which can then be pruned (see RollupService).
+    """
+    __tablename__ = 'daily_rollup'
+    kind = db.Column(db.String(32), primary_key=True)
+    object_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('ix_daily_rollup_kind_day', 'kind', 'day'),)
+
+    def __repr__(self):
+        return f'DailyRollup<{self.kind}, {self.object_id}, {self.day}={self.count}>'
+
+
+class VisitorSketch(db.Model):
+    """
+    HyperLogLog sketch of the distinct visitors that viewed or downloaded a dataset or file during one day
+    (object_id 0 holds those of every object), see SketchService.
+    """
+    __tablename__ = 'visitor_sketch'
+    kind = db.Column(db.String(32), primary_key=True)
+    object_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f'VisitorSketch<{self.kind}, {self.object_id}, {self.day}>'
@@ -0,0 +1,199 @@
+from datetime import date, datetime, time
+
+from sqlalchemy import case, delete, func, insert, select, tuple_, update
+
+from app.modules.dataset.models import DataSet
+from app.modules.stats.models import Counter, DailyRollup, VisitorSketch
+from app.modules.stats.sketches import HyperLogLog
+from core.repositories.BaseRepository import BaseRepository
+
+
+class CounterRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(Counter)
+
+    def get_all(self) -> dict:
+        return dict(self.session.execute(select(Counter.name, Counter.value)).all())
+
+    @staticmethod
+    def increment(connection, deltas: dict):
+        """
+        Adds the deltas to the counters with the given connection, within the transaction in progress.
+        The counters are updated in the order of their names, the same in every transaction.
+        """
+        for name, delta in sorted(deltas.items()):
+            if not delta:
+                continue
+            result = connection.execute(
+                update(Counter).where(Counter.name == name).values(value=Counter.value + delta)
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(Counter).values(name=name, value=delta))
+
+    def set_all(self, values: dict):
+        for name, value in values.items():
+            counter = self.session.get(Counter, name)
+            if counter is None:
+                self.session.add(Counter(name=name, value=value))
+            else:
+                counter.value = value
+        self.session.commit()
+
+
+class DailyRollupRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DailyRollup)
+
+    def last_day(self, kind: str):
+        return self.session.scalar(select(func.max(DailyRollup.day)).where(DailyRollup.kind == kind))
+
+    def aggregate(self, model, object_column: str, date_column: str, start: date, end: date) -> list:
+        """(object id, day, count) of the raw records of `model` from `start` (None for all) until `end` (excluded)."""
+        created = getattr(model, date_column)
+        day = func.date(created)
+        statement = (
+            select(getattr(model, object_column), day, func.count())
+            .where(created < datetime.combine(end, time.min))
+            .group_by(getattr(model, object_column), day)
+        )
+        if start is not None:
+            statement = statement.where(created >= datetime.combine(start, time.min))
+        return [
+            (object_id, value if isinstance(value, date) else date.fromisoformat(str(value)), count)
+            for object_id, value, count in self.session.execute(statement)
+        ]
+
+    def insert_buckets(self, kind: str, buckets: list):
+        if buckets:
+            self.session.execute(
+                insert(DailyRollup),
+                [{"kind": kind, "object_id": object_id, "day": day, "count": count}
+                 for object_id, day, count in buckets if object_id is not None],
+            )
+
+    def series(self, kind: str, start: date, end: date, object_id: int = None) -> dict:
+        """Total per day of `kind` from `start` until `end` (excluded), for one object or for all of them."""
+        statement = (
+            select(DailyRollup.day, func.sum(DailyRollup.count))
+            .where(DailyRollup.kind == kind, DailyRollup.day >= start, DailyRollup.day < end)
+            .group_by(DailyRollup.day)
+        )
+        if object_id is not None:
+            statement = statement.where(DailyRollup.object_id == object_id)
+        return {day: int(count) for day, count in self.session.execute(statement)}
+
+    def buckets(self, kind: str) -> list:
+        """(object id, day, count) of every rollup of `kind`."""
+        return self.session.execute(
+            select(DailyRollup.object_id, DailyRollup.day, DailyRollup.count).where(DailyRollup.kind == kind)
+        ).all()
+
+    def raw_rows(self, model, date_column: str, before: date):
+        return self.session.scalars(
+            select(model)
+            .where(getattr(model, date_column) < datetime.combine(before, time.min))
+            .execution_options(yield_per=1000)
+        )
+
+    def prune(self, model, date_column: str, before: date) -> int:
+        result = self.session.execute(
+            delete(model).where(getattr(model, date_column) < datetime.combine(before, time.min))
+        )
+        return result.rowcount
+
+
+class VisitorSketchRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(VisitorSketch)
+
+    def add(self, visitors: dict):
+        """
+        Adds to the sketch of each (kind, object id, day) of `visitors` its set of visitors, within the
+        transaction in progress. The rows are created if missing and locked while they are merged, so
+        concurrent batches do not lose each other's visitors. They are written and locked in key order,
+        the same in every transaction.
+        """
+        if not visitors:
+            return
+        keys = sorted(visitors)
+        empty = HyperLogLog().to_bytes()
+        self.upsert(
+            [{"kind": kind, "object_id": object_id, "day": day, "registers": empty} for kind, object_id, day in keys],
+            commit=False,
+        )
+        sketches = self.session.scalars(
+            select(VisitorSketch)
+            .where(tuple_(VisitorSketch.kind, VisitorSketch.object_id, VisitorSketch.day).in_(keys))
+            .order_by(VisitorSketch.kind, VisitorSketch.object_id, VisitorSketch.day)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        for row in sketches:
+            sketch = HyperLogLog.from_bytes(row.registers)
+            if sketch.update(visitors[(row.kind, row.object_id, row.day)]):
+                row.registers = sketch.to_bytes()
+
+    def raw_values(self, model, columns: tuple, after_id: int, limit: int) -> list:
+        """The id and the given columns of the next `limit` raw records of `model` after `after_id`, as mappings."""
+        return self.session.execute(
+            select(model.id, *[getattr(model, column) for column in columns])
+            .where(model.id > after_id)
+            .order_by(model.id)
+            .limit(limit)
+        ).mappings().all()
+
+    def between(self, kind: str, object_id: int, start: date, end: date) -> list:
+        """The sketches of `kind` of one object from `start` until `end` (excluded)."""
+        return [
+            HyperLogLog.from_bytes(registers)
+            for registers in self.session.scalars(
+                select(VisitorSketch.registers)
+                .where(VisitorSketch.kind == kind, VisitorSketch.object_id == object_id)
+                .where(VisitorSketch.day >= start, VisitorSketch.day < end)
+            )
+        ]
+
+
+class ScoreRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DataSet)
+
+    def apply(self, increments: dict, trending: dict, combine):
+        """
+        Adds the counts of `increments` ({dataset id: {column: delta}}) to the scores of each dataset and
+        merges its trending score with the one of `trending` through `combine(stored, new)`, within the
+        transaction in progress. The datasets are locked in the order of their ids while their trending
+        score is merged.
+        """
+        dataset_ids = sorted(set(increments) | set(trending))
+        if not dataset_ids:
+            return
+        stored = dict(self.session.execute(
+            select(DataSet.id, DataSet.trending_score).where(DataSet.id.in_(dataset_ids))
+            .order_by(DataSet.id).with_for_update()
+        ).all())
+        for dataset_id in dataset_ids:
+            if dataset_id not in stored:
+                continue
+            values = {
+                column: getattr(DataSet, column) + delta for column, delta in increments.get(dataset_id, {}).items()
+            }
+            if dataset_id in trending:
+                values['trending_score'] = combine(stored[dataset_id], trending[dataset_id])
+            self.session.execute(
+                update(DataSet).where(DataSet.id == dataset_id).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+
+    def reset(self):
+        """Sets every score from scratch: no downloads nor views, and the rating average of the aggregates."""
+        self.session.execute(
+            update(DataSet)
+            .values(
+                download_count=0,
+                view_count=0,
+                trending_score=0,
+                rating_score=case((DataSet.rating_count > 0, DataSet.rating_sum * 1.0 / DataSet.rating_count), else_=0),
+            )
+            .execution_options(synchronize_session=False)
+        )
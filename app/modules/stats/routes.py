@@ -0,0 +1,39 @@
+from flask import jsonify, request
+
+from app.modules.stats import stats_bp
+from app.modules.stats.services import CounterService, RollupService, SketchService
+
+MAX_SERIES_DAYS = 365
+
+
+@stats_bp.route('/stats/counters', methods=['GET'])
+def counters():
+    return jsonify(CounterService().get_all())
+
+
+@stats_bp.route('/stats/timeseries', methods=['GET'])
+def timeseries():
+    days = request.args.get('days', 30, type=int)
+    if not 0 < days <= MAX_SERIES_DAYS:
+        return jsonify({'error': f'days must be between 1 and {MAX_SERIES_DAYS}'}), 400
+
+    series = RollupService().series(
+        days,
+        dataset_id=request.args.get('dataset_id', type=int),
+        file_id=request.args.get('file_id', type=int),
+    )
+    return jsonify(series)
+
+
+@stats_bp.route('/stats/unique_visitors', methods=['GET'])
+def unique_visitors():
+    days = request.args.get('days', 30, type=int)
+    if not 0 < days <= MAX_SERIES_DAYS:
+        return jsonify({'error': f'days must be between 1 and {MAX_SERIES_DAYS}'}), 400
+
+    estimates = SketchService().unique_visitors(
+        days,
+        dataset_id=request.args.get('dataset_id', type=int),
+        file_id=request.args.get('file_id', type=int),
+    )
+    return jsonify({'days': days, 'unique_visitors': estimates})
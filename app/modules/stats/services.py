@@ -0,0 +1,384 @@
+import csv
+import gzip
+import logging
+import math
+import os
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.modules.dataset.models import DSDownloadRecord, DSMetaData, DSViewRecord
+from app.modules.dataset.repositories import DataSetRepository, DSDownloadRecordRepository, DSViewRecordRepository
+from app.modules.featuremodel.models import FeatureModel
+from app.modules.featuremodel.repositories import FeatureModelRepository
+from app.modules.hubfile.models import HubfileDownloadRecord, HubfileViewRecord
+from app.modules.hubfile.repositories import HubfileDownloadRecordRepository, HubfileViewRecordRepository
+from app.modules.stats.repositories import (
+    CounterRepository,
+    DailyRollupRepository,
+    ScoreRepository,
+    VisitorSketchRepository
+)
+from app.modules.stats.sketches import HyperLogLog
+from core.services.BaseService import BaseService
+from core.tracking.buffer import tracking_buffer
+
+SYNCHRONIZED_DATASETS = 'synchronized_datasets'
+FEATURE_MODELS = 'feature_models'
+DATASET_DOWNLOADS = 'dataset_downloads'
+DATASET_VIEWS = 'dataset_views'
+FILE_DOWNLOADS = 'file_downloads'
+FILE_VIEWS = 'file_views'
+
+logger = logging.getLogger(__name__)
+
+# Models whose rows are counted as they are inserted and deleted
+COUNTED_MODELS = {
+    FeatureModel: FEATURE_MODELS,
+    DSDownloadRecord: DATASET_DOWNLOADS,
+    DSViewRecord: DATASET_VIEWS,
+    HubfileDownloadRecord: FILE_DOWNLOADS,
+    HubfileViewRecord: FILE_VIEWS,
+}
+
+# Raw tracking records rolled up by day: kind -> (model, object column, date column)
+ROLLUP_SOURCES = {
+    DATASET_VIEWS: (DSViewRecord, 'dataset_id', 'view_date'),
+    DATASET_DOWNLOADS: (DSDownloadRecord, 'dataset_id', 'download_date'),
+    FILE_VIEWS: (HubfileViewRecord, 'file_id', 'view_date'),
+    FILE_DOWNLOADS: (HubfileDownloadRecord, 'file_id', 'download_date'),
+}
+
+# Column of the raw tracking records that identifies an anonymous visitor, per kind
+VISITOR_COOKIES = {
+    DATASET_VIEWS: 'view_cookie',
+    DATASET_DOWNLOADS: 'download_cookie',
+    FILE_VIEWS: 'view_cookie',
+    FILE_DOWNLOADS: 'download_cookie',
+}
+
+# Object id of the sketches of every dataset or file
+ALL_OBJECTS = 0
+
+# Dataset columns counting the downloads and views, for the explore sort orders
+SCORE_COLUMNS = {
+    DATASET_DOWNLOADS: 'download_count',
+    DATASET_VIEWS: 'view_count',
+}
+
+# Trending: every download or view adds weight * 2 ** (-age / TRENDING_HALF_LIFE_DAYS). What is stored is
+# log(sum(weight * exp(rate * t))), with t the days since TRENDING_EPOCH: ageing every score at once does
+# not change their order, so they never need to be recomputed, and the logarithm keeps them finite
+TRENDING_HALF_LIFE_DAYS = 7
+TRENDING_EPOCH = datetime(2024, 1, 1)
+TRENDING_WEIGHTS = {
+    DATASET_DOWNLOADS: 3.0,
+    DATASET_VIEWS: 1.0,
+}
+
+
+def trending_term(moment: datetime, weight: float = 1.0, count: int = 1) -> float:
+    """Trending score of `count` events of `weight` at `moment` (UTC)."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    days = (moment - TRENDING_EPOCH).total_seconds() / 86400
+    return math.log(weight * count) + math.log(2) / TRENDING_HALF_LIFE_DAYS * days
+
+
+def log_add(stored: float, term: float) -> float:
+    """Adds two trending scores, log(exp(stored) + exp(term)). 0 is the score of no activity."""
+    if not stored:
+        return term
+    high, low = max(stored, term), min(stored, term)
+    return high + math.log1p(math.exp(low - high))
+
+
+def pruned_counter(kind: str) -> str:
+    # Records removed by the retention policy, still part of the totals
+    return f'{kind}_pruned'
+
+
+class CounterService(BaseService):
+    def __init__(self):
+        super().__init__(CounterRepository())
+
+    def get_all(self) -> dict:
+        """Every counter, with a single query."""
+        counters = dict.fromkeys((SYNCHRONIZED_DATASETS, *COUNTED_MODELS.values()), 0)
+        stored = self.repository.get_all()
+        counters.update((name, stored[name]) for name in counters if name in stored)
+        return counters
+
+    def get(self, name: str) -> int:
+        return self.get_all()[name]
+
+    def rebuild(self) -> dict:
+        """Recomputes every counter from the rows it counts and the records already pruned."""
+        stored = self.repository.get_all()
+        counters = {
+            SYNCHRONIZED_DATASETS: DataSetRepository().count_synchronized_datasets(),
+            FEATURE_MODELS: FeatureModelRepository().count_feature_models(),
+            DATASET_DOWNLOADS: DSDownloadRecordRepository().total_dataset_downloads(),
+            DATASET_VIEWS: DSViewRecordRepository().total_dataset_views(),
+            FILE_DOWNLOADS: HubfileDownloadRecordRepository().total_hubfile_downloads(),
+            FILE_VIEWS: HubfileViewRecordRepository().total_hubfile_views(),
+        }
+        for kind in ROLLUP_SOURCES:
+            counters[kind] += stored.get(pruned_counter(kind), 0)
+        self.repository.set_all(counters)
+        return counters
+
+    @staticmethod
+    def listen():
+        """Keeps the counters up to date in the transaction of every flush and of every tracking batch."""
+        if not event.contains(Session, 'after_flush', CounterService._after_flush):
+            event.listen(Session, 'after_flush', CounterService._after_flush)
+        tracking_buffer.on_flush(CounterService._after_tracking)
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        deltas = {}
+        for instances, sign in ((session.new, 1), (session.deleted, -1)):
+            for instance in instances:
+                name = COUNTED_MODELS.get(type(instance))
+                if name:
+                    deltas[name] = deltas.get(name, 0) + sign
+                elif isinstance(instance, DSMetaData) and instance.dataset_doi is not None:
+                    deltas[SYNCHRONIZED_DATASETS] = deltas.get(SYNCHRONIZED_DATASETS, 0) + sign
+
+        # A dataset is synchronized when it gets its DOI
+        for instance in session.dirty:
+            if isinstance(instance, DSMetaData):
+                history = inspect(instance).attrs.dataset_doi.history
+                if history.has_changes():
+                    was_synchronized = any(doi is not None for doi in history.deleted)
+                    is_synchronized = instance.dataset_doi is not None
+                    if was_synchronized != is_synchronized:
+                        sign = 1 if is_synchronized else -1
+                        deltas[SYNCHRONIZED_DATASETS] = deltas.get(SYNCHRONIZED_DATASETS, 0) + sign
+
+        if any(deltas.values()):
+            CounterRepository.increment(session.connection(), deltas)
+
+    @staticmethod
+    def _after_tracking(session, inserted: dict, events: dict):
+        deltas = {COUNTED_MODELS[model]: len(rows) for model, rows in inserted.items() if model in COUNTED_MODELS}
+        if deltas:
+            CounterRepository.increment(session.connection(), deltas)
+
+
+class RollupService(BaseService):
+    """
+    Aggregates the raw view and download records into daily buckets per dataset and file, and prunes
+    the raw records older than the retention period once their days are rolled up. Only complete days are
+    rolled up, each of them once: the last day of each kind in the rollups is where the next run starts.
+    """
+
+    def __init__(self):
+        super().__init__(DailyRollupRepository())
+
+    def rollup(self, today: date = None) -> dict:
+        """Rolls up every complete day not rolled up yet. Returns the buckets created per kind."""
+        today = today or datetime.now(timezone.utc).date()
+        created = {}
+        for kind, (model, object_column, date_column) in ROLLUP_SOURCES.items():
+            last_day = self.repository.last_day(kind)
+            start = last_day + timedelta(days=1) if last_day else None
+            buckets = self.repository.aggregate(model, object_column, date_column, start, today)
+            self.repository.insert_buckets(kind, buckets)
+            created[kind] = len(buckets)
+        self.repository.session.commit()
+        return created
+
+    def prune(self, retention_days: int, archive_dir: str = None, today: date = None) -> dict:
+        """
+        Deletes the raw records older than `retention_days` whose day is already rolled up, writing them
+        first to a gzipped CSV per kind in `archive_dir` if given. Returns the records deleted per kind.
+        The totals of the homepage keep counting them.
+        """
+        today = today or datetime.now(timezone.utc).date()
+        pruned = {}
+        for kind, (model, _, date_column) in ROLLUP_SOURCES.items():
+            last_day = self.repository.last_day(kind)
+            if last_day is None:
+                pruned[kind] = 0
+                continue
+            before = min(today - timedelta(days=retention_days), last_day + timedelta(days=1))
+            if archive_dir:
+                self._archive(kind, model, date_column, before, archive_dir)
+            pruned[kind] = self.repository.prune(model, date_column, before)
+            CounterRepository.increment(self.repository.session.connection(), {pruned_counter(kind): pruned[kind]})
+            self.repository.session.commit()
+        return pruned
+
+    def series(self, days: int, dataset_id: int = None, file_id: int = None, today: date = None) -> dict:
+        """
+        Views and downloads per day of the last `days` days, today included, from the rollups.
+        The days after the last one rolled up (today at least) are counted from the raw records.
+        """
+        today = today or datetime.now(timezone.utc).date()
+        start = today - timedelta(days=days - 1)
+        labels = [start + timedelta(days=offset) for offset in range(days)]
+
+        series = {}
+        for kind, (model, object_column, date_column) in ROLLUP_SOURCES.items():
+            object_id = dataset_id if object_column == 'dataset_id' else file_id
+            if (dataset_id is not None or file_id is not None) and object_id is None:
+                continue
+            last_day = self.repository.last_day(kind)
+            raw_start = max(start, last_day + timedelta(days=1)) if last_day else start
+            counts = self.repository.series(kind, start, raw_start, object_id) if raw_start > start else {}
+            for bucket_object, day, count in self.repository.aggregate(
+                model, object_column, date_column, raw_start, today + timedelta(days=1)
+            ):
+                if object_id is None or bucket_object == object_id:
+                    counts[day] = counts.get(day, 0) + count
+            series[kind] = [counts.get(day, 0) for day in labels]
+
+        return {'days': [day.isoformat() for day in labels], 'series': series}
+
+    def _archive(self, kind: str, model, date_column: str, before: date, archive_dir: str):
+        os.makedirs(archive_dir, exist_ok=True)
+        columns = [column.name for column in model.__table__.columns]
+        path = os.path.join(archive_dir, f"{kind}_before_{before.isoformat()}.csv.gz")
+        with gzip.open(path, 'at', newline='') as archive:
+            writer = csv.writer(archive)
+            for record in self.repository.raw_rows(model, date_column, before):
+                writer.writerow([getattr(record, column) for column in columns])
+        logger.info(f"Raw {kind} records before {before} archived in {path}")
+
+
+class SketchService(BaseService):
+    """
+    Estimates the unique visitors of each dataset and file, and of the whole site, from daily HyperLogLog
+    sketches updated with every tracking batch, instead of counting distinct cookies in the raw records:
+    a few kilobytes per object and day whatever the traffic, and any period is the union of its days.
+    A visitor is the user when logged in and the cookie otherwise.
+    """
+
+    def __init__(self):
+        super().__init__(VisitorSketchRepository())
+
+    @staticmethod
+    def listen():
+        tracking_buffer.on_flush(SketchService._after_tracking)
+
+    @staticmethod
+    def _after_tracking(session, inserted: dict, events: dict):
+        kinds = {model: kind for kind, (model, _, _) in ROLLUP_SOURCES.items()}
+        visitors = {}
+        for model, rows in events.items():
+            kind = kinds.get(model)
+            if kind is not None:
+                SketchService._collect(visitors, kind, rows)
+        VisitorSketchRepository().add(visitors)
+
+    @staticmethod
+    def _collect(visitors: dict, kind: str, rows):
+        _, object_column, date_column = ROLLUP_SOURCES[kind]
+        for row in rows:
+            object_id, created = row[object_column], row[date_column]
+            if object_id is None or created is None:
+                continue
+            visitor = f"user:{row['user_id']}" if row['user_id'] is not None else row[VISITOR_COOKIES[kind]]
+            if visitor is None:
+                continue
+            day = created.date() if isinstance(created, datetime) else created
+            for key in ((kind, object_id, day), (kind, ALL_OBJECTS, day)):
+                visitors.setdefault(key, set()).add(visitor)
+
+    def rebuild(self, batch_size: int = 5000) -> int:
+        """
+        Adds every raw record still stored to the sketches, for the records tracked before they existed.
+        Sketches ignore what they already hold, so it can run more than once. Returns the records read.
+        """
+        read = 0
+        for kind, (model, object_column, date_column) in ROLLUP_SOURCES.items():
+            columns = ('user_id', object_column, date_column, VISITOR_COOKIES[kind])
+            last_id = 0
+            while True:
+                rows = self.repository.raw_values(model, columns, last_id, batch_size)
+                if not rows:
+                    break
+                visitors = {}
+                self._collect(visitors, kind, rows)
+                self.repository.add(visitors)
+                self.repository.session.commit()
+                last_id = rows[-1]['id']
+                read += len(rows)
+        return read
+
+    def unique_visitors(self, days: int, dataset_id: int = None, file_id: int = None, today: date = None) -> dict:
+        """Estimated distinct visitors per kind during the last `days` days, today included."""
+        today = today or datetime.now(timezone.utc).date()
+        start = today - timedelta(days=days - 1)
+        estimates = {}
+        for kind, (_, object_column, _) in ROLLUP_SOURCES.items():
+            object_id = dataset_id if object_column == 'dataset_id' else file_id
+            if dataset_id is not None or file_id is not None:
+                if object_id is None:
+                    continue
+            else:
+                object_id = ALL_OBJECTS
+            sketches = self.repository.between(kind, object_id, start, today + timedelta(days=1))
+            estimates[kind] = HyperLogLog.union(sketches).count()
+        return estimates
+
+
+class ScoreService(BaseService):
+    """
+    Keeps the scores the explore results can be sorted by (downloads, views and trending) up to date
+    with every tracking batch, so that sorting only reads an indexed column. Only the records a batch
+    inserts count, the same ones `rebuild` reads back. The rating score is kept by RatingService.
+    """
+
+    def __init__(self):
+        super().__init__(ScoreRepository())
+
+    @staticmethod
+    def listen():
+        tracking_buffer.on_flush(ScoreService._after_tracking)
+
+    @staticmethod
+    def _after_tracking(session, inserted: dict, events: dict):
+        increments, trending = {}, {}
+        for kind in SCORE_COLUMNS:
+            model, object_column, date_column = ROLLUP_SOURCES[kind]
+            for row in inserted.get(model, ()):
+                if row[object_column] is not None and row[date_column] is not None:
+                    ScoreService._add(increments, trending, kind, row[object_column], row[date_column], 1)
+        ScoreRepository().apply(increments, trending, log_add)
+
+    @staticmethod
+    def _add(increments: dict, trending: dict, kind: str, dataset_id: int, moment: datetime, count: int):
+        column = SCORE_COLUMNS[kind]
+        scores = increments.setdefault(dataset_id, {})
+        scores[column] = scores.get(column, 0) + count
+        trending[dataset_id] = log_add(
+            trending.get(dataset_id, 0), trending_term(moment, TRENDING_WEIGHTS[kind], count)
+        )
+
+    def rebuild(self, today: date = None) -> int:
+        """
+        Recomputes every score from the daily rollups and the raw records not rolled up yet, which also
+        cover the records already pruned. Returns the datasets with downloads or views.
+        """
+        today = today or datetime.now(timezone.utc).date()
+        rollup_repository = DailyRollupRepository()
+        self.repository.reset()
+
+        increments, trending = {}, {}
+        for kind in SCORE_COLUMNS:
+            model, object_column, date_column = ROLLUP_SOURCES[kind]
+            last_day = rollup_repository.last_day(kind)
+            buckets = rollup_repository.buckets(kind) if last_day else []
+            start = last_day + timedelta(days=1) if last_day else None
+            buckets += rollup_repository.aggregate(model, object_column, date_column, start, today + timedelta(days=1))
+            for dataset_id, day, count in buckets:
+                if dataset_id is not None and count:
+                    self._add(increments, trending, kind, dataset_id, datetime.combine(day, time(12)), count)
+
+        self.repository.apply(increments, trending, log_add)
+        self.repository.session.commit()
+        return len(increments)
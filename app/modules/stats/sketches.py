@@ -0,0 +1,81 @@
+import hashlib
+import math
+import zlib
+
+DEFAULT_PRECISION = 12
+
+
+class HyperLogLog:
+    """
+    Estimates how many distinct values have been added with a fixed amount of memory: 2**precision
+    registers of one byte (4 KiB by default) for a standard error of about 1.04 / sqrt(2**precision),
+    1.6% by default. Adding a value twice changes nothing and two sketches of the same precision merge
+    into the sketch of the union, so daily sketches add up to the unique values of any period.
+
+    Stored compressed: the registers of a sketch with few values are mostly zero.
+    """
+
+    HASH_BITS = 64
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: bytes = None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"precision must be between 4 and 16, not {precision}")
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is not None and len(registers) != self.size:
+            raise ValueError(f"{len(registers)} registers given for a sketch of {self.size}")
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, value) -> bool:
+        """Adds `value` (hashed by its string form). Returns whether the sketch changed."""
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        remaining_bits = self.HASH_BITS - self.precision
+        index = hashed >> remaining_bits
+        rank = remaining_bits - (hashed & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def update(self, values) -> bool:
+        changed = False
+        for value in values:
+            changed = self.add(value) or changed
+        return changed
+
+    def merge(self, other: 'HyperLogLog') -> bool:
+        """Adds the values of `other` to this sketch. Returns whether the sketch changed."""
+        if other.precision != self.precision:
+            raise ValueError("Only sketches of the same precision can be merged")
+        changed = False
+        for index, rank in enumerate(other.registers):
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+                changed = True
+        return changed
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size) if self.size >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[self.size]
+        estimate = alpha * self.size ** 2 / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        # Small cardinalities are estimated better by the registers still empty (linear counting)
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        return cls(precision=data[0], registers=zlib.decompress(data[1:]))
+
+    @classmethod
+    def union(cls, sketches) -> 'HyperLogLog':
+        result = None
+        for sketch in sketches:
+            if result is None:
+                result = cls(precision=sketch.precision, registers=sketch.registers)
+            else:
+                result.merge(sketch)
+        return result if result is not None else cls()
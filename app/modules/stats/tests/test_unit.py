@@ -0,0 +1,151 @@
+from datetime import datetime, time, timedelta, timezone
+import os
+
+import pytest
+
+from app import db
+from app.modules.conftest import count_queries
+from app.modules.dataset.models import DSViewRecord, DataSet
+from app.modules.dataset.services import DSDownloadRecordService
+from app.modules.stats.services import CounterService, RollupService, SketchService
+from app.modules.stats.sketches import HyperLogLog
+from app.modules.utils.utilsdb import create_dataset_db
+
+
+@pytest.fixture(scope='module')
+def test_client(test_client):
+    """
+    Extends the test_client fixture to add additional specific data for module testing.
+    """
+    with test_client.application.test_request_context():
+        create_dataset_db(1)
+        create_dataset_db(2)
+
+    yield test_client
+
+
+def test_counters_follow_the_counted_rows(test_client):
+    with test_client.application.test_request_context():
+        counter_service = CounterService()
+        counters = counter_service.get_all()
+        assert counters["feature_models"] == 2
+        assert counters == counter_service.rebuild()
+
+        dataset = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 1").one()
+        synchronized = counters["synchronized_datasets"]
+        doi = dataset.ds_meta_data.dataset_doi
+        db.session.expire(dataset.ds_meta_data)
+        dataset.ds_meta_data.dataset_doi = None
+        db.session.commit()
+        assert counter_service.get("synchronized_datasets") == synchronized - (doi is not None)
+
+        DSDownloadRecordService().track(dataset.id, "stats-cookie")
+        DSDownloadRecordService().track(dataset.id, "stats-cookie")
+        assert counter_service.get("dataset_downloads") == counters["dataset_downloads"] + 1
+        assert counter_service.get_all() == counter_service.rebuild()
+
+
+def test_homepage_reads_the_counters_in_one_query(test_client):
+    with count_queries() as queries:
+        response = test_client.get("/")
+    assert response.status_code == 200
+    assert sum("counter" in statement for statement in queries) == 1
+    assert not any("count(" in statement.lower() for statement in queries)
+
+
+def test_rollups_serve_the_time_series_after_pruning(test_client, tmp_path):
+    today = datetime.now(timezone.utc).date()
+    with test_client.application.test_request_context():
+        dataset_id = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 2").one().id
+        for days_ago, cookies in ((40, 3), (2, 2), (0, 1)):
+            for i in range(cookies):
+                db.session.add(DSViewRecord(
+                    dataset_id=dataset_id,
+                    view_date=datetime.combine(today - timedelta(days=days_ago), time(12)),
+                    view_cookie=f"rollup-{days_ago}-{i}",
+                ))
+        db.session.commit()
+        views = CounterService().get("dataset_views")
+
+        rollup_service = RollupService()
+        assert rollup_service.rollup(today=today)["dataset_views"] >= 2
+        assert rollup_service.rollup(today=today)["dataset_views"] == 0, "A day must be rolled up only once."
+
+        pruned = rollup_service.prune(30, archive_dir=str(tmp_path), today=today)
+        assert pruned["dataset_views"] == 3
+        assert DSViewRecord.query.filter_by(dataset_id=dataset_id).count() == 3
+        assert os.listdir(tmp_path)
+        assert CounterService().rebuild()["dataset_views"] == views, "Pruned records still count in the totals."
+
+    response = test_client.get(f"/stats/timeseries?days=45&dataset_id={dataset_id}")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert "file_views" not in data["series"]
+    counts = dict(zip(data["days"], data["series"]["dataset_views"]))
+    assert counts[(today - timedelta(days=40)).isoformat()] == 3
+    assert counts[(today - timedelta(days=2)).isoformat()] == 2
+    assert counts[today.isoformat()] == 1
+    assert test_client.get("/stats/timeseries?days=0").status_code == 400
+
+
+def test_time_series_counts_the_days_not_rolled_up_yet(test_client):
+    today = datetime.now(timezone.utc).date()
+    with test_client.application.test_request_context():
+        dataset_id = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 1").one().id
+        rollup_service = RollupService()
+        rollup_service.rollup(today=today)
+        # Días completos posteriores a la última agregación, antes de que se vuelva a ejecutar
+        later = today + timedelta(days=3)
+        for days_ago, cookies in ((2, 2), (1, 1), (0, 3)):
+            for i in range(cookies):
+                db.session.add(DSViewRecord(
+                    dataset_id=dataset_id,
+                    view_date=datetime.combine(later - timedelta(days=days_ago), time(12)),
+                    view_cookie=f"pending-{days_ago}-{i}",
+                ))
+        db.session.commit()
+
+        before = rollup_service.series(7, dataset_id=dataset_id, today=later)["series"]["dataset_views"]
+        assert before[-3:] == [2, 1, 3]
+        rollup_service.rollup(today=later)
+        after = rollup_service.series(7, dataset_id=dataset_id, today=later)["series"]["dataset_views"]
+        assert after == before, "The series must not change when the days are rolled up."
+
+
+def test_hyperloglog_estimates_and_merges():
+    first, second = HyperLogLog(), HyperLogLog()
+    first.update(f"visitor-{i}" for i in range(20000))
+    second.update(f"visitor-{i}" for i in range(10000, 30000))
+    assert not first.add("visitor-1"), "A value already added must not change the sketch."
+    assert abs(first.count() - 20000) < 20000 * 0.05
+
+    union = HyperLogLog.union([HyperLogLog.from_bytes(first.to_bytes()), second])
+    assert abs(union.count() - 30000) < 30000 * 0.05
+    assert HyperLogLog.union([]).count() == 0
+    assert len(first.to_bytes()) < 4096
+
+
+def test_unique_visitors_come_from_the_sketches(test_client):
+    with test_client.application.test_request_context():
+        create_dataset_db(3)
+        dataset_id = DataSet.query.join(DataSet.ds_meta_data).filter_by(title="Sample dataset 3").one().id
+        for cookie in ("sketch-a", "sketch-b", "sketch-a", "sketch-c"):
+            DSDownloadRecordService().track(dataset_id, cookie)
+
+    with count_queries() as queries:
+        response = test_client.get(f"/stats/unique_visitors?days=7&dataset_id={dataset_id}")
+    assert response.status_code == 200
+    assert not any("distinct" in statement.lower() for statement in queries)
+    estimates = response.get_json()["unique_visitors"]
+    assert set(estimates) == {"dataset_views", "dataset_downloads"}
+    assert estimates["dataset_downloads"] == 3
+
+    with test_client.application.test_request_context():
+        site = SketchService().unique_visitors(7)["dataset_downloads"]
+        assert site >= 3
+        # Rebuilding from the raw records adds nothing the sketches already hold
+        assert SketchService().rebuild(batch_size=2) > 0
+        assert SketchService().unique_visitors(7, dataset_id=dataset_id)["dataset_downloads"] == 3
+        assert SketchService().unique_visitors(7)["dataset_downloads"] == site
+
+    assert test_client.get("/stats/unique_visitors?days=400").status_code == 400
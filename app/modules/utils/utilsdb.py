@@ -1,5 +1,4 @@
 import os
-import shutil
 from app import db
 from app.modules.auth.models import User
 from app.modules.dataset.models import (
@@ -8,6 +7,8 @@ from app.modules.dataset.models import (
     DSMetaData,
     PublicationType,
     DSMetrics)
+from app.modules.explore.services import SearchIndexService, UVLFeatureIndexService
+from app.modules.hubfile.blobs import blob_store
 from app.modules.hubfile.models import Hubfile
 from app.modules.featuremodel.models import FMMetaData, FeatureModel
 from datetime import datetime, timezone
@@ -55,6 +56,8 @@ def create_dataset_db(dataset_id, publication_type=PublicationType.DATA_MANAGEME
     db.session.add(dataset)
     db.session.commit()
 
+    SearchIndexService().index_dataset(dataset)
+
     fm_meta_data = FMMetaData(
             uvl_filename=f'file{dataset_id}.uvl',
             title=f'Feature Model {dataset_id}',
@@ -81,15 +84,14 @@ def create_dataset_db(dataset_id, publication_type=PublicationType.DATA_MANAGEME
         src_folder = os.path.join(working_dir, 'app', 'modules', 'dataset', 'uvl_examples')
 
         dest_folder = os.path.join(working_dir, 'uploads', f'user_{user_test.id}', f'dataset_{dataset.id}')
-        os.makedirs(dest_folder, exist_ok=True)
-        shutil.copy(os.path.join(src_folder, file_name), dest_folder)
-
         file_path = os.path.join(dest_folder, file_name)
+        blob = blob_store.store(os.path.join(src_folder, file_name), file_path)
 
         uvl_file = Hubfile(
             name=file_name,
             checksum=f'checksum{dataset_id}',
             size=os.path.getsize(file_path),
+            blob=blob,
             feature_model_id=feature_model.id
         )
         db.session.add(uvl_file)
@@ -102,13 +104,18 @@ def create_dataset_db(dataset_id, publication_type=PublicationType.DATA_MANAGEME
         if num_files is not None:
             for i in range(1, num_files):
                 additional_file_name = f'file{dataset_id % 12 + i}.uvl'
-                shutil.copy(os.path.join(src_folder, additional_file_name), dest_folder)
+                additional_blob = blob_store.store(
+                    os.path.join(src_folder, additional_file_name), os.path.join(dest_folder, additional_file_name)
+                )
 
                 additional_uvl_file = Hubfile(
                     name=additional_file_name,
                     checksum=f'checksum{dataset_id + i}',
                     size=os.path.getsize(file_path),
+                    blob=additional_blob,
                     feature_model_id=feature_model.id
                 )
                 db.session.add(additional_uvl_file)
             db.session.commit()
+
+        UVLFeatureIndexService().index_dataset_files(dataset)
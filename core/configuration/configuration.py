@@ -11,6 +11,15 @@ def uploads_folder_name():
     return os.getenv('UPLOADS_DIR', "uploads")
 
 
+def uploads_root():
+    return os.path.join(os.getenv('WORKING_DIR', ''), uploads_folder_name())
+
+
+def accel_redirect_location():
+    # Internal nginx location that serves the uploads folder, see docker/nginx/nginx.prod.conf
+    return os.getenv('ACCEL_REDIRECT_LOCATION')
+
+
 def get_app_version():
     version_file_path = os.path.join(os.getenv('WORKING_DIR', ''), '.version')
     try:
@@ -0,0 +1,53 @@
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import Response, abort, request, send_file
+
+from core.configuration.configuration import accel_redirect_location, uploads_root
+
+
+def send_upload(path: str, download_name: str, mimetype: str = None, etag: str = None):
+    """
+    Sends a file of the uploads folder as an attachment.
+
+    When ACCEL_REDIRECT_LOCATION is set the response has no body: nginx reads the file from that internal
+    location (X-Accel-Redirect) and handles the transfer and Range requests, so the worker is released as soon
+    as the view returns. nginx then sends its own ETag, the only one it can match against If-Range, so the
+    given etag is not used and If-None-Match is checked against nginx's ETag instead. Otherwise, or for files
+    outside the uploads folder, Flask sends the file itself with the given etag.
+    Either way If-None-Match is answered here, so callers can skip their bookkeeping on a 304.
+    """
+    if not os.path.isfile(path):
+        abort(404)
+
+    location = accel_redirect_location()
+    relative_path = os.path.relpath(os.path.abspath(path), os.path.abspath(uploads_root()))
+    if not location or relative_path.startswith(os.pardir):
+        return send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=etag or True,
+        )
+
+    etag = nginx_etag(path)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+    else:
+        # Without validators of its own: nginx adds ETag and Last-Modified from the file it sends
+        resp = Response(mimetype=mimetype or mimetypes.guess_type(download_name)[0] or "application/octet-stream")
+        resp.headers.set("Content-Disposition", "attachment", filename=download_name)
+        resp.headers["X-Accel-Redirect"] = f"{location.rstrip('/')}/{quote(relative_path.replace(os.sep, '/'))}"
+    return resp
+
+
+def nginx_etag(path: str) -> str:
+    """
+    The ETag nginx gives to a static file: its modification time and its size in hexadecimal.
+    """
+    stat = os.stat(path)
+    return f"{int(stat.st_mtime):x}-{stat.st_size:x}"
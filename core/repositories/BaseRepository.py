@@ -1,5 +1,8 @@
 from typing import Generic, List, NoReturn, Optional, TypeVar, Union
 
+from sqlalchemy import or_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
 import app
 
 T = TypeVar('T')
@@ -59,3 +62,65 @@ class BaseRepository(Generic[T]):
 
     def count(self) -> int:
         return self.model.query.count()
+
+    def existing_keys(self, rows: List[dict], columns: List[str], lock: bool = False) -> set:
+        """
+        Values of `columns` (those of a unique index) of the given rows that are already stored, as tuples.
+        With `lock` the stored rows are read FOR UPDATE: on MySQL that also keeps other transactions from
+        inserting any of those keys until this one ends, so the rows missing now are the ones it inserts.
+        """
+        if not rows:
+            return set()
+
+        query = self.session.query(*[getattr(self.model, column) for column in columns])
+        for column in columns:
+            attribute = getattr(self.model, column)
+            values = {row[column] for row in rows}
+            condition = attribute.in_(values - {None})
+            query = query.filter(or_(condition, attribute.is_(None)) if None in values else condition)
+        if lock:
+            query = query.with_for_update()
+
+        keys = {tuple(row[column] for column in columns) for row in rows}
+        return {tuple(stored) for stored in query} & keys
+
+    def upsert(self, rows: List[dict], index_elements: Optional[List[str]] = None,
+               update: Optional[List[str]] = None, commit: bool = True) -> int:
+        """
+        Inserts `rows` with a single statement. A row that collides with a unique index is left as it is,
+        or, when `update` is given, those columns are overwritten with the values of the new row. The
+        database resolves the conflict, so concurrent writers never duplicate a row nor fail on it.
+
+        `index_elements` names the columns of the unique index; it is required to update on SQLite and
+        PostgreSQL (MySQL uses any unique key). Returns the number of affected rows as the driver reports
+        them: MySQL also counts the duplicates left as they are, existing_keys tells which rows are new.
+        """
+        if not rows:
+            return 0
+
+        connection = self.session.connection(bind_arguments={'mapper': self.model})
+        dialect = connection.dialect.name
+        if dialect in ('mysql', 'mariadb'):
+            stmt = mysql.insert(self.model)
+            if update:
+                stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update})
+            else:
+                # A no-op update rather than INSERT IGNORE, which would also turn foreign key
+                # and truncation errors into warnings
+                primary_key = self.model.__table__.primary_key.columns[0].name
+                stmt = stmt.on_duplicate_key_update({primary_key: stmt.table.c[primary_key]})
+        elif dialect in ('sqlite', 'postgresql'):
+            stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(self.model)
+            if update:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=index_elements, set_={column: stmt.excluded[column] for column in update}
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+        else:
+            raise NotImplementedError(f'upsert is not supported on {dialect}')
+
+        affected = connection.execute(stmt, rows).rowcount
+        if commit:
+            self.session.commit()
+        return affected
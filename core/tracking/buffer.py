@@ -0,0 +1,188 @@
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from app import db
+from core.repositories.BaseRepository import BaseRepository
+
+logger = logging.getLogger(__name__)
+
+
+class TrackingBuffer:
+    """
+    Write-behind buffer for the view and download records. Requests only enqueue their event, which is
+    deduplicated in memory, and a background thread writes the queue with one multi-row upsert per model,
+    either every `flush_interval` seconds or as soon as `max_events` are waiting. The unique index of the
+    record tables (user, object and cookie) discards the events that are already stored, even when several
+    processes write the same one at once. A batch that cannot be written goes back to the queue, up to
+    `max_retries` times. The queue is drained when the process exits.
+
+    With TESTING the events are written straight away, so tests can see them after the request.
+    """
+
+    def __init__(self, max_events: int = 500, flush_interval: float = 5.0, max_seen: int = 100000,
+                 max_retries: int = 3):
+        self.max_events = max_events
+        self.flush_interval = flush_interval
+        self.max_seen = max_seen
+        self.max_retries = max_retries
+        self.app = None
+        self._pending = OrderedDict()
+        self._seen = OrderedDict()
+        self._retries = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def init_app(self, app):
+        if self.app is None:
+            atexit.register(self.stop)
+        self.app = app
+        app.extensions['tracking_buffer'] = self
+
+    def on_flush(self, listener):
+        """
+        Registers `listener(session, inserted, events)`, called with the records inserted per model and the
+        events of the batch per model (those already stored included) before each batch is committed, so that
+        it can update its own tables in the same transaction.
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def track(self, model, unique: tuple, **values):
+        """
+        Enqueues a `model` record with the given column values, unless one with the same values
+        in the `unique` columns has already been tracked.
+        """
+        key = (model, tuple((column, values[column]) for column in unique))
+        with self._lock:
+            if key in self._seen or key in self._pending:
+                return
+            self._pending[key] = values
+            full = len(self._pending) >= self.max_events
+
+        if current_app.config.get('TESTING'):
+            self.flush()
+            return
+
+        self._ensure_thread(current_app._get_current_object())
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Writes the pending events. Returns how many records were inserted."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, OrderedDict()
+            if not batch:
+                return 0
+
+            # Every process writes the tables and their keys in the same order, so that concurrent
+            # batches take their row locks in the same order and do not deadlock
+            groups, unique = {}, {}
+            for (model, key), values in sorted(batch.items(), key=_lock_order):
+                groups.setdefault(model, []).append(values)
+                unique[model] = [column for column, _ in key]
+
+            inserted = {}
+            try:
+                for model, rows in groups.items():
+                    # The keys already stored are locked, so the missing ones are exactly what this batch inserts.
+                    # The unique index of each record table still discards an event stored meanwhile
+                    repository = BaseRepository(model)
+                    existing = repository.existing_keys(rows, unique[model], lock=True)
+                    new_rows = [
+                        row for row in rows if tuple(row[column] for column in unique[model]) not in existing
+                    ]
+                    repository.upsert(new_rows, commit=False)
+                    if new_rows:
+                        inserted[model] = new_rows
+                for listener in self._listeners:
+                    listener(db.session, inserted, groups)
+                db.session.commit()
+            except Exception as exc:
+                db.session.rollback()
+                self._requeue(batch, exc)
+                return 0
+
+            with self._lock:
+                for key in batch:
+                    self._seen[key] = True
+                    self._retries.pop(key, None)
+                while len(self._seen) > self.max_seen:
+                    self._seen.popitem(last=False)
+            return sum(len(rows) for rows in inserted.values())
+
+    def stop(self):
+        """Stops the background thread and writes whatever is still pending."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+        if self._pending and self.app is not None:
+            with self.app.app_context():
+                self.flush()
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._seen.clear()
+            self._retries.clear()
+
+    def _requeue(self, batch: OrderedDict, exc: Exception):
+        """Puts the events of a failed batch back in front of the queue, dropping those out of retries."""
+        with self._lock:
+            retried, dropped = OrderedDict(), 0
+            for key, values in batch.items():
+                retries = self._retries.get(key, 0) + 1
+                if retries > self.max_retries:
+                    self._retries.pop(key, None)
+                    dropped += 1
+                    continue
+                self._retries[key] = retries
+                retried[key] = values
+            # Events enqueued while the batch was being written go after it
+            for key, values in self._pending.items():
+                retried.setdefault(key, values)
+            self._pending = retried
+
+        if dropped:
+            logger.error(f"{dropped} tracking events could not be stored after {self.max_retries} retries: {exc}")
+        if len(batch) > dropped:
+            logger.warning(f"{len(batch) - dropped} tracking events could not be stored, they will be retried: {exc}")
+
+    def _ensure_thread(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, args=(app,), name='tracking-buffer', daemon=True)
+            self._thread.start()
+
+    def _run(self, app):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            with app.app_context():
+                try:
+                    self.flush()
+                finally:
+                    db.session.remove()
+
+
+def _lock_order(item):
+    (model, key), _ = item
+    # None sorts first in each column, without comparing it with the values of the other rows
+    return model.__tablename__, tuple((value is not None, value) for _, value in key)
+
+
+tracking_buffer = TrackingBuffer()
@@ -0,0 +1,56 @@
+"""unique tracking records
+
+Revision ID: a81d5e30c7f9
+Revises: f3b97d20c815
+Create Date: 2026-10-18 19:10:27.503914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "a81d5e30c7f9"
+down_revision = "f3b97d20c815"
+branch_labels = None
+depends_on = None
+
+# (table, object column, cookie column, unique constraint, counter)
+RECORD_TABLES = (
+    ("ds_view_record", "dataset_id", "view_cookie", "uq_ds_view_record_key", "dataset_views"),
+    ("ds_download_record", "dataset_id", "download_cookie", "uq_ds_download_record_key", "dataset_downloads"),
+    ("file_view_record", "file_id", "view_cookie", "uq_file_view_record_key", "file_views"),
+    ("file_download_record", "file_id", "download_cookie", "uq_file_download_record_key", "file_downloads"),
+)
+
+
+def upgrade():
+    connection = op.get_bind()
+    for table, object_column, cookie_column, constraint, counter in RECORD_TABLES:
+        # Se borran los duplicados que dejaron las escrituras concurrentes, conservando el primero
+        deleted = connection.execute(sa.text(
+            f"DELETE FROM {table} WHERE {cookie_column} IS NOT NULL AND id NOT IN ("
+            f"SELECT keep FROM (SELECT MIN(id) AS keep FROM {table} WHERE {cookie_column} IS NOT NULL "
+            f"GROUP BY {object_column}, COALESCE(user_id, 0), {cookie_column}) AS keepers)"
+        )).rowcount
+        if deleted:
+            connection.execute(
+                sa.text("UPDATE counter SET value = value - :deleted WHERE name = :name"),
+                {"deleted": deleted, "name": counter},
+            )
+
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(
+                sa.Column("user_key", sa.Integer(), sa.Computed("coalesce(user_id, 0)", persisted=True))
+            )
+            batch_op.create_unique_constraint(constraint, [object_column, "user_key", cookie_column])
+
+
+def downgrade():
+    connection = op.get_bind()
+    for table, object_column, cookie_column, constraint, counter in RECORD_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            # MySQL sostiene la clave ajena del objeto con el índice único, necesita otro antes de borrarlo
+            if connection.dialect.name in ("mysql", "mariadb"):
+                batch_op.create_index(f"ix_{table}_{object_column}", [object_column])
+            batch_op.drop_constraint(constraint, type_="unique")
+            batch_op.drop_column("user_key")
@@ -0,0 +1,115 @@
+"""tag table
+
+Revision ID: b7d41f0c9e23
+Revises: a3c9e1f4b7d2
+Create Date: 2026-10-18 11:40:07.514362
+
+"""
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b7d41f0c9e23"
+down_revision = "a3c9e1f4b7d2"
+branch_labels = None
+depends_on = None
+
+
+def split_tags(tags):
+    # Same splitting and normalization as app.modules.explore.search, frozen for this migration.
+    # Returns the (key, name as entered) of each tag
+    tags_by_key = {}
+    for name in (tags or "").split(","):
+        name = name.strip()[:64]
+        key = unicodedata.normalize("NFKD", name)
+        key = "".join(char for char in key if not unicodedata.combining(char)).lower().strip()[:64]
+        if key:
+            tags_by_key.setdefault(key, name)
+    return list(tags_by_key.items())
+
+
+def upgrade():
+    tag = op.create_table(
+        "tag",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("key"),
+    )
+    op.create_table(
+        "ds_meta_data_tag",
+        sa.Column("tag_id", sa.Integer(), nullable=False),
+        sa.Column("ds_meta_data_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["ds_meta_data_id"], ["ds_meta_data.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tag_id"], ["tag.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("tag_id", "ds_meta_data_id"),
+    )
+    op.create_index(
+        op.f("ix_ds_meta_data_tag_ds_meta_data_id"), "ds_meta_data_tag", ["ds_meta_data_id"], unique=False
+    )
+    op.create_table(
+        "fm_meta_data_tag",
+        sa.Column("tag_id", sa.Integer(), nullable=False),
+        sa.Column("fm_meta_data_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["fm_meta_data_id"], ["fm_meta_data.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tag_id"], ["tag.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("tag_id", "fm_meta_data_id"),
+    )
+    op.create_index(
+        op.f("ix_fm_meta_data_tag_fm_meta_data_id"), "fm_meta_data_tag", ["fm_meta_data_id"], unique=False
+    )
+
+    # Backfill the association tables from the comma separated strings
+    connection = op.get_bind()
+    tag_ids = {}
+    for table, column in (("ds_meta_data", "ds_meta_data_id"), ("fm_meta_data", "fm_meta_data_id")):
+        rows = connection.execute(sa.text(f"SELECT id, tags FROM {table} WHERE tags IS NOT NULL")).fetchall()
+        links = []
+        for metadata_id, tags in rows:
+            for key, name in split_tags(tags):
+                if key not in tag_ids:
+                    tag_ids[key] = connection.execute(tag.insert().values(name=name, key=key)).inserted_primary_key[0]
+                links.append({"tag_id": tag_ids[key], column: metadata_id})
+        if links:
+            association = sa.table(f"{table}_tag", sa.column("tag_id"), sa.column(column))
+            connection.execute(association.insert(), links)
+
+    with op.batch_alter_table("ds_meta_data", schema=None) as batch_op:
+        batch_op.drop_column("tags")
+
+    with op.batch_alter_table("fm_meta_data", schema=None) as batch_op:
+        batch_op.drop_column("tags")
+
+
+def downgrade():
+    # The strings are rebuilt from the display names. The columns were String(120), they come back
+    # as Text so that tags added since the upgrade are not cut
+    with op.batch_alter_table("fm_meta_data", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("tags", sa.Text(), nullable=True))
+
+    with op.batch_alter_table("ds_meta_data", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("tags", sa.Text(), nullable=True))
+
+    connection = op.get_bind()
+    for table, column in (("ds_meta_data", "ds_meta_data_id"), ("fm_meta_data", "fm_meta_data_id")):
+        rows = connection.execute(sa.text(
+            f"SELECT {table}_tag.{column}, tag.name FROM {table}_tag "
+            f"JOIN tag ON tag.id = {table}_tag.tag_id ORDER BY tag.key"
+        )).fetchall()
+        tags = {}
+        for metadata_id, name in rows:
+            tags.setdefault(metadata_id, []).append(name)
+        for metadata_id, names in tags.items():
+            connection.execute(
+                sa.text(f"UPDATE {table} SET tags = :tags WHERE id = :id"),
+                {"tags": ", ".join(names), "id": metadata_id},
+            )
+
+    op.drop_index(op.f("ix_fm_meta_data_tag_fm_meta_data_id"), table_name="fm_meta_data_tag")
+    op.drop_table("fm_meta_data_tag")
+    op.drop_index(op.f("ix_ds_meta_data_tag_ds_meta_data_id"), table_name="ds_meta_data_tag")
+    op.drop_table("ds_meta_data_tag")
+    op.drop_table("tag")
@@ -19,6 +19,13 @@ from rosemary.commands.info import info, info2
 from rosemary.commands.make_module import make_module
 from rosemary.commands.env import env
 from rosemary.commands.test import test
+from rosemary.commands.search_reindex import search_reindex
+from rosemary.commands.dataset_snapshot import dataset_snapshot
+from rosemary.commands.blobs_gc import blobs_gc
+from rosemary.commands.counters_rebuild import counters_rebuild
+from rosemary.commands.stats_rollup import stats_rollup
+from rosemary.commands.sketches_rebuild import sketches_rebuild
+from rosemary.commands.scores_rebuild import scores_rebuild
 
 
 class RosemaryCLI(click.Group):
@@ -58,6 +65,13 @@ cli.add_command(locust)
 cli.add_command(stop)
 cli.add_command(selenium)
 cli.add_command(module_list)
+cli.add_command(search_reindex)
+cli.add_command(dataset_snapshot)
+cli.add_command(blobs_gc)
+cli.add_command(counters_rebuild)
+cli.add_command(stats_rollup)
+cli.add_command(sketches_rebuild)
+cli.add_command(scores_rebuild)
 
 
 if __name__ == '__main__':
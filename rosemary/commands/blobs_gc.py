@@ -0,0 +1,18 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('blobs:gc', help="Moves the uploaded files that are not in the blob store yet into it "
+                                "and removes the blobs that no file references anymore.")
+@with_appcontext
+def blobs_gc():
+    from app.modules.hubfile.services import HubfileService
+
+    try:
+        hubfile_service = HubfileService()
+        stored = hubfile_service.store_blobs()
+        click.echo(click.style(f"{stored} files moved into the blob store.", fg='green'))
+        removed, freed = hubfile_service.collect_garbage()
+        click.echo(click.style(f"{removed} unreferenced blobs removed ({freed} bytes freed).", fg='green'))
+    except Exception as e:
+        click.echo(click.style(f"Error collecting the blob store garbage: {e}", fg='red'))
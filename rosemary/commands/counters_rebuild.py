@@ -0,0 +1,16 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('counters:rebuild', help="Recomputes the counters of the homepage and the dashboard "
+                                        "from the rows they count.")
+@with_appcontext
+def counters_rebuild():
+    from app.modules.stats.services import CounterService
+
+    try:
+        counters = CounterService().rebuild()
+        for name, value in counters.items():
+            click.echo(click.style(f"{name}: {value}", fg='green'))
+    except Exception as e:
+        click.echo(click.style(f"Error rebuilding the counters: {e}", fg='red'))
@@ -0,0 +1,16 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('dataset:snapshot', help="Brings the archive with every published dataset up to date.")
+@with_appcontext
+def dataset_snapshot():
+    from app.modules.dataset.services import SnapshotService
+
+    try:
+        if SnapshotService().update():
+            click.echo(click.style("Dataset snapshot updated.", fg='green'))
+        else:
+            click.echo(click.style("Dataset snapshot already up to date.", fg='yellow'))
+    except Exception as e:
+        click.echo(click.style(f"Error updating the dataset snapshot: {e}", fg='red'))
@@ -0,0 +1,15 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('scores:rebuild', help="Recomputes the download, view, rating and trending scores the explore "
+                                      "results can be sorted by.")
+@with_appcontext
+def scores_rebuild():
+    from app.modules.stats.services import ScoreService
+
+    try:
+        datasets = ScoreService().rebuild()
+        click.echo(click.style(f"Scores rebuilt, {datasets} datasets with downloads or views.", fg='green'))
+    except Exception as e:
+        click.echo(click.style(f"Error rebuilding the scores: {e}", fg='red'))
@@ -0,0 +1,17 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('search:reindex', help="Rebuilds the explore search index from the metadata of every dataset "
+                                      "and indexes the features of the UVL files that are not indexed yet.")
+@with_appcontext
+def search_reindex():
+    from app.modules.explore.services import SearchIndexService, UVLFeatureIndexService
+
+    try:
+        indexed = SearchIndexService().reindex_all()
+        click.echo(click.style(f"Search index rebuilt for {indexed} datasets.", fg='green'))
+        indexed = UVLFeatureIndexService().index_pending()
+        click.echo(click.style(f"Features indexed for {indexed} UVL files.", fg='green'))
+    except Exception as e:
+        click.echo(click.style(f"Error rebuilding the search index: {e}", fg='red'))
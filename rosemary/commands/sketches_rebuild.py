@@ -0,0 +1,15 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('sketches:rebuild', help="Adds the view and download records still stored to the unique "
+                                        "visitor sketches. It can run more than once.")
+@with_appcontext
+def sketches_rebuild():
+    from app.modules.stats.services import SketchService
+
+    try:
+        records = SketchService().rebuild()
+        click.echo(click.style(f"{records} records added to the unique visitor sketches.", fg='green'))
+    except Exception as e:
+        click.echo(click.style(f"Error rebuilding the unique visitor sketches: {e}", fg='red'))
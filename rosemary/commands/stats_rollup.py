@@ -0,0 +1,27 @@
+import os
+
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('stats:rollup', help="Aggregates the view and download records of the complete days into daily "
+                                    "rollups and prunes the raw records older than the retention period. "
+                                    "Meant to run once a day, some minutes after midnight (UTC).")
+@click.option('--retention-days', type=int, default=lambda: int(os.getenv('TRACKING_RETENTION_DAYS', 90)),
+              show_default='TRACKING_RETENTION_DAYS or 90', help="Days of raw records to keep.")
+@click.option('--archive-dir', type=click.Path(file_okay=False), default=None,
+              help="Directory where the pruned records are written as gzipped CSV before being deleted.")
+@click.option('--no-prune', is_flag=True, help="Only roll up, keeping every raw record.")
+@with_appcontext
+def stats_rollup(retention_days, archive_dir, no_prune):
+    from app.modules.stats.services import RollupService
+
+    try:
+        rollup_service = RollupService()
+        for kind, buckets in rollup_service.rollup().items():
+            click.echo(click.style(f"{kind}: {buckets} daily buckets created.", fg='green'))
+        if not no_prune:
+            for kind, records in rollup_service.prune(retention_days, archive_dir=archive_dir).items():
+                click.echo(click.style(f"{kind}: {records} raw records pruned.", fg='green'))
+    except Exception as e:
+        click.echo(click.style(f"Error rolling up the tracking records: {e}", fg='red'))